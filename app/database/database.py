@@ -1,4 +1,4 @@
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 import os
 
@@ -11,24 +11,47 @@ MONGO_URI = os.getenv("MONGO_URI")
 if not MONGO_URI:
     raise ValueError("❌ MONGO_URI not found in .env file")
 
-# Connect to MongoDB
-client = MongoClient(MONGO_URI)
+# Connection pool configuration
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "10"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+
+# Connect to MongoDB (non-blocking driver; the client binds to the running event loop on first use)
+client = AsyncIOMotorClient(
+    MONGO_URI,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+    socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    retryWrites=True,
+)
 db = client.get_default_database()
 
 # Collections
 users_collection = db["users"]
 conversations_collection = db["conversations"]
+sessions_collection = db["conversation_sessions"]
 documents_collection = db["documents"]
 document_chunks_collection = db["document_chunks"]
 calendar_events_collection = db["calendar_events"]
+analytics_collection = db["conversation_analytics"]
+checkpoints_collection = db["job_checkpoints"]
+app_state_collection = db["app_state"]  # Small shared counters, e.g. the document corpus version
 
 # Utility function to test database connection
-def test_connection():
+async def test_connection():
     try:
-        db.command("ping")
+        await db.command("ping")
         return True
     except Exception as e:
         print(f"Database connection failed: {e}")
         print(f"Connection URI: {MONGO_URI}")
-      
+
         return False
@@ -0,0 +1,136 @@
+"""
+Index declarations for every MongoDB collection.
+
+``ensure_indexes`` is idempotent and runs at startup (disable with
+``MONGO_ENSURE_INDEXES=false``). On large existing deployments build them
+ahead of time instead with ``python -m app.database.indexes build``;
+``python -m app.database.indexes report`` lists declared indexes that are
+missing and existing ones that have not been used since the server started.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from app.database.database import db
+
+MONGO_ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "true").lower() in ("1", "true", "yes")
+
+# One entry per access path; names are stable so re-running never duplicates an index
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email"),
+    ],
+    "conversations": [
+        # Reads sort on (timestamp, _id), so _id is part of every key or Mongo sorts in memory
+        IndexModel([("user_id", ASCENDING), ("session_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)],
+                   name="user_session_timestamp_id"),
+        IndexModel([("user_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)], name="user_timestamp_id"),
+        IndexModel([("user_id", ASCENDING), ("tags", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)],
+                   name="user_tags_timestamp_id"),
+        # Full-text search, always within one user: the user_id prefix limits scoring to their
+        # conversations. A collection can only have one text index
+        IndexModel([("user_id", ASCENDING), ("message", TEXT), ("response", TEXT)], name="user_message_response_text",
+                   weights={"message": 2, "response": 1}),
+    ],
+    "conversation_sessions": [
+        IndexModel([("user_id", ASCENDING), ("session_id", ASCENDING)], name="user_session", unique=True),
+    ],
+    "documents": [
+        IndexModel([("filename", ASCENDING)], name="filename", unique=True),
+        IndexModel([("processed", ASCENDING)], name="processed"),
+    ],
+    "document_chunks": [
+        IndexModel([("doc_id", ASCENDING), ("chunk_index", ASCENDING)], name="doc_chunk_index"),
+    ],
+    "conversation_analytics": [
+        IndexModel([("type", ASCENDING), ("bucket", ASCENDING)], name="type_bucket"),
+        IndexModel([("type", ASCENDING), ("count", DESCENDING)], name="type_count"),
+    ],
+    "calendar_events": [
+        IndexModel([("event_id", ASCENDING)], name="event_id", unique=True, sparse=True),
+        IndexModel([("user_id", ASCENDING), ("start_time", ASCENDING)], name="user_start_time"),
+        # Availability looks up events overlapping a window, i.e. ending after its start
+        IndexModel([("user_id", ASCENDING), ("end_time", ASCENDING)], name="user_end_time"),
+        # ...or, for a series, whose last occurrence ends after it (the other $or branch)
+        IndexModel([("user_id", ASCENDING), ("recurrence_end", ASCENDING)], name="user_recurrence_end",
+                   partialFilterExpression={"recurrence_end": {"$exists": True}}),
+        # ICS imports skip events whose UID (and RECURRENCE-ID) the user already has
+        IndexModel([("user_id", ASCENDING), ("ical_uid", ASCENDING), ("ical_recurrence_id", ASCENDING)],
+                   name="user_ical_uid", unique=True, partialFilterExpression={"ical_uid": {"$type": "string"}}),
+    ],
+}
+
+# Indexes replaced by a declared one above; dropped once their replacement exists
+RETIRED_INDEXES: Dict[str, List[str]] = {
+    "conversations": ["user_session_timestamp", "user_timestamp", "user_tags_timestamp"],
+}
+# Retired indexes that must go before their replacement can be built (a collection has one text index)
+RETIRED_BEFORE_BUILD: Dict[str, List[str]] = {
+    "conversations": ["message_response_text"],
+}
+
+
+async def ensure_indexes(collections: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Create any missing declared indexes and drop retired ones; returns created names or the error per collection"""
+    results: Dict[str, Any] = {}
+    for name in collections or list(INDEXES):
+        try:
+            existing = [index["name"] async for index in db[name].list_indexes()]
+            for retired in RETIRED_BEFORE_BUILD.get(name, []):
+                if retired in existing:
+                    await db[name].drop_index(retired)
+                    print(f"Dropped retired index {name}.{retired}")
+            results[name] = await db[name].create_indexes(INDEXES[name])
+            existing = [index["name"] async for index in db[name].list_indexes()]
+            for retired in RETIRED_INDEXES.get(name, []):
+                if retired in existing:
+                    await db[name].drop_index(retired)
+                    print(f"Dropped retired index {name}.{retired}")
+        except Exception as e:
+            # e.g. a unique index over existing duplicates; the other collections still get theirs
+            print(f"Warning: Could not create indexes on {name}: {e}")
+            results[name] = {"error": str(e)}
+    return results
+
+
+async def index_report() -> Dict[str, Any]:
+    """Declared indexes that don't exist yet and existing indexes with no recorded use"""
+    report: Dict[str, Any] = {}
+    for name, models in INDEXES.items():
+        collection = db[name]
+        existing = [index["name"] async for index in collection.list_indexes()]
+        declared = [model.document["name"] for model in models]
+        entry: Dict[str, Any] = {
+            "missing": [index for index in declared if index not in existing],
+            "undeclared": [index for index in existing if index not in declared and index != "_id_"],
+        }
+        try:
+            # Usage counters reset when the server restarts
+            stats = await collection.aggregate([{"$indexStats": {}}]).to_list(length=None)
+            entry["unused"] = [s["name"] for s in stats if s["name"] != "_id_" and s["accesses"]["ops"] == 0]
+        except Exception as e:
+            entry["unused"] = {"error": str(e)}
+        report[name] = entry
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the application's MongoDB indexes")
+    parser.add_argument("command", choices=["build", "report"])
+    parser.add_argument("--collection", action="append", choices=list(INDEXES),
+                        help="Limit the build to this collection (repeatable)")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        results = asyncio.run(ensure_indexes(args.collection))
+    else:
+        results = asyncio.run(index_report())
+    print(json.dumps(results, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Move conversations embedded in user documents into the conversations collection.
+
+Run with ``python -m app.database.migrate_conversations``. Users are streamed
+one batch at a time, each embedded entry is upserted as its own document
+(keyed on its conversation_id, so re-running is safe) and the user's
+``conversations`` array is removed only after its entries are written.
+Entries without a usable conversation_id get an id derived from their
+timestamp and position, so an interrupted run can be repeated without
+duplicating them.
+"""
+
+import argparse
+import asyncio
+import hashlib
+from datetime import datetime
+from typing import Any, Dict, List
+
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from app.database.database import users_collection, conversations_collection
+from app.database.indexes import ensure_indexes
+
+DEFAULT_BATCH_SIZE = 500  # Conversation documents per bulk write
+
+
+def _stable_id(user_id: str, index: int, entry: Dict[str, Any]) -> ObjectId:
+    """Same id on every run: the entry's time (so _id order still follows time) plus a hash of its position"""
+    timestamp = entry.get("timestamp")
+    if not isinstance(timestamp, datetime):
+        timestamp = ObjectId(user_id).generation_time
+    digest = hashlib.md5(f"{user_id}:{index}".encode("utf-8")).digest()
+    return ObjectId(ObjectId.from_datetime(timestamp).binary[:4] + digest[:8])
+
+
+def _to_document(user_id: str, index: int, entry: Dict[str, Any]) -> Dict[str, Any]:
+    conversation_id = entry.get("conversation_id")
+    if not conversation_id or not ObjectId.is_valid(conversation_id):
+        conversation_id = str(_stable_id(user_id, index, entry))
+    return {
+        **entry,
+        "_id": ObjectId(conversation_id),
+        "conversation_id": conversation_id,
+        "user_id": user_id,
+        "tags": entry.get("tags", [])
+    }
+
+
+async def _flush(operations: List[UpdateOne], user_ids: List[ObjectId], keep_embedded: bool) -> None:
+    if operations:
+        # Raises if any upsert failed, leaving every array in the batch for the next run
+        await conversations_collection.bulk_write(operations, ordered=False)
+    # Only drop arrays whose entries are all written
+    if user_ids and not keep_embedded:
+        await users_collection.update_many({"_id": {"$in": user_ids}}, {"$unset": {"conversations": ""}})
+    operations.clear()
+    user_ids.clear()
+
+
+async def migrate_conversations(batch_size: int = DEFAULT_BATCH_SIZE, keep_embedded: bool = False) -> Dict[str, int]:
+    """Copy every embedded conversation into the conversations collection"""
+    await ensure_indexes(["conversations"])
+    stats = {"users": 0, "conversations": 0}
+    operations: List[UpdateOne] = []
+    user_ids: List[ObjectId] = []
+
+    cursor = users_collection.find(
+        {"conversations.0": {"$exists": True}},
+        {"conversations": 1}
+    ).batch_size(max(1, batch_size // 10))
+    async for user in cursor:
+        user_id = str(user["_id"])
+        for index, entry in enumerate(user["conversations"]):
+            document = _to_document(user_id, index, entry)
+            operations.append(UpdateOne({"_id": document["_id"]}, {"$setOnInsert": document}, upsert=True))
+        user_ids.append(user["_id"])
+        stats["users"] += 1
+        stats["conversations"] += len(user["conversations"])
+        if len(operations) >= batch_size:
+            await _flush(operations, user_ids, keep_embedded)
+            print(f"Migrated {stats['conversations']} conversations from {stats['users']} users")
+
+    await _flush(operations, user_ids, keep_embedded)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move embedded user conversations into the conversations collection")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Conversation documents per bulk write")
+    parser.add_argument("--keep-embedded", action="store_true", help="Leave the users' conversations arrays in place")
+    args = parser.parse_args()
+
+    stats = asyncio.run(migrate_conversations(args.batch_size, args.keep_embedded))
+    print(f"✅ Migrated {stats['conversations']} conversations from {stats['users']} users")
+
+
+if __name__ == "__main__":
+    main()
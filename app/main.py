@@ -1,14 +1,41 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
-from app.routes import chat, crm, upload, calendar, rag
+from app.routes import chat, crm, upload, calendar, rag, jobs
 from app.models.schemas import ResetRequest
-from app.database.database import users_collection
-from bson.objectid import ObjectId
+from app.database.database import conversations_collection, sessions_collection
+from app.database.indexes import ensure_indexes, MONGO_ENSURE_INDEXES
+from app.services.llm_client import close_llm_client, get_llm_stats
+from app.services.prompt_builder import load_tokenizer
+from app.utils.singleflight import get_singleflight_stats
+from app.services.chatbot import get_semantic_cache_stats, get_routing_stats, get_prompt_stats
+from app.services.crm_logic import (
+    user_cache, get_user_cache_stats, get_write_behind_stats,
+    flush_pending_writes, close_conversation_writer
+)
+from app.services.maintenance import reset_all_conversations
+from app.services.calendar_service import get_calendar_cache_stats
+from app.utils.jobs import start_job, cancel_jobs
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if MONGO_ENSURE_INDEXES:
+        try:
+            await ensure_indexes()
+        except Exception as e:
+            print(f"Warning: Could not create indexes: {e}")
+    await load_tokenizer()
+    yield
+    await cancel_jobs()
+    await close_conversation_writer()
+    await close_llm_client()
 
 
 app = FastAPI(
     title="Multi-Agentic Conversational AI",
     description="A RESTful API for conversational AI with RAG and CRM integration",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Register routes
@@ -17,31 +44,39 @@ app.include_router(upload.router, prefix="/upload_docs", tags=["Upload"])
 app.include_router(rag.router, prefix="/rag", tags=["RAG"])
 app.include_router(crm.router, prefix="/crm", tags=["CRM"])
 app.include_router(calendar.router, prefix="/calendar", tags=["Calendar"])
+app.include_router(jobs.router, prefix="/jobs", tags=["Jobs"])
 
 @app.post("/reset")
-def reset_memory(request: ResetRequest):
+async def reset_memory(request: ResetRequest):
     try:
+        # Queued inserts would otherwise land after the delete
+        await flush_pending_writes()
         if request.user_id and request.session_id:
-            users_collection.update_one(
-                {"_id": ObjectId(request.user_id)},
-                {"$pull": {"conversations": {"session_id": request.session_id}}}
-            )
+            await conversations_collection.delete_many({"user_id": request.user_id, "session_id": request.session_id})
+            await sessions_collection.delete_one({"user_id": request.user_id, "session_id": request.session_id})
+            user_cache.invalidate(request.user_id)
             return {"message": "Session reset"}
         elif request.user_id:
-            users_collection.update_one(
-                {"_id": ObjectId(request.user_id)},
-                {"$set": {"conversations": []}}
-            )
+            await conversations_collection.delete_many({"user_id": request.user_id})
+            await sessions_collection.delete_many({"user_id": request.user_id})
+            user_cache.invalidate(request.user_id)
             return {"message": "User conversations reset"}
         else:
-            users_collection.update_many({}, {"$set": {"conversations": []}})
-            return {"message": "All conversations reset"}
+            # Runs in throttled batches so it doesn't starve live traffic
+            async def reset_all(job):
+                result = await reset_all_conversations(job)
+                user_cache.invalidate()
+                return result
+
+            user_cache.invalidate()
+            job = start_job("reset_all", reset_all)
+            return {"message": "Reset of all conversations started", "job_id": job.job_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Reset error: {str(e)}")
 
 
 @app.get("/")
-def root():
+async def root():
     """Root endpoint with API information"""
     return {
         "message": "Multi-Agentic Conversational AI API",
@@ -52,19 +87,35 @@ def root():
             "rag": "/rag",
             "crm": "/crm",
             "calendar": "/calendar",
-            "reset": "/reset"
+            "reset": "/reset",
+            "jobs": "/jobs",
+            "metrics": "/metrics"
         }
     }
 
 @app.get("/health")
-def health_check():
+async def health_check():
     """Health check endpoint"""
     try:
         # Test MongoDB connection
         from app.database.database import test_connection
-        if test_connection():
+        if await test_connection():
             return {"status": "healthy", "database": "connected"}
         else:
             raise HTTPException(status_code=500, detail="Database connection failed")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Health check failed: {str(e)}")
+
+@app.get("/metrics")
+async def metrics():
+    """Runtime counters for monitoring"""
+    return {
+        "llm": get_llm_stats(),
+        "coalescing": get_singleflight_stats(),
+        "semantic_cache": get_semantic_cache_stats(),
+        "routing": get_routing_stats(),
+        "prompts": get_prompt_stats(),
+        "user_cache": get_user_cache_stats(),
+        "write_behind": get_write_behind_stats(),
+        "calendar_cache": get_calendar_cache_stats()
+    }
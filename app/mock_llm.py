@@ -0,0 +1,125 @@
+"""
+Local mock of the OpenAI chat completion and embedding endpoints.
+
+Run it with ``uvicorn app.mock_llm:app --port 8001`` and start the API with
+``LLM_BASE_URL=http://localhost:8001/v1`` to develop or load-test without
+calling (or paying for) the real upstream. ``MOCK_LLM_LATENCY_MS``,
+``MOCK_LLM_TOKEN_DELAY_MS`` and ``MOCK_LLM_FAILURE_RATE`` shape its behaviour.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+import uuid
+from typing import Any, Dict, List
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+MOCK_LLM_LATENCY_MS = int(os.getenv("MOCK_LLM_LATENCY_MS", "200"))
+MOCK_LLM_TOKEN_DELAY_MS = int(os.getenv("MOCK_LLM_TOKEN_DELAY_MS", "20"))
+MOCK_LLM_FAILURE_RATE = float(os.getenv("MOCK_LLM_FAILURE_RATE", "0"))
+EMBEDDING_DIMENSIONS = 1536
+
+app = FastAPI(title="Mock LLM", description="OpenAI-compatible mock for local development")
+
+
+def _maybe_fail() -> None:
+    if MOCK_LLM_FAILURE_RATE and random.random() < MOCK_LLM_FAILURE_RATE:
+        raise HTTPException(status_code=503, detail="Mock upstream failure")
+
+
+def _mock_answer(messages: List[Dict[str, Any]]) -> str:
+    question = messages[-1]["content"] if messages else ""
+    question = question.rsplit("Current question:", 1)[-1].strip()
+    return f"This is a mock answer to: {question[:200]}"
+
+
+def _mock_embedding(text: str) -> List[float]:
+    """Deterministic unit vector so identical texts embed identically"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0, 1) for _ in range(EMBEDDING_DIMENSIONS)]
+    norm = sum(v * v for v in vector) ** 0.5
+    return [v / norm for v in vector]
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await asyncio.sleep(MOCK_LLM_LATENCY_MS / 1000)
+    _maybe_fail()
+
+    answer = _mock_answer(body.get("messages", []))
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    model = body.get("model", "gpt-3.5-turbo")
+
+    if body.get("stream"):
+        async def events():
+            for index, word in enumerate(answer.split(" ")):
+                delta = {"content": word if index == 0 else f" {word}"}
+                if index == 0:
+                    delta["role"] = "assistant"
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(MOCK_LLM_TOKEN_DELAY_MS / 1000)
+            final = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in body.get("messages", []))
+    completion_tokens = len(answer.split())
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": answer},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    await asyncio.sleep(MOCK_LLM_LATENCY_MS / 1000)
+    _maybe_fail()
+
+    inputs = body.get("input", "")
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    return {
+        "object": "list",
+        "model": body.get("model", "text-embedding-ada-002"),
+        "data": [
+            {"object": "embedding", "index": i, "embedding": _mock_embedding(text)}
+            for i, text in enumerate(inputs)
+        ],
+        "usage": {"prompt_tokens": 0, "total_tokens": 0}
+    }
@@ -37,17 +37,21 @@ class ChatResponse(BaseModel):
     conversation_id: str
     response_time_ms: int
     context_used: Optional[List[str]] = []
+    cached: bool = False
+    route: Optional[str] = None
 
 class Conversation(BaseModel):
     conversation_id: str
     user_id: str
     session_id: str
-    messages: List[Dict[str, Any]]
-    status: ConversationStatus
-    tags: List[str]
+    messages: List[Dict[str, Any]] = []
+    status: ConversationStatus = ConversationStatus.INQUIRING
+    tags: List[str] = []
     created_at: datetime
     updated_at: datetime
     summary: Optional[str] = None
+    turn_count: int = 0  # Exchanges stored for this session
+    summarized_turns: int = 0  # Leading exchanges already folded into summary
 
 class DocumentUpload(BaseModel):
     filename: str
@@ -70,3 +74,6 @@ class CalendarEvent(BaseModel):
 class ResetRequest(BaseModel):
     user_id: Optional[str] = None  # If None, reset all memory
     session_id: Optional[str] = None
+
+class TagClassifyRequest(BaseModel):
+    messages: List[str]
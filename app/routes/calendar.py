@@ -1,37 +1,59 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
 from datetime import datetime
 from typing import List, Optional
-from app.services.calendar_service import calendar_service
+from app.services.calendar_service import calendar_service, CALENDAR_TIMEZONE
+from app.services.calendar_import import import_ics
+from app.services.crm_bulk import iter_lines
+from app.utils.availability import get_timezone
 
 router = APIRouter()
 
 @router.post("/events")
-def create_event(user_id: str, title: str, description: Optional[str] = None,
+async def create_event(user_id: str, title: str, description: Optional[str] = None,
                 start_time: Optional[datetime] = None, end_time: Optional[datetime] = None,
-                location: Optional[str] = None, attendees: Optional[List[str]] = None):
-    """Create a new calendar event"""
+                location: Optional[str] = None, attendees: Optional[List[str]] = None,
+                reject_conflicts: bool = False, recurrence: Optional[str] = None,
+                recurrence_timezone: Optional[str] = None):
+    """Create a new calendar event; pass an RRULE as recurrence for a repeating one"""
     try:
-        result = calendar_service.create_event(
+        result = await calendar_service.create_event(
             user_id=user_id,
             title=title,
             description=description,
             start_time=start_time,
             end_time=end_time,
             location=location,
-            attendees=attendees
+            attendees=attendees,
+            reject_conflicts=reject_conflicts,
+            recurrence=recurrence,
+            recurrence_timezone=recurrence_timezone
         )
         
         if "error" in result:
             raise HTTPException(status_code=400, detail=result["error"])
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create event: {str(e)}")
 
+@router.post("/import")
+async def import_calendar(request: Request, user_id: str, timezone: Optional[str] = None):
+    """Import events from a streamed iCalendar (.ics) body"""
+    try:
+        default_tz = get_timezone(timezone or CALENDAR_TIMEZONE)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        return await import_ics(iter_lines(request.stream()), user_id, default_tz)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to import calendar: {str(e)}")
+
 @router.get("/events/{user_id}")
-def get_events(user_id: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None):
+async def get_events(user_id: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None):
     """Get events for a user"""
     try:
-        events = calendar_service.get_user_events(user_id, start_date, end_date)
+        events = await calendar_service.get_user_events(user_id, start_date, end_date)
         return {
             "user_id": user_id,
             "events": events,
@@ -41,10 +63,10 @@ def get_events(user_id: str, start_date: Optional[datetime] = None, end_date: Op
         raise HTTPException(status_code=500, detail=f"Failed to get events: {str(e)}")
 
 @router.put("/events/{event_id}")
-def update_event(event_id: str, **kwargs):
+async def update_event(event_id: str, **kwargs):
     """Update an existing event"""
     try:
-        result = calendar_service.update_event(event_id, **kwargs)
+        result = await calendar_service.update_event(event_id, **kwargs)
         if "error" in result:
             raise HTTPException(status_code=400, detail=result["error"])
         return result
@@ -52,26 +74,67 @@ def update_event(event_id: str, **kwargs):
         raise HTTPException(status_code=500, detail=f"Failed to update event: {str(e)}")
 
 @router.delete("/events/{event_id}")
-def delete_event(event_id: str):
+async def delete_event(event_id: str):
     """Delete an event"""
     try:
-        result = calendar_service.delete_event(event_id)
+        result = await calendar_service.delete_event(event_id)
         if "error" in result:
             raise HTTPException(status_code=400, detail=result["error"])
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete event: {str(e)}")
 
+@router.delete("/events/{event_id}/occurrences")
+async def cancel_occurrence(event_id: str, start_time: datetime):
+    """Cancel one occurrence of a recurring event"""
+    try:
+        result = await calendar_service.cancel_occurrence(event_id, start_time)
+        if "error" in result:
+            raise HTTPException(status_code=400, detail=result["error"])
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to cancel occurrence: {str(e)}")
+
 @router.get("/suggestions/{user_id}")
-def get_meeting_suggestions(user_id: str, duration_minutes: int = 60, 
-                          preferred_days: Optional[List[str]] = None):
+async def get_meeting_suggestions(user_id: str, duration_minutes: int = 60,
+                          preferred_days: Optional[List[str]] = Query(None), timezone: Optional[str] = None,
+                          horizon_days: Optional[int] = None, slot_minutes: Optional[int] = None,
+                          limit: int = Query(5, ge=1, le=100), per_day: Optional[int] = Query(1, ge=0)):
     """Get meeting time suggestions"""
     try:
-        suggestions = calendar_service.suggest_meeting_time(user_id, duration_minutes, preferred_days)
+        suggestions = await calendar_service.suggest_meeting_time(
+            user_id, duration_minutes, preferred_days, timezone, horizon_days, slot_minutes, limit, per_day
+        )
         return {
             "user_id": user_id,
             "duration_minutes": duration_minutes,
             "suggestions": suggestions
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get suggestions: {str(e)}")
+
+@router.get("/availability")
+async def get_common_availability(user_ids: List[str] = Query(...), duration_minutes: int = 60,
+                          preferred_days: Optional[List[str]] = Query(None), timezone: Optional[str] = None,
+                          horizon_days: Optional[int] = None, slot_minutes: Optional[int] = None,
+                          limit: int = Query(5, ge=1, le=100), per_day: Optional[int] = Query(1, ge=0),
+                          min_available: Optional[int] = Query(None, ge=1)):
+    """Get meeting slots when several users are free together"""
+    try:
+        slots = await calendar_service.find_common_slots(
+            user_ids, duration_minutes, preferred_days, timezone, horizon_days, slot_minutes,
+            limit, per_day, min_available
+        )
+        return {
+            "user_ids": user_ids,
+            "duration_minutes": duration_minutes,
+            "slots": slots
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to get suggestions: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to get availability: {str(e)}")
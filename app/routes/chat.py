@@ -1,18 +1,35 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from app.models.schemas import ChatRequest, ChatResponse
-from app.services.chatbot import get_chat_response
+from app.services.chatbot import get_chat_response, stream_chat_response
 
 router = APIRouter()
 
 @router.post("/", response_model=ChatResponse)
-def chat(request: ChatRequest):
+async def chat(request: ChatRequest):
     """Enhanced chat endpoint with session management and CRM integration"""
     try:
-        response = get_chat_response(
-            user_id=request.user_id, 
+        response = await get_chat_response(
+            user_id=request.user_id,
             message=request.message,
             session_id=request.session_id
         )
         return ChatResponse(**response)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Chat error: {str(e)}")
+
+@router.post("/stream")
+async def chat_stream(request: ChatRequest):
+    """Streaming chat endpoint that emits the answer as server-sent events"""
+    return StreamingResponse(
+        stream_chat_response(
+            user_id=request.user_id,
+            message=request.message,
+            session_id=request.session_id
+        ),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
@@ -1,14 +1,27 @@
-from fastapi import APIRouter, HTTPException
-from app.models.schemas import UserCreate, UserUpdate
-from app.services.crm_logic import create_user, update_user, get_conversations, get_user, delete_user
+import json
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from app.models.schemas import UserCreate, UserUpdate, TagClassifyRequest
+from app.services.crm_logic import (
+    create_user, update_user, get_user, delete_user,
+    get_conversation_page, iter_conversations
+)
+from app.services.crm_bulk import import_users, export_users, iter_lines, iter_ndjson_rows, iter_csv_rows
+from app.services.analytics import get_analytics, backfill_analytics
+from app.services.conversation_search import search_conversations
+from app.services.retagging import retag_conversations, get_retag_checkpoint
+from app.services.tag_classifier import classify_messages, CLASSIFY_MAX_MESSAGES
+from app.utils.jobs import start_job
 
 router = APIRouter()
 
 @router.post("/create_user")
-def create(user: UserCreate):
+async def create(user: UserCreate):
     """Create a new user in the CRM system"""
     try:
-        result = create_user(user)
+        result = await create_user(user)
         if "error" in result:
             raise HTTPException(status_code=400, detail=result["error"])
         return result
@@ -16,10 +29,10 @@ def create(user: UserCreate):
         raise HTTPException(status_code=500, detail=f"Failed to create user: {str(e)}")
 
 @router.put("/update_user")
-def update(user: UserUpdate):
+async def update(user: UserUpdate):
     """Update an existing user"""
     try:
-        result = update_user(user)
+        result = await update_user(user)
         if "error" in result:
             raise HTTPException(status_code=400, detail=result["error"])
         return result
@@ -27,23 +40,102 @@ def update(user: UserUpdate):
         raise HTTPException(status_code=500, detail=f"Failed to update user: {str(e)}")
 
 @router.get("/conversations/{user_id}")
-def get_history(user_id: str):
-    """Get conversation history for a user"""
+async def get_history(user_id: str, session_id: Optional[str] = None, tag: Optional[str] = None,
+                      start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      cursor: Optional[str] = None, limit: int = 50, order: str = "asc",
+                      output_format: str = Query("json", alias="format")):
+    """Get conversation history for a user, one page at a time or as an NDJSON export"""
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+    descending = order == "desc"
+
+    if output_format == "ndjson":
+        async def lines():
+            async for conversation in iter_conversations(user_id, session_id, tag, start, end, descending):
+                yield json.dumps(conversation, default=str) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    if output_format != "json":
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'ndjson'")
+
     try:
-        conversations = get_conversations(user_id)
+        page = await get_conversation_page(user_id, session_id, tag, start, end, cursor, limit, descending)
         return {
             "user_id": user_id,
-            "conversations": conversations,
-            "total_conversations": len(conversations)
+            "conversations": page["conversations"],
+            "count": len(page["conversations"]),
+            "next_cursor": page["next_cursor"]
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get conversations: {str(e)}")
 
+@router.get("/search")
+async def search(q: str, user_id: str, tag: Optional[str] = None,
+                 start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 limit: int = 20, cursor: Optional[str] = None):
+    """Full-text search over a user's conversation messages and responses, best matches first"""
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Query must not be empty")
+    try:
+        return await search_conversations(q, user_id, tag, start, end, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
+
+@router.get("/analytics")
+async def analytics(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                    top_tags: int = 20, top_users: int = 10, user_id: Optional[str] = None):
+    """Conversation volume per day, response-time histogram and top tags/users from precomputed rollups"""
+    try:
+        return await get_analytics(start, end, top_tags, top_users, user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get analytics: {str(e)}")
+
+@router.post("/analytics/backfill")
+async def analytics_backfill():
+    """Rebuild the analytics rollups from stored conversations in the background"""
+    job = start_job("analytics_backfill", backfill_analytics)
+    return {"message": "Analytics backfill started", "job_id": job.job_id}
+
+@router.post("/conversations/retag")
+async def retag(resume: bool = False):
+    """Recompute all conversation tags with the current taxonomy in the background"""
+    try:
+        checkpoint = await get_retag_checkpoint() if resume else None
+        job = start_job("retag_conversations", lambda job: retag_conversations(job, resume), {"resume": resume})
+        return {
+            "message": "Re-tagging started",
+            "job_id": job.job_id,
+            "resumed_after": checkpoint.get("processed", 0) if checkpoint else 0
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to start re-tagging: {str(e)}")
+
+@router.post("/tags/classify")
+async def classify_tags(request: TagClassifyRequest):
+    """Tag a batch of messages with keyword and embedding-centroid tags"""
+    if not request.messages:
+        raise HTTPException(status_code=400, detail="messages must not be empty")
+    if len(request.messages) > CLASSIFY_MAX_MESSAGES:
+        raise HTTPException(status_code=400, detail=f"At most {CLASSIFY_MAX_MESSAGES} messages per request")
+    try:
+        result = await classify_messages(request.messages)
+        if "error" in result:
+            raise HTTPException(status_code=503, detail=result["error"])
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to classify messages: {str(e)}")
+
 @router.get("/user/{user_id}")
-def get_user_info(user_id: str):
+async def get_user_info(user_id: str):
     """Get user information"""
     try:
-        user = get_user(user_id)
+        user = await get_user(user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         return user
@@ -51,12 +143,39 @@ def get_user_info(user_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to get user: {str(e)}")
 
 @router.delete("/user/{user_id}")
-def delete_user_route(user_id: str):
-    """Delete a user and all associated data"""
+async def delete_user_route(user_id: str):
+    """Delete a user; their conversations, sessions and events are purged in the background"""
     try:
-        success = delete_user(user_id)
-        if not success:
+        job_id = await delete_user(user_id)
+        if not job_id:
             raise HTTPException(status_code=404, detail="User not found")
-        return {"message": "User deleted successfully"}
+        return {"message": "User deleted successfully", "job_id": job_id}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete user: {str(e)}")
+
+@router.post("/users/import")
+async def import_users_route(request: Request, input_format: str = Query("ndjson", alias="format"),
+                             dedupe_by_email: bool = False):
+    """Bulk-create users from a streamed NDJSON or CSV (header row) body"""
+    if input_format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    try:
+        lines = iter_lines(request.stream())
+        rows = iter_csv_rows(lines) if input_format == "csv" else iter_ndjson_rows(lines)
+        return await import_users(rows, dedupe_by_email)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to import users: {str(e)}")
+
+@router.get("/users/export")
+async def export_users_route(output_format: str = Query("ndjson", alias="format")):
+    """Stream all users as NDJSON or CSV"""
+    if output_format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    media_type = "text/csv" if output_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_users(output_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=users.{output_format}"}
+    )
@@ -0,0 +1,18 @@
+from fastapi import APIRouter, HTTPException
+from app.utils.jobs import get_job, list_jobs
+
+router = APIRouter()
+
+@router.get("/")
+async def get_jobs():
+    """List recent background jobs, newest first"""
+    jobs = list_jobs()
+    return {"jobs": jobs, "total": len(jobs)}
+
+@router.get("/{job_id}")
+async def get_job_status(job_id: str):
+    """Get the status and progress of a background job"""
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -3,6 +3,7 @@ from typing import List, Optional
 from app.database.database import documents_collection, document_chunks_collection
 from bson.objectid import ObjectId
 from datetime import datetime
+from app.services.rag import bump_corpus_version
 
 router = APIRouter()
 
@@ -10,7 +11,7 @@ router = APIRouter()
 async def list_documents():
     """List all uploaded documents"""
     try:
-        documents = list(documents_collection.find({}, {"_id": 0, "embedding": 0}))
+        documents = await documents_collection.find({}, {"_id": 0, "embedding": 0}).to_list(length=None)
         return {
             "documents": documents,
             "total": len(documents)
@@ -22,12 +23,12 @@ async def list_documents():
 async def get_document(doc_id: str):
     """Get document details"""
     try:
-        document = documents_collection.find_one({"_id": ObjectId(doc_id)})
+        document = await documents_collection.find_one({"_id": ObjectId(doc_id)})
         if not document:
             raise HTTPException(status_code=404, detail="Document not found")
         
         # Get chunk count for this document
-        chunk_count = document_chunks_collection.count_documents({"doc_id": doc_id})
+        chunk_count = await document_chunks_collection.count_documents({"doc_id": doc_id})
         
         document["_id"] = str(document["_id"])
         document["chunk_count"] = chunk_count
@@ -43,15 +44,16 @@ async def delete_document(doc_id: str):
     """Delete document and all its chunks"""
     try:
         # Check if document exists
-        document = documents_collection.find_one({"_id": ObjectId(doc_id)})
+        document = await documents_collection.find_one({"_id": ObjectId(doc_id)})
         if not document:
             raise HTTPException(status_code=404, detail="Document not found")
         
         # Delete all chunks for this document
-        chunks_deleted = document_chunks_collection.delete_many({"doc_id": doc_id})
+        chunks_deleted = await document_chunks_collection.delete_many({"doc_id": doc_id})
         
         # Delete the document
-        documents_collection.delete_one({"_id": ObjectId(doc_id)})
+        await documents_collection.delete_one({"_id": ObjectId(doc_id)})
+        await bump_corpus_version()
         
         return {
             "message": "Document deleted successfully",
@@ -67,7 +69,7 @@ async def get_document_chunks(doc_id: str, limit: Optional[int] = 10, offset: Op
     """Get chunks for a specific document"""
     try:
         # Check if document exists
-        document = documents_collection.find_one({"_id": ObjectId(doc_id)})
+        document = await documents_collection.find_one({"_id": ObjectId(doc_id)})
         if not document:
             raise HTTPException(status_code=404, detail="Document not found")
         
@@ -76,10 +78,10 @@ async def get_document_chunks(doc_id: str, limit: Optional[int] = 10, offset: Op
         offset_val = offset if offset is not None else 0
         
         # Get chunks
-        chunks = list(document_chunks_collection.find(
+        chunks = await document_chunks_collection.find(
             {"doc_id": doc_id},
             {"embedding": 0}  # Exclude embeddings to reduce response size
-        ).skip(offset_val).limit(limit_val).sort("chunk_index", 1))
+        ).skip(offset_val).limit(limit_val).sort("chunk_index", 1).to_list(length=None)
         
         # Convert ObjectIds to strings
         for chunk in chunks:
@@ -104,7 +106,7 @@ async def search_documents(query: str, limit: Optional[int] = 5):
         from app.services.rag import retrieve_context, get_embedding, find_similar_chunks
         
         # Get query embedding
-        query_embedding = get_embedding(query)
+        query_embedding = await get_embedding(query)
         if not query_embedding:
             raise HTTPException(status_code=500, detail="Failed to generate query embedding")
         
@@ -112,14 +114,14 @@ async def search_documents(query: str, limit: Optional[int] = 5):
         limit_val = limit if limit is not None else 5
         
         # Find similar chunks
-        similar_chunks = find_similar_chunks(query_embedding, limit=limit_val)
+        similar_chunks = await find_similar_chunks(query_embedding, limit=limit_val)
         
         # Get document details for each chunk
         results = []
         for chunk in similar_chunks:
-            doc_chunk = document_chunks_collection.find_one({"_id": ObjectId(chunk["_id"])})
+            doc_chunk = await document_chunks_collection.find_one({"_id": ObjectId(chunk["id"])})
             if doc_chunk:
-                doc = documents_collection.find_one({"_id": ObjectId(doc_chunk["doc_id"])})
+                doc = await documents_collection.find_one({"_id": ObjectId(doc_chunk["doc_id"])})
                 if doc:
                     results.append({
                         "document": {
@@ -148,15 +150,15 @@ async def search_documents(query: str, limit: Optional[int] = 5):
 async def get_rag_stats():
     """Get RAG system statistics"""
     try:
-        total_documents = documents_collection.count_documents({})
-        total_chunks = document_chunks_collection.count_documents({})
-        processed_documents = documents_collection.count_documents({"processed": True})
+        total_documents = await documents_collection.count_documents({})
+        total_chunks = await document_chunks_collection.count_documents({})
+        processed_documents = await documents_collection.count_documents({"processed": True})
         
         # Get document types distribution
         pipeline = [
             {"$group": {"_id": "$content_type", "count": {"$sum": 1}}}
         ]
-        type_distribution = list(documents_collection.aggregate(pipeline))
+        type_distribution = await documents_collection.aggregate(pipeline).to_list(length=None)
         
         return {
             "total_documents": total_documents,
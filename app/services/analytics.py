@@ -0,0 +1,186 @@
+"""
+Conversation analytics rollups.
+
+Every saved exchange increments a handful of counter documents in the
+``conversation_analytics`` collection: one per day (with a response-time
+histogram), one per tag and one per user. ``get_analytics`` then reads
+counters instead of scanning conversations, so its cost depends on the
+number of buckets requested, not on how much history exists.
+"""
+
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from bson.objectid import ObjectId
+from pymongo import DESCENDING, UpdateOne
+from app.database.database import analytics_collection, conversations_collection
+from app.database.indexes import INDEXES
+from app.utils.jobs import Job
+
+# Configuration
+ANALYTICS_ENABLED = os.getenv("ANALYTICS_ENABLED", "true").lower() in ("1", "true", "yes")
+RESPONSE_TIME_BUCKETS_MS = [100, 250, 500, 1000, 2500, 5000, 10000]  # Histogram upper bounds
+BACKFILL_BATCH_SIZE = 1000
+ANALYTICS_STAGING_COLLECTION = "conversation_analytics_rebuild"  # Backfills build here, then swap in
+
+
+def _histogram_bucket(response_time_ms: int) -> str:
+    for bound in RESPONSE_TIME_BUCKETS_MS:
+        if response_time_ms <= bound:
+            return f"le_{bound}"
+    return f"gt_{RESPONSE_TIME_BUCKETS_MS[-1]}"
+
+
+def _increments(conversation: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Counter increments per rollup document for one exchange"""
+    timestamp: datetime = conversation["timestamp"]
+    day = timestamp.strftime("%Y-%m-%d")
+    day_inc: Dict[str, Any] = {"count": 1}
+    response_time_ms = conversation.get("response_time_ms")
+    if response_time_ms is not None:
+        day_inc["response_time.count"] = 1
+        day_inc["response_time.total_ms"] = response_time_ms
+        day_inc[f"response_time.histogram.{_histogram_bucket(response_time_ms)}"] = 1
+    increments = {
+        f"day:{day}": day_inc,
+        f"user:{conversation['user_id']}": {"count": 1}
+    }
+    for tag in set(conversation.get("tags") or []):
+        increments[f"tag:{tag}"] = {"count": 1}
+    return increments
+
+
+def _operations(increments: Dict[str, Dict[str, Any]], last_at: Optional[datetime] = None) -> List[UpdateOne]:
+    operations = []
+    for rollup_id, inc in increments.items():
+        kind, bucket = rollup_id.split(":", 1)
+        update: Dict[str, Any] = {"$inc": inc, "$setOnInsert": {"type": kind, "bucket": bucket}}
+        if kind == "user" and last_at is not None:
+            update["$max"] = {"last_conversation_at": last_at}
+        operations.append(UpdateOne({"_id": rollup_id}, update, upsert=True))
+    return operations
+
+
+def rollup_operations(conversation: Dict[str, Any]) -> List[UpdateOne]:
+    """Upserts that count one saved exchange"""
+    return _operations(_increments(conversation), conversation["timestamp"])
+
+
+def tag_count_operations(deltas: Dict[str, int]) -> List[UpdateOne]:
+    """Upserts that adjust per-tag counts, e.g. after conversations are re-tagged"""
+    return _operations({f"tag:{tag}": {"count": delta} for tag, delta in deltas.items() if delta})
+
+
+async def get_analytics(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                        top_tags: int = 20, top_users: int = 10, user_id: Optional[str] = None) -> Dict[str, Any]:
+    """Daily volume and response times in [start, end], plus top tags and users overall"""
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=30)
+    days = await analytics_collection.find(
+        {"type": "day", "bucket": {"$gte": start.strftime("%Y-%m-%d"), "$lte": end.strftime("%Y-%m-%d")}},
+        {"_id": 0, "type": 0}
+    ).sort("bucket", 1).to_list(length=None)
+
+    histogram: Dict[str, int] = defaultdict(int)
+    total_ms = timed = 0
+    for day in days:
+        day["date"] = day.pop("bucket")
+        response_time = day.get("response_time", {})
+        total_ms += response_time.get("total_ms", 0)
+        timed += response_time.get("count", 0)
+        for bucket, count in response_time.get("histogram", {}).items():
+            histogram[bucket] += count
+        if response_time.get("count"):
+            response_time["avg_ms"] = round(response_time["total_ms"] / response_time["count"], 1)
+
+    tags = await analytics_collection.find({"type": "tag"}, {"_id": 0, "bucket": 1, "count": 1}).sort(
+        "count", DESCENDING).limit(top_tags).to_list(length=top_tags)
+    users = await analytics_collection.find({"type": "user"}, {"_id": 0, "type": 0}).sort(
+        "count", DESCENDING).limit(top_users).to_list(length=top_users)
+
+    result = {
+        "start": start.strftime("%Y-%m-%d"),
+        "end": end.strftime("%Y-%m-%d"),
+        "total_conversations": sum(day["count"] for day in days),
+        "daily": days,
+        "response_time": {
+            "avg_ms": round(total_ms / timed, 1) if timed else None,
+            "histogram": {
+                bucket: histogram.get(bucket, 0)
+                for bucket in [f"le_{b}" for b in RESPONSE_TIME_BUCKETS_MS] + [f"gt_{RESPONSE_TIME_BUCKETS_MS[-1]}"]
+            }
+        },
+        "top_tags": [{"tag": tag["bucket"], "count": tag["count"]} for tag in tags],
+        "top_users": [{"user_id": user.pop("bucket"), **user} for user in users]
+    }
+    if user_id:
+        user = await analytics_collection.find_one({"_id": f"user:{user_id}"}, {"_id": 0, "type": 0, "bucket": 0})
+        result["user"] = {"user_id": user_id, "count": 0, **(user or {})}
+    return result
+
+
+async def _count_conversations(collection: Any, query: Dict[str, Any], job: Optional[Job] = None) -> int:
+    """Add the increments of every matching conversation to the rollups in collection.
+
+    Conversations are streamed in batches and their increments merged in
+    memory, so each batch costs one bulk write however many exchanges it
+    holds.
+    """
+    processed = 0
+    merged: Dict[str, Dict[str, Any]] = {}
+    last_at: Dict[str, datetime] = {}
+
+    async def flush():
+        operations = []
+        for rollup_id, inc in merged.items():
+            operations.extend(_operations({rollup_id: inc}, last_at.get(rollup_id)))
+        if operations:
+            await collection.bulk_write(operations, ordered=False)
+        merged.clear()
+        last_at.clear()
+
+    cursor = conversations_collection.find(
+        query, {"user_id": 1, "tags": 1, "timestamp": 1, "response_time_ms": 1}
+    ).batch_size(BACKFILL_BATCH_SIZE)
+    async for conversation in cursor:
+        for rollup_id, inc in _increments(conversation).items():
+            totals = merged.setdefault(rollup_id, {})
+            for field, value in inc.items():
+                totals[field] = totals.get(field, 0) + value
+        user_key = f"user:{conversation['user_id']}"
+        last_at[user_key] = max(last_at.get(user_key, conversation["timestamp"]), conversation["timestamp"])
+        processed += 1
+        if processed % BACKFILL_BATCH_SIZE == 0:
+            await flush()
+            if job:
+                job.advance(BACKFILL_BATCH_SIZE)
+    await flush()
+    if job:
+        job.advance(processed % BACKFILL_BATCH_SIZE)
+    return processed
+
+
+async def backfill_analytics(job: Optional[Job] = None) -> Dict[str, int]:
+    """Rebuild every rollup from the conversations collection.
+
+    The rollups are built in a staging collection and renamed over the live
+    one, so readers keep seeing the previous counts until the new ones are
+    complete. Exchanges saved during the rebuild were counted live in the
+    collection the swap discards, so those up to the swap are counted again
+    into the new one afterwards. Only an exchange whose rollup write is in
+    flight at the moment of the swap can be counted twice or missed.
+    """
+    cutoff = ObjectId()
+    staging = analytics_collection.database[ANALYTICS_STAGING_COLLECTION]
+    await staging.drop()
+    await staging.create_indexes(INDEXES[analytics_collection.name])
+    if job:
+        job.total = await conversations_collection.count_documents({"_id": {"$lte": cutoff}})
+    processed = await _count_conversations(staging, {"_id": {"$lte": cutoff}}, job)
+
+    swapped_at = ObjectId()
+    await staging.rename(analytics_collection.name, dropTarget=True)
+    caught_up = await _count_conversations(analytics_collection, {"_id": {"$gt": cutoff, "$lte": swapped_at}})
+    return {"conversations": processed + caught_up, "saved_during_rebuild": caught_up}
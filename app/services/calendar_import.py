@@ -0,0 +1,351 @@
+"""
+Streaming iCalendar (.ics) import.
+
+The body is parsed line by line: folded lines are joined, each VEVENT is
+turned into a calendar event document as soon as its END line arrives and
+documents are inserted CALENDAR_IMPORT_BATCH_SIZE at a time, so memory stays
+bounded by one batch (plus the UIDs seen so far) however large the file.
+Times are normalised to UTC using each value's TZID; recurring events keep
+their RRULE and EXDATEs and are expanded lazily like any other series.
+Transparent events are stored but don't count as busy time.
+"""
+
+import os
+import re
+import time
+import uuid
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple, Union
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from app.database.database import calendar_events_collection
+from app.services.calendar_service import busy_cache
+from app.utils.availability import as_utc
+from app.utils.recurrence import series_end
+
+# Configuration
+CALENDAR_IMPORT_BATCH_SIZE = int(os.getenv("CALENDAR_IMPORT_BATCH_SIZE", "1000"))
+MAX_REPORTED_ERRORS = 1000  # Further failures are only counted
+MAX_REPORTED_TIMEZONES = 50
+
+# Common Windows zone names found in Outlook exports
+WINDOWS_TIMEZONES = {
+    "Eastern Standard Time": "America/New_York",
+    "Central Standard Time": "America/Chicago",
+    "Mountain Standard Time": "America/Denver",
+    "US Mountain Standard Time": "America/Phoenix",
+    "Pacific Standard Time": "America/Los_Angeles",
+    "Alaskan Standard Time": "America/Anchorage",
+    "Hawaiian Standard Time": "Pacific/Honolulu",
+    "GMT Standard Time": "Europe/London",
+    "W. Europe Standard Time": "Europe/Berlin",
+    "Romance Standard Time": "Europe/Paris",
+    "Central Europe Standard Time": "Europe/Budapest",
+    "India Standard Time": "Asia/Kolkata",
+    "China Standard Time": "Asia/Shanghai",
+    "Tokyo Standard Time": "Asia/Tokyo",
+    "AUS Eastern Standard Time": "Australia/Sydney",
+    "UTC": "UTC",
+}
+
+_PARAM_SEPARATOR = re.compile(r';(?=(?:[^"]*"[^"]*")*[^"]*$)')  # ';' outside quotes
+_DATE_TIME = re.compile(r"(\d{4})(\d{2})(\d{2})(?:T(\d{2})(\d{2})(\d{2})(Z)?)?")
+_DURATION = re.compile(r"^([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$")
+
+# A VEVENT's properties (name -> [(params, value)]), or why it couldn't be read, tagged with its 1-based index
+Component = Tuple[int, Union[Dict[str, List[Tuple[Dict[str, str], str]]], str]]
+
+
+async def iter_unfolded(lines: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Join RFC 5545 folded lines (continuations start with a space or tab)"""
+    current: Optional[str] = None
+    async for line in lines:
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def parse_property(line: str) -> Tuple[str, Dict[str, str], str]:
+    """'DTSTART;TZID="America/New_York":20250310T090000' -> (name, params, value)"""
+    colon = line.find(":")
+    if colon < 0:
+        raise ValueError(f"Malformed line: {line[:80]}")
+    if '"' in line[:colon]:
+        # A quoted parameter value may itself contain ':' or ';'
+        in_quotes = False
+        for index in range(len(line)):
+            if line[index] == '"':
+                in_quotes = not in_quotes
+            elif line[index] == ":" and not in_quotes:
+                colon = index
+                break
+        else:
+            raise ValueError(f"Malformed line: {line[:80]}")
+    head, value = line[:colon], line[colon + 1:]
+    if ";" not in head:
+        return head.upper(), {}, value
+    name, *param_parts = _PARAM_SEPARATOR.split(head) if '"' in head else head.split(";")
+    params = {}
+    for part in param_parts:
+        key, _, param_value = part.partition("=")
+        params[key.upper()] = param_value.strip('"')
+    return name.upper(), params, value
+
+
+async def iter_vevents(lines: AsyncIterator[str]) -> AsyncIterator[Component]:
+    """Properties of each VEVENT, yielded as soon as the event ends"""
+    index = 0
+    event: Optional[Dict[str, List[Tuple[Dict[str, str], str]]]] = None
+    nested = 0  # Depth of components inside the event, e.g. VALARM
+    error: Optional[str] = None
+    async for line in iter_unfolded(lines):
+        if not line.strip():
+            continue
+        try:
+            name, params, value = parse_property(line)
+        except ValueError as e:
+            if event is not None and error is None:
+                error = str(e)
+            continue
+        if name == "BEGIN":
+            if value.upper() == "VEVENT" and event is None:
+                index += 1
+                event, nested, error = {}, 0, None
+            elif event is not None:
+                nested += 1
+        elif name == "END" and event is not None:
+            if nested:
+                nested -= 1
+            elif value.upper() == "VEVENT":
+                yield index, error or event
+                event = None
+        elif event is not None and not nested:
+            event.setdefault(name, []).append((params, value))
+
+
+_timezone_cache: Dict[str, Optional[tzinfo]] = {}
+MAX_CACHED_TZIDS = 1000
+
+
+def resolve_timezone(tzid: str) -> Optional[tzinfo]:
+    """IANA zone for a TZID, trying Windows names and path-style ids; None if unknown"""
+    if tzid not in _timezone_cache:
+        candidates = [tzid, WINDOWS_TIMEZONES.get(tzid, "")]
+        parts = tzid.strip("/").split("/")
+        candidates += ["/".join(parts[i:]) for i in range(1, len(parts))]  # e.g. /mozilla.org/.../Europe/London
+        zone = None
+        for candidate in candidates:
+            try:
+                zone = ZoneInfo(candidate) if candidate else None
+            except (ZoneInfoNotFoundError, ValueError):
+                zone = None
+            if zone:
+                break
+        if len(_timezone_cache) < MAX_CACHED_TZIDS:
+            _timezone_cache[tzid] = zone
+        return zone
+    return _timezone_cache[tzid]
+
+
+def parse_ics_datetime(value: str, params: Dict[str, str], default_tz: tzinfo,
+                       unknown_timezones: Set[str]) -> Tuple[datetime, tzinfo, bool]:
+    """UTC datetime for a DATE or DATE-TIME value, the zone it was expressed in, and whether it is a date"""
+    value = value.strip()
+    tz = default_tz
+    if "TZID" in params:
+        resolved = resolve_timezone(params["TZID"])
+        if resolved is None and len(unknown_timezones) < MAX_REPORTED_TIMEZONES:
+            unknown_timezones.add(params["TZID"])
+        tz = resolved or default_tz
+    match = _DATE_TIME.fullmatch(value)
+    if not match:
+        raise ValueError(f"Invalid date-time: {value[:40]}")
+    year, month, day, hour, minute, second, utc = match.groups()
+    is_date = hour is None or params.get("VALUE") == "DATE"
+    local = datetime(int(year), int(month), int(day), *(() if is_date else (int(hour), int(minute), int(second))))
+    if utc and not is_date:
+        return local.replace(tzinfo=timezone.utc), timezone.utc, False
+    # Floating or TZID-qualified local time
+    return local.replace(tzinfo=tz).astimezone(timezone.utc), tz, is_date
+
+
+def parse_duration(value: str) -> timedelta:
+    match = _DURATION.match(value.strip())
+    if not match:
+        raise ValueError(f"Invalid DURATION: {value}")
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    duration = timedelta(weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+                         minutes=int(minutes or 0), seconds=int(seconds or 0))
+    return -duration if sign == "-" else duration
+
+
+def _text(value: str) -> str:
+    """Unescape an iCalendar TEXT value"""
+    return re.sub(r"\\([\\;,nN])", lambda m: "\n" if m.group(1) in "nN" else m.group(1), value)
+
+
+def _tz_name(tz: tzinfo) -> str:
+    return getattr(tz, "key", None) or "UTC"
+
+
+def event_document(props: Dict[str, List[Tuple[Dict[str, str], str]]], user_id: str,
+                   default_tz: tzinfo, unknown_timezones: Set[str]) -> Optional[Dict[str, Any]]:
+    """Calendar event document for a VEVENT, or None for a cancelled one; raises ValueError"""
+    def first(name: str) -> Optional[Tuple[Dict[str, str], str]]:
+        return props[name][0] if props.get(name) else None
+
+    status = first("STATUS")
+    if status and status[1].strip().upper() == "CANCELLED":
+        return None
+    dtstart = first("DTSTART")
+    if not dtstart:
+        raise ValueError("Missing DTSTART")
+    start, start_tz, all_day = parse_ics_datetime(dtstart[1], dtstart[0], default_tz, unknown_timezones)
+    if first("DTEND"):
+        end = parse_ics_datetime(first("DTEND")[1], first("DTEND")[0], default_tz, unknown_timezones)[0]
+    elif first("DURATION"):
+        end = start + parse_duration(first("DURATION")[1])
+    else:
+        end = start + (timedelta(days=1) if all_day else timedelta(0))
+    if end < start:
+        raise ValueError("DTEND is before DTSTART")
+
+    uid = (first("UID")[1].strip() or None) if first("UID") else None
+    # TRANSP:TRANSPARENT marks free time; all-day events are free unless marked OPAQUE, as in most clients
+    transp = first("TRANSP")
+    transparent = transp[1].strip().upper() == "TRANSPARENT" if transp else all_day
+    doc: Dict[str, Any] = {
+        "event_id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "title": _text(first("SUMMARY")[1]) if first("SUMMARY") else "(no title)",
+        "description": _text(first("DESCRIPTION")[1]) if first("DESCRIPTION") else None,
+        "start_time": start,
+        "end_time": end,
+        "location": _text(first("LOCATION")[1]) if first("LOCATION") else None,
+        "attendees": [re.sub(r"^mailto:", "", value.strip(), flags=re.IGNORECASE)
+                      for _, value in props.get("ATTENDEE", [])],
+        "created_at": datetime.now(timezone.utc),
+        "ical_uid": uid,
+        "ical_recurrence_id": None
+    }
+    if transparent:
+        doc["transparent"] = True
+    if first("RECURRENCE-ID"):
+        # A moved or edited occurrence: stored as its own event, and the series skips the original
+        recurrence_id = first("RECURRENCE-ID")
+        doc["ical_recurrence_id"] = parse_ics_datetime(recurrence_id[1], recurrence_id[0], default_tz,
+                                                       unknown_timezones)[0]
+    elif first("RRULE"):
+        rule = first("RRULE")[1]
+        doc["recurrence"] = rule
+        doc["recurrence_tz"] = _tz_name(start_tz)
+        doc["recurrence_end"] = series_end(rule, start, end, start_tz)
+        doc["exdates"] = [
+            parse_ics_datetime(value, params, default_tz, unknown_timezones)[0]
+            for params, values in props.get("EXDATE", []) for value in values.split(",") if value.strip()
+        ]
+    return doc
+
+
+def _dedupe_key(uid: str, recurrence_id: Optional[datetime]) -> Tuple[str, Optional[datetime]]:
+    # Stored datetimes come back naive
+    return uid, as_utc(recurrence_id).replace(tzinfo=None) if recurrence_id else None
+
+
+def _record_error(result: Dict[str, Any], event_index: int, error: str) -> None:
+    result["failed"] += 1
+    if len(result["errors"]) < MAX_REPORTED_ERRORS:
+        result["errors"].append({"event": event_index, "error": error})
+
+
+async def _insert_batch(batch: List[Tuple[int, Dict[str, Any]]], user_id: str, result: Dict[str, Any]) -> None:
+    """Insert events whose (UID, RECURRENCE-ID) isn't stored for the user yet"""
+    uids = [doc["ical_uid"] for _, doc in batch if doc["ical_uid"]]
+    if uids:
+        existing = {
+            _dedupe_key(event["ical_uid"], event.get("ical_recurrence_id"))
+            async for event in calendar_events_collection.find(
+                {"user_id": user_id, "ical_uid": {"$in": uids}}, {"_id": 0, "ical_uid": 1, "ical_recurrence_id": 1}
+            )
+        }
+        if existing:
+            keep = [(index, doc) for index, doc in batch
+                    if not doc["ical_uid"] or _dedupe_key(doc["ical_uid"], doc["ical_recurrence_id"]) not in existing]
+            result["duplicates"] += len(batch) - len(keep)
+            batch = keep
+    if not batch:
+        return
+    try:
+        inserted = await calendar_events_collection.insert_many([doc for _, doc in batch], ordered=False)
+        result["imported"] += len(inserted.inserted_ids)
+    except BulkWriteError as e:
+        result["imported"] += e.details.get("nInserted", 0)
+        for error in e.details.get("writeErrors", []):
+            if error.get("code") == 11000:
+                result["duplicates"] += 1  # Imported concurrently by another request
+            else:
+                _record_error(result, batch[error["index"]][0], error.get("errmsg", "Write failed"))
+
+
+async def import_ics(lines: AsyncIterator[str], user_id: str, default_tz: tzinfo) -> Dict[str, Any]:
+    """Import every VEVENT of an iCalendar stream into the user's calendar.
+
+    Events already imported for the user (same UID, and RECURRENCE-ID for
+    edited occurrences) are skipped, as are repeats within the file and
+    cancelled events. Floating times are read in default_tz.
+    """
+    start_time = time.time()
+    result: Dict[str, Any] = {"received": 0, "imported": 0, "duplicates": 0, "cancelled": 0, "failed": 0, "errors": []}
+    unknown_timezones: Set[str] = set()
+    seen: Set[Tuple[str, Optional[datetime]]] = set()
+    overrides: Set[Tuple[str, datetime]] = set()
+    batch: List[Tuple[int, Dict[str, Any]]] = []
+    async for index, event in iter_vevents(lines):
+        result["received"] += 1
+        if isinstance(event, str):
+            _record_error(result, index, event)
+            continue
+        try:
+            doc = event_document(event, user_id, default_tz, unknown_timezones)
+        except (ValueError, KeyError) as e:
+            _record_error(result, index, str(e))
+            continue
+        if doc is None:
+            result["cancelled"] += 1
+            continue
+        if doc["ical_uid"]:
+            key = _dedupe_key(doc["ical_uid"], doc["ical_recurrence_id"])
+            if key in seen:
+                result["duplicates"] += 1
+                continue
+            seen.add(key)
+            if doc["ical_recurrence_id"]:
+                overrides.add((doc["ical_uid"], doc["ical_recurrence_id"]))
+        batch.append((index, doc))
+        if len(batch) >= CALENDAR_IMPORT_BATCH_SIZE:
+            await _insert_batch(batch, user_id, result)
+            batch = []
+    await _insert_batch(batch, user_id, result)
+
+    # Edited occurrences replace the series' original ones, whichever came first in the file
+    operations = [
+        UpdateOne({"user_id": user_id, "ical_uid": uid, "ical_recurrence_id": None, "recurrence": {"$exists": True}},
+                  {"$addToSet": {"exdates": recurrence_id}})
+        for uid, recurrence_id in overrides
+    ]
+    for offset in range(0, len(operations), CALENDAR_IMPORT_BATCH_SIZE):
+        await calendar_events_collection.bulk_write(operations[offset:offset + CALENDAR_IMPORT_BATCH_SIZE], ordered=False)
+    busy_cache.invalidate(user_id)
+
+    elapsed = time.time() - start_time
+    result["unknown_timezones"] = sorted(unknown_timezones)
+    result["elapsed_seconds"] = round(elapsed, 3)
+    result["events_per_second"] = round(result["received"] / elapsed, 1) if elapsed > 0 else None
+    return result
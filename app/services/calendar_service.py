@@ -1,8 +1,55 @@
+import heapq
+import os
 import uuid
-from datetime import datetime, timedelta, timezone
-from typing import List, Dict, Any, Optional
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from app.database.database import calendar_events_collection
 from app.models.schemas import CalendarEvent
+from app.utils.availability import (
+    Interval, WEEKDAYS, as_utc, get_timezone, parse_clock, parse_weekdays,
+    working_windows, free_slots, slot_conflicts
+)
+from app.utils.freebusy import FreeBusyCache, day_start, days_between, mark_busy, busy_intervals, is_free
+from app.utils.recurrence import iter_occurrences, series_end
+
+# Availability settings
+CALENDAR_TIMEZONE = os.getenv("CALENDAR_TIMEZONE", "UTC")
+CALENDAR_WORKDAY_START = os.getenv("CALENDAR_WORKDAY_START", "09:00")
+CALENDAR_WORKDAY_END = os.getenv("CALENDAR_WORKDAY_END", "17:00")
+CALENDAR_SLOT_MINUTES = int(os.getenv("CALENDAR_SLOT_MINUTES", "30"))  # Granularity of suggested start times
+CALENDAR_MIN_SLOT_MINUTES = 5  # Finer steps only add near-duplicate slots; busy time has 15-minute resolution
+CALENDAR_HORIZON_DAYS = int(os.getenv("CALENDAR_HORIZON_DAYS", "14"))
+CALENDAR_MAX_HORIZON_DAYS = 365
+CALENDAR_MAX_ATTENDEES = 100  # Per common-availability request
+CALENDAR_BITMAP_MAX_DAYS = int(os.getenv("CALENDAR_BITMAP_MAX_DAYS", "50000"))  # Cached user-days
+CALENDAR_BITMAP_TTL_SECONDS = float(os.getenv("CALENDAR_BITMAP_TTL_SECONDS", "300"))
+
+busy_cache = FreeBusyCache(CALENDAR_BITMAP_MAX_DAYS, CALENDAR_BITMAP_TTL_SECONDS)
+
+# Fields needed to compute when an event, or each occurrence of a series, is busy
+BUSY_PROJECTION = {"_id": 0, "user_id": 1, "start_time": 1, "end_time": 1,
+                   "recurrence": 1, "recurrence_tz": 1, "exdates": 1}
+
+
+def overlap_query(start: datetime, end: datetime) -> Dict[str, Any]:
+    """Events blocking time in [start, end), including series with an occurrence that might.
+
+    Transparent events (imported free-time entries, e.g. most all-day events) never block.
+    """
+    return {
+        "start_time": {"$lt": end},
+        "transparent": {"$ne": True},
+        "$or": [{"end_time": {"$gt": start}}, {"recurrence_end": {"$gt": start}}]
+    }
+
+
+def event_intervals(event: Dict[str, Any], start: datetime, end: datetime) -> Iterator[Interval]:
+    """Busy (start, end) in UTC of a one-off event or of a series' occurrences within [start, end)"""
+    if event.get("recurrence"):
+        yield from iter_occurrences(event, start, end)
+    else:
+        yield (as_utc(event["start_time"]), as_utc(event["end_time"]))
+
 
 class CalendarService:
     def __init__(self):
@@ -12,15 +59,36 @@ class CalendarService:
         """Generate a unique ID"""
         return str(uuid.uuid4())
     
-    def create_event(self, user_id: str, title: str, description: Optional[str] = None,
+    async def create_event(self, user_id: str, title: str, description: Optional[str] = None,
                     start_time: Optional[datetime] = None, end_time: Optional[datetime] = None,
-                    location: Optional[str] = None, attendees: Optional[List[str]] = None) -> Dict[str, Any]:
-        """Create a new calendar event"""
+                    location: Optional[str] = None, attendees: Optional[List[str]] = None,
+                    reject_conflicts: bool = False, recurrence: Optional[str] = None,
+                    recurrence_timezone: Optional[str] = None) -> Dict[str, Any]:
+        """Create a new calendar event, optionally refusing one that overlaps another.
+
+        With an RRULE in recurrence (e.g. FREQ=WEEKLY;BYDAY=MO) a single
+        document stands for the whole series, repeating on the wall clock of
+        recurrence_timezone (default CALENDAR_TIMEZONE).
+        """
         event_id = self.generate_id()
         if not start_time:
             start_time = datetime.now(timezone.utc) + timedelta(hours=1)
         if not end_time:
             end_time = start_time + timedelta(hours=1)
+        series: Dict[str, Any] = {}
+        if recurrence:
+            try:
+                tz_name = recurrence_timezone or CALENDAR_TIMEZONE
+                series = {
+                    "recurrence": recurrence,
+                    "recurrence_tz": tz_name,
+                    "recurrence_end": series_end(recurrence, start_time, end_time, get_timezone(tz_name)),
+                    "exdates": []
+                }
+            except ValueError as e:
+                return {"error": str(e)}
+        if reject_conflicts and await self._conflicts(user_id, {"start_time": start_time, "end_time": end_time, **series}):
+            return {"error": "The event conflicts with an existing event"}
         event = {
             "event_id": event_id,
             "user_id": user_id,
@@ -30,76 +98,334 @@ class CalendarService:
             "end_time": end_time,
             "location": location,
             "attendees": attendees or [],
-            "created_at": datetime.now(timezone.utc)
+            "created_at": datetime.now(timezone.utc),
+            **series
         }
         try:
-            self.collection.insert_one(event)
+            await self.collection.insert_one(event)
+            if series:
+                busy_cache.invalidate(user_id)
+            else:
+                busy_cache.add_busy(user_id, as_utc(start_time), as_utc(end_time))
+            event.pop("_id", None)
             return {**event, "message": "Event created successfully"}
         except Exception as e:
             return {"error": f"Failed to create event: {str(e)}"}
 
-    def get_user_events(self, user_id: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    async def get_user_events(self, user_id: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Events starting in [start_date, end_date], with recurring series expanded into occurrences"""
         if not start_date:
             start_date = datetime.now(timezone.utc)
         if not end_date:
             end_date = start_date + timedelta(days=30)
         query = {
             "user_id": user_id,
-            "start_time": {"$gte": start_date, "$lte": end_date}
+            "$or": [
+                {"start_time": {"$gte": start_date, "$lte": end_date}},
+                {"recurrence_end": {"$gt": start_date}, "start_time": {"$lte": end_date}}
+            ]
         }
-        events = list(self.collection.find(query).sort("start_time", 1))
+        events = await self.collection.find(query).sort("start_time", 1).to_list(length=None)
+        one_offs, series = [], []
         for event in events:
             event["event_id"] = event.get("event_id", str(event.get("_id")))
             event["attendees"] = event.get("attendees", [])
             event.pop("_id", None)
-        return events
+            (series if event.get("recurrence") else one_offs).append(event)
+        if not series:
+            return one_offs
+        # Each series yields its occurrences in order, so merging them keeps the result sorted
+        streams = [iter(one_offs)] + [self._occurrences(event, start_date, end_date) for event in series]
+        return list(heapq.merge(*streams, key=lambda event: as_utc(event["start_time"])))
+
+    def _occurrences(self, event: Dict[str, Any], start: datetime, end: datetime) -> Iterator[Dict[str, Any]]:
+        """Occurrences of a series starting in [start, end], generated on demand"""
+        template = {key: value for key, value in event.items() if key != "recurrence_end"}
+        start = as_utc(start)
+        for occurrence_start, occurrence_end in iter_occurrences(event, start, as_utc(end) + timedelta(microseconds=1)):
+            if occurrence_start < start:
+                continue
+            yield {
+                **template,
+                "start_time": occurrence_start.replace(tzinfo=None),
+                "end_time": occurrence_end.replace(tzinfo=None),
+                "is_occurrence": True
+            }
+
+    async def _conflicts(self, user_id: str, event: Dict[str, Any]) -> bool:
+        """Whether the event, or a series' occurrences in the search horizon, overlap the user's events"""
+        start = as_utc(event["start_time"])
+        end = as_utc(event["end_time"]) if not event.get("recurrence") else max(
+            as_utc(event["end_time"]), datetime.now(timezone.utc) + timedelta(days=CALENDAR_HORIZON_DAYS))
+        bitmaps = (await self.get_busy_bitmaps([user_id], start, end))[user_id]
+        hits = [(busy_start, busy_end) for busy_start, busy_end in event_intervals(event, start, end)
+                if not is_free(bitmaps, busy_start, busy_end)]
+        return await self._overlaps_exactly(user_id, hits)
+
+    async def _overlaps_exactly(self, user_id: str, intervals: List[Interval]) -> bool:
+        """Whether one of the user's events overlaps one of the intervals at its exact times.
 
-    def update_event(self, event_id: str, **kwargs) -> Dict[str, Any]:
-        allowed_fields = ['title', 'description', 'start_time', 'end_time', 'location', 'attendees']
+        The bitmaps round events out to 15 minutes, so 10:10-10:20 looks busy
+        next to a 10:00-10:10 event; their hits are confirmed here.
+        """
+        if not intervals:
+            return False
+        window_start, window_end = min(start for start, _ in intervals), max(end for _, end in intervals)
+        cursor = self.collection.find({"user_id": user_id, **overlap_query(window_start, window_end)}, BUSY_PROJECTION)
+        async for event in cursor:
+            for busy_start, busy_end in event_intervals(event, window_start, window_end):
+                if any(busy_start < end and start < busy_end for start, end in intervals):
+                    return True
+        return False
+
+    async def update_event(self, event_id: str, **kwargs) -> Dict[str, Any]:
+        allowed_fields = ['title', 'description', 'start_time', 'end_time', 'location', 'attendees',
+                          'recurrence', 'recurrence_tz']
         update = {k: v for k, v in kwargs.items() if k in allowed_fields}
         if not update:
             return {"error": "No valid fields to update"}
-        result = self.collection.update_one({"event_id": event_id}, {"$set": update})
+        previous = await self.collection.find_one(
+            {"event_id": event_id},
+            {"_id": 0, "user_id": 1, "start_time": 1, "end_time": 1, "recurrence": 1, "recurrence_tz": 1}
+        )
+        if previous and (previous.get("recurrence") or update.get("recurrence")):
+            # The series' extent depends on its first occurrence and its rule
+            merged = {**previous, **update}
+            if not merged.get("recurrence"):
+                update["recurrence_end"] = None
+            else:
+                try:
+                    tz_name = merged.get("recurrence_tz") or CALENDAR_TIMEZONE
+                    update["recurrence_tz"] = tz_name
+                    update["recurrence_end"] = series_end(merged["recurrence"], merged["start_time"],
+                                                          merged["end_time"], get_timezone(tz_name))
+                except ValueError as e:
+                    return {"error": str(e)}
+        result = await self.collection.update_one({"event_id": event_id}, {"$set": update})
+        if previous and (previous.get("recurrence") or update.get("recurrence")):
+            busy_cache.invalidate(previous["user_id"])
+        elif previous:
+            # Drop the days the event covered before and after; others keep their bitmaps
+            start = as_utc(update.get("start_time") or previous["start_time"])
+            end = as_utc(update.get("end_time") or previous["end_time"])
+            busy_cache.invalidate(previous["user_id"], days_between(as_utc(previous["start_time"]),
+                                  as_utc(previous["end_time"])) + days_between(start, end))
         if result.modified_count > 0:
             return {"message": "Event updated successfully"}
         else:
             return {"error": "Event not found or no changes made"}
 
-    def delete_event(self, event_id: str) -> Dict[str, Any]:
-        result = self.collection.delete_one({"event_id": event_id})
-        if result.deleted_count > 0:
+    async def cancel_occurrence(self, event_id: str, occurrence_start: datetime) -> Dict[str, Any]:
+        """Remove one occurrence from a recurring series"""
+        event = await self.collection.find_one({"event_id": event_id}, BUSY_PROJECTION)
+        if not event:
+            return {"error": "Event not found"}
+        if not event.get("recurrence"):
+            return {"error": "Event is not recurring"}
+        occurrence_start = as_utc(occurrence_start)
+        matches = iter_occurrences(event, occurrence_start, occurrence_start + timedelta(microseconds=1))
+        if not any(start == occurrence_start for start, _ in matches):
+            return {"error": "No occurrence of the event starts at that time"}
+        await self.collection.update_one({"event_id": event_id}, {"$addToSet": {"exdates": occurrence_start}})
+        busy_cache.invalidate(event["user_id"], days_between(occurrence_start, occurrence_start + (
+            as_utc(event["end_time"]) - as_utc(event["start_time"]))))
+        return {"message": "Occurrence cancelled"}
+
+    async def delete_event(self, event_id: str) -> Dict[str, Any]:
+        event = await self.collection.find_one_and_delete({"event_id": event_id}, projection=BUSY_PROJECTION)
+        if event:
+            if event.get("recurrence"):
+                busy_cache.invalidate(event["user_id"])
+            else:
+                busy_cache.invalidate(event["user_id"], days_between(as_utc(event["start_time"]), as_utc(event["end_time"])))
             return {"message": "Event deleted successfully"}
         else:
             return {"error": "Event not found"}
 
-    def suggest_meeting_time(self, user_id: str, duration_minutes: int = 60, 
-                           preferred_days: Optional[List[str]] = None) -> List[Dict[str, Any]]:
-        if not preferred_days:
-            preferred_days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday']
-        end_date = datetime.now(timezone.utc) + timedelta(days=14)
-        existing_events = self.get_user_events(user_id, datetime.now(timezone.utc), end_date)
-        suggestions = []
-        current_time = datetime.now(timezone.utc)
-        for i in range(10):
-            suggestion_time = current_time + timedelta(days=i+1, hours=9)
-            day_name = suggestion_time.strftime('%A').lower()
-            if day_name in preferred_days:
-                end_time = suggestion_time + timedelta(minutes=duration_minutes)
-                conflicts = False
-                for event in existing_events:
-                    event_start = event['start_time']
-                    event_end = event['end_time']
-                    if (suggestion_time < event_end and end_time > event_start):
-                        conflicts = True
-                        break
-                if not conflicts:
-                    suggestions.append({
-                        "start_time": suggestion_time.isoformat(),
-                        "end_time": end_time.isoformat(),
-                        "day": suggestion_time.strftime('%A'),
-                        "time": suggestion_time.strftime('%I:%M %p')
-                    })
-        return suggestions[:5]
+    async def get_busy_bitmaps(self, user_ids: List[str], start: datetime,
+                               end: datetime) -> Dict[str, Dict[date, int]]:
+        """Free/busy bitmap per user and UTC day in [start, end); uncached days come from one query"""
+        days = days_between(as_utc(start), as_utc(end))
+        bitmaps: Dict[str, Dict[date, int]] = {user_id: {} for user_id in user_ids}
+        loading: Dict[str, Dict[date, int]] = {}
+        for user_id in user_ids:
+            for day in days:
+                bitmap = busy_cache.get(user_id, day)
+                if bitmap is None:
+                    loading.setdefault(user_id, {})[day] = 0
+                else:
+                    bitmaps[user_id][day] = bitmap
+        if not loading:
+            return bitmaps
+
+        missing_days = [day for user_days in loading.values() for day in user_days]
+        first, last = min(missing_days), max(missing_days)
+        for user_id in loading:
+            busy_cache.begin_load(user_id)
+        window_start, window_end = day_start(first), day_start(last) + timedelta(days=1)
+        valid: Dict[str, bool] = {}
+        try:
+            cursor = self.collection.find(
+                {"user_id": {"$in": list(loading)}, **overlap_query(window_start, window_end)},
+                BUSY_PROJECTION
+            )
+            async for event in cursor:
+                for busy_start, busy_end in event_intervals(event, window_start, window_end):
+                    mark_busy(loading[event["user_id"]], busy_start, busy_end)
+        finally:
+            valid = {user_id: busy_cache.end_load(user_id) for user_id in loading}
+        for user_id, loaded in loading.items():
+            bitmaps[user_id].update(loaded)
+            if valid[user_id]:
+                for day, bitmap in loaded.items():
+                    busy_cache.put(user_id, day, bitmap)
+        return bitmaps
+
+    async def is_user_free(self, user_id: str, start: datetime, end: datetime) -> bool:
+        """Whether no event of the user overlaps [start, end); bitmap hits are checked against exact times"""
+        start, end = as_utc(start), as_utc(end)
+        if is_free((await self.get_busy_bitmaps([user_id], start, end))[user_id], start, end):
+            return True
+        return not await self._overlaps_exactly(user_id, [(start, end)])
+
+    async def get_busy_intervals(self, user_id: str, start: datetime, end: datetime) -> List[Interval]:
+        """Merged busy time in UTC over the days of [start, end), rounded out to 15 minutes"""
+        return busy_intervals((await self.get_busy_bitmaps([user_id], start, end))[user_id])
+
+    def _search_options(self, duration_minutes: int, preferred_days: Optional[List[str]],
+                        timezone_name: Optional[str], horizon_days: Optional[int],
+                        slot_minutes: Optional[int]) -> Dict[str, Any]:
+        """Validated search window; raises ValueError for invalid arguments"""
+        if duration_minutes <= 0:
+            raise ValueError("duration_minutes must be positive")
+        tz = get_timezone(timezone_name or CALENDAR_TIMEZONE)
+        weekdays = parse_weekdays(preferred_days or WEEKDAYS[:5])
+        horizon_days = min(horizon_days or CALENDAR_HORIZON_DAYS, CALENDAR_MAX_HORIZON_DAYS)
+        start = datetime.now(timezone.utc)
+        end = start + timedelta(days=horizon_days)
+        return {
+            "tz": tz,
+            "start": start,
+            "end": end,
+            "duration": timedelta(minutes=duration_minutes),
+            "granularity": timedelta(minutes=max(CALENDAR_MIN_SLOT_MINUTES, slot_minutes or CALENDAR_SLOT_MINUTES)),
+            "windows": working_windows(start, end, tz, parse_clock(CALENDAR_WORKDAY_START),
+                                       parse_clock(CALENDAR_WORKDAY_END), weekdays)
+        }
+
+    def _format_slot(self, slot_start: datetime, slot_end: datetime, tz: Any) -> Dict[str, Any]:
+        local_start = slot_start.astimezone(tz)
+        return {
+            "start_time": slot_start.isoformat(),
+            "end_time": slot_end.isoformat(),
+            "day": local_start.strftime('%A'),
+            "time": local_start.strftime('%I:%M %p'),
+            "timezone": str(tz)
+        }
+
+    def _cap_per_day(self, slots: Any, tz: Any, limit: int, per_day: Optional[int]) -> List[Any]:
+        """First limit slots (tuples starting with the slot start), at most per_day per local day"""
+        picked = []
+        per_day_counts: Dict[Any, int] = {}
+        for slot in slots:
+            day = slot[0].astimezone(tz).date()
+            if per_day and per_day_counts.get(day, 0) >= per_day:
+                continue
+            per_day_counts[day] = per_day_counts.get(day, 0) + 1
+            picked.append(slot)
+            if len(picked) >= limit:
+                break
+        return picked
+
+    def _rank_partial(self, slots: Iterator[Tuple[datetime, datetime, List[str]]], max_unavailable: int,
+                      tz: Any, limit: int, per_day: Optional[int]) -> List[Any]:
+        """Slots with at most max_unavailable busy attendees, fewest first, then by time.
+
+        Slots arrive in time order and are bucketed by how many attendees
+        are busy, so no sort is needed. Only slots _cap_per_day could still
+        pick are kept: the first per_day of a bucket on each day (or the
+        first limit of a bucket without a per-day cap). The sweep stops once
+        the everyone-free bucket alone fills the page.
+        """
+        buckets: List[List[Any]] = [[] for _ in range(max_unavailable + 1)]
+        kept_per_day: Dict[Tuple[int, date], int] = {}
+        for slot in slots:
+            unavailable = len(slot[2])
+            if unavailable > max_unavailable:
+                continue
+            bucket = buckets[unavailable]
+            if per_day:
+                key = (unavailable, slot[0].astimezone(tz).date())
+                if kept_per_day.get(key, 0) >= per_day:
+                    continue
+                kept_per_day[key] = kept_per_day.get(key, 0) + 1
+            elif len(bucket) >= limit:
+                continue
+            bucket.append(slot)
+            if unavailable == 0 and len(bucket) >= limit:
+                break
+        return [slot for bucket in buckets for slot in bucket]
+
+    async def suggest_meeting_time(self, user_id: str, duration_minutes: int = 60,
+                           preferred_days: Optional[List[str]] = None, timezone_name: Optional[str] = None,
+                           horizon_days: Optional[int] = None, slot_minutes: Optional[int] = None,
+                           limit: int = 5, per_day: Optional[int] = 1) -> List[Dict[str, Any]]:
+        """Earliest free slots within working hours, at most per_day per local day.
+
+        Raises ValueError for invalid arguments.
+        """
+        options = self._search_options(duration_minutes, preferred_days, timezone_name, horizon_days, slot_minutes)
+        busy = await self.get_busy_intervals(user_id, options["start"], options["end"])
+        slots = free_slots(busy, options["windows"], options["start"], options["end"],
+                           options["duration"], options["granularity"])
+        return [self._format_slot(slot_start, slot_end, options["tz"])
+                for slot_start, slot_end in self._cap_per_day(slots, options["tz"], limit, per_day)]
+
+    async def find_common_slots(self, user_ids: List[str], duration_minutes: int = 60,
+                                preferred_days: Optional[List[str]] = None, timezone_name: Optional[str] = None,
+                                horizon_days: Optional[int] = None, slot_minutes: Optional[int] = None,
+                                limit: int = 5, per_day: Optional[int] = 1,
+                                min_available: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Slots when the attendees are free together, best first.
+
+        With min_available below the number of attendees, slots where only
+        some can attend are included too; they rank by how many can attend,
+        then by time. Raises ValueError for invalid arguments.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        if not user_ids:
+            raise ValueError("At least one user_id is required")
+        if len(user_ids) > CALENDAR_MAX_ATTENDEES:
+            raise ValueError(f"At most {CALENDAR_MAX_ATTENDEES} attendees per request")
+        min_available = len(user_ids) if min_available is None else max(1, min(min_available, len(user_ids)))
+        options = self._search_options(duration_minutes, preferred_days, timezone_name, horizon_days, slot_minutes)
+        bitmaps = await self.get_busy_bitmaps(user_ids, options["start"], options["end"])
+        slot_args = (options["windows"], options["start"], options["end"], options["duration"], options["granularity"])
+
+        if min_available == len(user_ids):
+            # Common free time is the complement of everyone's busy time: OR the day bitmaps
+            union: Dict[date, int] = {}
+            for days in bitmaps.values():
+                for day, bitmap in days.items():
+                    union[day] = union.get(day, 0) | bitmap
+            ranked = ((slot_start, slot_end, []) for slot_start, slot_end in free_slots(busy_intervals(union), *slot_args))
+        else:
+            busy_by_user = {user_id: busy_intervals(days) for user_id, days in bitmaps.items()}
+            ranked = self._rank_partial(slot_conflicts(busy_by_user, *slot_args), len(user_ids) - min_available,
+                                        options["tz"], limit, per_day)
+
+        results = []
+        for slot_start, slot_end, busy_users in self._cap_per_day(ranked, options["tz"], limit, per_day):
+            unavailable = set(busy_users)
+            results.append({
+                **self._format_slot(slot_start, slot_end, options["tz"]),
+                "available": [user_id for user_id in user_ids if user_id not in unavailable],
+                "unavailable": busy_users
+            })
+        return results
+
+def get_calendar_cache_stats() -> Dict[str, Any]:
+    return busy_cache.stats()
 
 # Global calendar service instance
 calendar_service = CalendarService() 
\ No newline at end of file
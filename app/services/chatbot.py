@@ -1,26 +1,189 @@
 import time
 import uuid
-from typing import List, Dict, Any, Optional
-from app.services.rag import retrieve_context
-from app.services.crm_logic import save_conversation, get_conversation_history_for_context, get_user
-from openai import OpenAI
+import asyncio
+import json
 import os
-from dotenv import load_dotenv
-from openai.types.chat import ChatCompletionMessageParam
-from app.utils.tagging import extract_tags_from_response
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
+from app.services.rag import retrieve_with_embedding, cosine_similarity, get_corpus_version
+from app.services.crm_logic import save_conversation, get_user_context
+from app.services.summarizer import get_history_context, record_turn
+from app.services.prompt_builder import build_prompt, PROMPT_TOKEN_BUDGET
+from app.services.tag_classifier import centroid_tags, merge_tags
+from app.utils.tagging import extract_tags_from_response, classify_intent, estimate_complexity
+from app.services.llm_client import chat_completion, stream_chat_completion, LatencyTracker
 
 
-load_dotenv()
-openai_api_key = os.getenv("OPENAI_API_KEY")
+# Chat completion settings
+CHAT_MODEL = "gpt-3.5-turbo"
+CHAT_TEMPERATURE = 0.7
+CHAT_MAX_TOKENS = 1000
+
+# Intent routing: trivial turns are answered from templates, the rest go to
+# a smaller or larger model depending on estimated complexity
+CHAT_MODEL_SMALL = os.getenv("CHAT_MODEL_SMALL", CHAT_MODEL)
+CHAT_MODEL_LARGE = os.getenv("CHAT_MODEL_LARGE", CHAT_MODEL)
+INTENT_TEMPLATES = {
+    "greeting": "Hello! How can I help you today?",
+    "thanks": "You're welcome! Is there anything else I can help you with?",
+    "goodbye": "Goodbye! Feel free to reach out anytime if you have more questions."
+}
+
+# Semantic answer cache settings
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+
+
+class SemanticCache:
+    """Bounded LRU cache of answers to knowledge-base questions.
+
+    An entry is (user id, query embedding, retrieved chunk ids, answer). A
+    new query hits when the same user retrieves exactly the same chunks and
+    its embedding is at least ``threshold`` cosine-similar to a cached
+    query, so paraphrases of the same FAQ reuse one LLM answer. Answers are
+    personalized by the user's profile and history, so they are never
+    shared between users. Everything is dropped when the document corpus
+    version changes.
+    """
+
+    def __init__(self, threshold: float, max_entries: int):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._by_key: Dict[Tuple[str, Tuple[str, ...]], List[int]] = {}
+        self._next_id = 0
+        self._corpus_version: Optional[int] = None
+        self.lookups = 0
+        self.hits = 0
+        self.invalidations = 0
+        self.latency_saved_ms = 0
+
+    def check_corpus(self, version: int) -> None:
+        """Drop every entry if the corpus changed since they were stored"""
+        if version != self._corpus_version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._by_key.clear()
+            self._corpus_version = version
+
+    def lookup(self, user_id: str, query_embedding: List[float], chunk_ids: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+        self.lookups += 1
+        best, best_similarity = None, self.threshold
+        for entry_id in self._by_key.get((user_id, chunk_ids), []):
+            entry = self._entries[entry_id]
+            similarity = cosine_similarity(query_embedding, entry["embedding"])
+            if similarity >= best_similarity:
+                best, best_similarity = entry_id, similarity
+        if best is None:
+            return None
+        self._entries.move_to_end(best)
+        entry = self._entries[best]
+        self.hits += 1
+        self.latency_saved_ms += entry["llm_ms"]
+        return entry
+
+    def store(self, user_id: str, query_embedding: List[float], chunk_ids: Tuple[str, ...], answer: str,
+              llm_ms: int) -> None:
+        key = (user_id, chunk_ids)
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = {
+            "key": key,
+            "embedding": query_embedding,
+            "answer": answer,
+            "llm_ms": llm_ms
+        }
+        self._by_key.setdefault(key, []).append(entry_id)
+        while len(self._entries) > self.max_entries:
+            evicted_id, evicted = self._entries.popitem(last=False)
+            siblings = self._by_key[evicted["key"]]
+            siblings.remove(evicted_id)
+            if not siblings:
+                del self._by_key[evicted["key"]]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": SEMANTIC_CACHE_ENABLED,
+            "entries": len(self._entries),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "latency_saved_ms": self.latency_saved_ms,
+            "invalidations": self.invalidations
+        }
+
+
+semantic_cache = SemanticCache(SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES)
+
+
+def get_semantic_cache_stats() -> Dict[str, Any]:
+    return semantic_cache.stats()
+
+
+_route_latency: Dict[str, LatencyTracker] = {}
+_first_token_latency = LatencyTracker()  # Streamed turns only
+_prompt_totals: Dict[str, int] = {}  # Summed prompt_stats of every LLM-bound turn
+_prompt_count = 0
+
+
+def route_message(message: str) -> Tuple[str, Optional[str]]:
+    """Pick a route for a message: ("template:<intent>", None) or ("small"|"large", model)"""
+    intent = classify_intent(message)
+    if intent in INTENT_TEMPLATES:
+        return f"template:{intent}", None
+    if estimate_complexity(message) == "complex":
+        return "large", CHAT_MODEL_LARGE
+    return "small", CHAT_MODEL_SMALL
+
+
+def _record_route(route: str, seconds: float) -> None:
+    _route_latency.setdefault(route, LatencyTracker()).record(seconds)
+
+
+def _latency_summary(tracker: LatencyTracker) -> Dict[str, Any]:
+    return {
+        "samples": len(tracker.samples),
+        "p50_ms": round((tracker.percentile(50) or 0) * 1000, 1),
+        "p95_ms": round((tracker.percentile(95) or 0) * 1000, 1)
+    }
+
+
+def get_routing_stats() -> Dict[str, Any]:
+    """Configured models, per-route request latency and streamed time to first token over the recent window"""
+    return {
+        "models": {"small": CHAT_MODEL_SMALL, "large": CHAT_MODEL_LARGE},
+        "routes": {route: _latency_summary(tracker) for route, tracker in _route_latency.items()},
+        "stream_time_to_first_token": _latency_summary(_first_token_latency)
+    }
+
+
+def _record_prompt(prompt_stats: Dict[str, int]) -> None:
+    global _prompt_count
+    _prompt_count += 1
+    for field, value in prompt_stats.items():
+        if field != "budget":
+            _prompt_totals[field] = _prompt_totals.get(field, 0) + value
+
+
+def get_prompt_stats() -> Dict[str, Any]:
+    """Prompts built so far and their average size per part"""
+    return {
+        "prompts": _prompt_count,
+        "budget": PROMPT_TOKEN_BUDGET,
+        "avg": {field: round(total / _prompt_count, 1) for field, total in _prompt_totals.items()}
+    }
+
+
+_TEMPLATE_PREPARED: Dict[str, Any] = {
+    "messages": None,
+    "context_used": [],
+    "user_info": None,
+    "query_embedding": None,
+    "chunk_ids": ()
+}
 
-# Initialize OpenAI client only if API key is available
-client = None
-if openai_api_key:
-    try:
-        client = OpenAI(api_key=openai_api_key)
-    except Exception as e:
-        print(f"Warning: Could not initialize OpenAI client: {e}")
-        client = None
 
 def generate_session_id() -> str:
     """Generate a unique session ID"""
@@ -28,29 +191,23 @@ def generate_session_id() -> str:
 
 
 
-def get_chat_response(user_id: str, message: str, session_id: Optional[str] = None) -> Dict[str, Any]:
-    """Enhanced chat response with CRM integration and conversation memory"""
-    start_time = time.time()
-    
-    # Generate session ID if not provided
-    if not session_id:
-        session_id = generate_session_id()
-    
-    # Get user information for personalization
-    user_info = get_user(user_id)
+async def _prepare_chat(user_id: str, session_id: str, message: str) -> Dict[str, Any]:
+    """Gather user profile, RAG context and history and build the LLM messages"""
+    # Get user information, RAG-relevant chunks (Step 1) and conversation
+    # history (Step 2) concurrently; none of them depend on each other
+    # The profile comes from the per-user cache; it is warm after the first turn
+    (user_info, _), (query_embedding, rag_chunks), (summary, conversation_history) = await asyncio.gather(
+        get_user_context(user_id),
+        retrieve_with_embedding(message),
+        get_history_context(user_id, session_id)
+    )
     user_context = ""
     if user_info:
         user_context = f"User: {user_info['name']} from {user_info['company'] or 'Unknown Company'}. "
         if user_info['preferences']:
             user_context += f"Preferences: {', '.join(user_info['preferences'])}. "
     
-    # Step 1: Get RAG-relevant context
-    rag_context = retrieve_context(message)
-    
-    # Step 2: Get conversation history for context
-    conversation_history = get_conversation_history_for_context(user_id)
-    
-    # Step 3: Create comprehensive prompt
+    # Step 3: Create comprehensive prompt within the token budget
     system_prompt = f"""You are a helpful AI assistant with access to a knowledge base and conversation history. 
 {user_context}
 
@@ -63,50 +220,106 @@ Your responses should be:
 If you find relevant information in the knowledge base, use it to provide more accurate answers.
 If the user asks about something not in the knowledge base, provide a general helpful response."""
 
-    # Build the conversation context
-    context_parts = []
+    messages, context_used, prompt_stats = build_prompt(system_prompt, message, rag_chunks, conversation_history, summary)
+    _record_prompt(prompt_stats)
     
-    if rag_context:
-        context_parts.append(f"Relevant Knowledge Base Information:\n{rag_context}")
+    return {
+        "messages": messages,
+        "context_used": context_used,
+        "user_info": user_info,
+        "query_embedding": query_embedding,
+        "chunk_ids": tuple(chunk["id"] for chunk in rag_chunks)
+    }
+
+
+async def _lookup_cached_answer(user_id: str, prepared: Dict[str, Any]) -> Optional[str]:
+    """Cached answer for a knowledge-base question, if the user asked a close paraphrase"""
+    if not SEMANTIC_CACHE_ENABLED or not prepared["query_embedding"] or not prepared["chunk_ids"]:
+        return None
+    try:
+        semantic_cache.check_corpus(await get_corpus_version())
+        entry = semantic_cache.lookup(user_id, prepared["query_embedding"], prepared["chunk_ids"])
+    except Exception as e:
+        print(f"Error looking up cached answer: {e}")
+        return None
+    return entry["answer"] if entry else None
+
+
+async def _store_cached_answer(user_id: str, prepared: Dict[str, Any], answer: str, llm_ms: int) -> None:
+    """Remember an answer for later paraphrases; never fails the chat turn"""
+    if not SEMANTIC_CACHE_ENABLED or not prepared["query_embedding"] or not prepared["chunk_ids"] or not answer:
+        return
+    try:
+        semantic_cache.check_corpus(await get_corpus_version())
+        semantic_cache.store(user_id, prepared["query_embedding"], prepared["chunk_ids"], answer, llm_ms)
+    except Exception as e:
+        print(f"Error caching answer: {e}")
+
+
+async def _finalize_chat(user_id: str, session_id: str, message: str, answer: str,
+                         response_time_ms: Optional[int] = None,
+                         query_embedding: Optional[List[float]] = None) -> Tuple[List[str], str]:
+    """Tag the answer and store the exchange in the CRM"""
+    # Step 5: Extract tags from response, plus paraphrase tags from the
+    # message embedding RAG already computed (when centroid tagging is on)
+    paraphrase_tags = await centroid_tags(query_embedding)
+    tags = merge_tags(extract_tags_from_response(answer), paraphrase_tags)
     
-    if conversation_history:
-        context_parts.append(f"Recent Conversation History:\n{conversation_history}")
+    # Step 6: Store conversation in CRM
+    conversation_id = await save_conversation(user_id, session_id, message, answer, tags, response_time_ms,
+                                              centroid_tags=paraphrase_tags)
     
-    context_text = "\n\n".join(context_parts) if context_parts else ""
+    # Keep the session's rolling summary up to date (refreshed in the background)
+    try:
+        await record_turn(user_id, session_id)
+    except Exception as e:
+        print(f"Error recording conversation turn: {e}")
+    return tags, conversation_id
+
+
+async def get_chat_response(user_id: str, message: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+    """Enhanced chat response with CRM integration and conversation memory"""
+    start_time = time.time()
     
-    # Create messages for OpenAI
-    messages: list[ChatCompletionMessageParam] = [
-        {"role": "system", "content": system_prompt}
-    ]
+    # Generate session ID if not provided
+    if not session_id:
+        session_id = generate_session_id()
     
-    if context_text:
-        messages.append({"role": "user", "content": f"Context:\n{context_text}\n\nCurrent question: {message}"})
+    # Trivial turns skip retrieval, history and the LLM entirely
+    route, model = route_message(message)
+    if model is None:
+        prepared = _TEMPLATE_PREPARED
+        answer = INTENT_TEMPLATES[route.split(":", 1)[1]]
     else:
-        messages.append({"role": "user", "content": message})
-    
-    # Step 4: Call LLM (OpenAI)
-    try:
-        if client is None:
-            raise RuntimeError("OpenAI client is not initialized. Check your API key.")
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=1000
-        )
-        answer = response.choices[0].message.content
-    except Exception as e:
-        answer = f"I apologize, but I encountered an error: {str(e)}. Please try again."
+        prepared = await _prepare_chat(user_id, session_id, message)
+        # Step 4: Call LLM (OpenAI), unless a paraphrase was already answered
+        answer = await _lookup_cached_answer(user_id, prepared)
+    user_info = prepared["user_info"]
+    cached = model is not None and answer is not None
+    if answer is None:
+        llm_start = time.time()
+        try:
+            # Never coalesced: each turn is a personalized, independently sampled answer
+            response = await chat_completion(
+                model=model,
+                messages=prepared["messages"],
+                temperature=CHAT_TEMPERATURE,
+                max_tokens=CHAT_MAX_TOKENS
+            )
+            answer = response.choices[0].message.content
+        except Exception as e:
+            answer = f"I apologize, but I encountered an error: {str(e)}. Please try again."
+        else:
+            await _store_cached_answer(user_id, prepared, answer or "", int((time.time() - llm_start) * 1000))
     
-    # Step 5: Extract tags from response
     safe_answer = answer or ""
-    tags = extract_tags_from_response(safe_answer)
-    
-    # Step 6: Store conversation in CRM
-    conversation_id = save_conversation(user_id, session_id, message, safe_answer, tags)
+    answer_ms = int((time.time() - start_time) * 1000)
+    tags, conversation_id = await _finalize_chat(user_id, session_id, message, safe_answer, answer_ms,
+                                                 prepared["query_embedding"])
     
     # Step 7: Calculate response time
     response_time_ms = int((time.time() - start_time) * 1000)
+    _record_route(route, response_time_ms / 1000)
     
     # Step 8: Return enhanced response
     return {
@@ -115,9 +328,106 @@ If the user asks about something not in the knowledge base, provide a general he
         "session_id": session_id,
         "conversation_id": conversation_id,
         "response_time_ms": response_time_ms,
-        "context_used": [rag_context] if rag_context else [],
+        "context_used": prepared["context_used"],
+        "cached": cached,
+        "route": route,
         "user_info": {
             "name": user_info.get('name') if user_info else None,
             "company": user_info.get('company') if user_info else None
         }
     }
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Encode a payload as a single server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_chat_response(user_id: str, message: str, session_id: Optional[str] = None) -> AsyncIterator[str]:
+    """Streaming variant of get_chat_response that yields server-sent events.
+
+    Events are emitted in order: ``metadata`` (session_id, context_used),
+    one ``token`` per streamed completion delta, then ``done`` with tags,
+    conversation_id and timings once the exchange has been stored. The
+    response headers are already sent when work starts, so failures are
+    reported as an ``error`` event that ends the stream.
+    """
+    start_time = time.time()
+    
+    if not session_id:
+        session_id = generate_session_id()
+    
+    route, model = route_message(message)
+    if model is None:
+        prepared = _TEMPLATE_PREPARED
+        ready_answer = INTENT_TEMPLATES[route.split(":", 1)[1]]
+    else:
+        try:
+            prepared = await _prepare_chat(user_id, session_id, message)
+            ready_answer = await _lookup_cached_answer(user_id, prepared)
+        except Exception as e:
+            yield format_sse("error", {"detail": f"Chat error: {str(e)}"})
+            return
+    yield format_sse("metadata", {
+        "session_id": session_id,
+        "context_used": prepared["context_used"],
+        "route": route
+    })
+    
+    # Step 4: Stream LLM tokens (OpenAI); a template or cached answer goes out as one token
+    answer_parts: List[str] = []
+    time_to_first_token_ms: Optional[int] = None
+    if ready_answer is not None:
+        time_to_first_token_ms = int((time.time() - start_time) * 1000)
+        answer_parts.append(ready_answer)
+        yield format_sse("token", {"content": ready_answer})
+    else:
+        llm_start = time.time()
+        try:
+            stream = await stream_chat_completion(
+                model=model,
+                messages=prepared["messages"],
+                temperature=CHAT_TEMPERATURE,
+                max_tokens=CHAT_MAX_TOKENS
+            )
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                if time_to_first_token_ms is None:
+                    time_to_first_token_ms = int((time.time() - start_time) * 1000)
+                answer_parts.append(delta)
+                yield format_sse("token", {"content": delta})
+        except Exception as e:
+            error_message = f"I apologize, but I encountered an error: {str(e)}. Please try again."
+            if time_to_first_token_ms is None:
+                time_to_first_token_ms = int((time.time() - start_time) * 1000)
+            answer_parts.append(error_message)
+            yield format_sse("error", {"detail": error_message})
+        else:
+            await _store_cached_answer(user_id, prepared, "".join(answer_parts), int((time.time() - llm_start) * 1000))
+    
+    safe_answer = "".join(answer_parts)
+    answer_ms = int((time.time() - start_time) * 1000)
+    try:
+        tags, conversation_id = await _finalize_chat(user_id, session_id, message, safe_answer, answer_ms,
+                                                     prepared["query_embedding"])
+    except Exception as e:
+        yield format_sse("error", {"detail": f"Failed to save conversation: {str(e)}"})
+        return
+    response_time_ms = int((time.time() - start_time) * 1000)
+    _record_route(route, response_time_ms / 1000)
+    if time_to_first_token_ms is not None:
+        _first_token_latency.record(time_to_first_token_ms / 1000)
+    
+    yield format_sse("done", {
+        "tags": tags,
+        "session_id": session_id,
+        "conversation_id": conversation_id,
+        "response_time_ms": response_time_ms,
+        "time_to_first_token_ms": time_to_first_token_ms,
+        "cached": model is not None and ready_answer is not None,
+        "route": route
+    })
@@ -0,0 +1,110 @@
+import base64
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson.objectid import ObjectId
+from app.database.database import conversations_collection
+
+# Configuration
+SEARCH_MAX_LIMIT = 100
+SNIPPET_RADIUS = 80  # Characters kept on each side of the first match
+
+
+def _snippet(text: str, terms: List[str]) -> Optional[str]:
+    """Text around the first occurrence of any term, or None if none occurs"""
+    if not terms:
+        return None
+    match = re.search("|".join(re.escape(term) for term in terms), text, re.IGNORECASE)
+    if not match:
+        return None
+    start = max(0, match.start() - SNIPPET_RADIUS)
+    end = min(len(text), match.end() + SNIPPET_RADIUS)
+    return ("…" if start > 0 else "") + text[start:end].strip() + ("…" if end < len(text) else "")
+
+
+def encode_search_cursor(hit: Dict[str, Any]) -> str:
+    """Opaque keyset cursor for the position just after a search hit"""
+    raw = f"{hit['score']!r}|{hit['timestamp'].isoformat()}|{hit['_id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_search_cursor(cursor: str) -> Tuple[float, datetime, ObjectId]:
+    """Inverse of encode_search_cursor; raises ValueError on a malformed cursor"""
+    try:
+        score, timestamp, conversation_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return float(score), datetime.fromisoformat(timestamp), ObjectId(conversation_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+async def search_conversations(query: str, user_id: str, tag: Optional[str] = None,
+                               start: Optional[datetime] = None, end: Optional[datetime] = None,
+                               limit: int = 20, after: Optional[str] = None) -> Dict[str, Any]:
+    """Rank one user's conversations by relevance to query using the conversations text index.
+
+    Supports MongoDB $text syntax: "quoted phrases" must match exactly and
+    -term excludes. Each hit carries a snippet around the first matching term.
+    The text index is prefixed by user_id, so only that user's matches are
+    scored; pages follow a keyset cursor on (score, timestamp, _id) instead
+    of skipping. Raises ValueError for a missing user_id or a bad cursor.
+    """
+    if not user_id:
+        raise ValueError("user_id is required")
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    filters: Dict[str, Any] = {"user_id": user_id, "$text": {"$search": query}}
+    if tag:
+        filters["tags"] = tag
+    if start or end:
+        filters["timestamp"] = {}
+        if start:
+            filters["timestamp"]["$gte"] = start
+        if end:
+            filters["timestamp"]["$lt"] = end
+
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": filters},
+        {"$addFields": {"score": {"$meta": "textScore"}}}
+    ]
+    if after:
+        # Strictly past the cursor in (score, timestamp, _id) descending order
+        score, timestamp, oid = decode_search_cursor(after)
+        pipeline.append({"$match": {"$or": [
+            {"score": {"$lt": score}},
+            {"score": score, "timestamp": {"$lt": timestamp}},
+            {"score": score, "timestamp": timestamp, "_id": {"$lt": oid}}
+        ]}})
+    # Fetch one extra hit to learn whether another page exists
+    pipeline += [
+        {"$sort": {"score": -1, "timestamp": -1, "_id": -1}},
+        {"$limit": limit + 1}
+    ]
+    hits = await conversations_collection.aggregate(pipeline).to_list(length=limit + 1)
+
+    # Terms for the snippet: phrase words and plain words, minus exclusions
+    terms = [term.strip('"') for term in re.findall(r'"[^"]+"|\S+', query) if not term.startswith("-")]
+    terms = sorted({term for term in terms if len(term) > 1}, key=len, reverse=True)
+    results = []
+    for hit in hits[:limit]:
+        field, snippet = "message", _snippet(hit["message"], terms)
+        if snippet is None:
+            field, snippet = "response", _snippet(hit["response"], terms)
+        results.append({
+            "conversation_id": hit["conversation_id"],
+            "user_id": hit["user_id"],
+            "session_id": hit["session_id"],
+            "timestamp": hit["timestamp"],
+            "tags": hit.get("tags", []),
+            "score": round(hit["score"], 4),
+            "matched_field": field if snippet else None,
+            # Stemmed matches may not appear verbatim; fall back to the message head
+            "snippet": snippet or hit["message"][:2 * SNIPPET_RADIUS]
+        })
+    has_more = len(hits) > limit
+    return {
+        "query": query,
+        "results": results,
+        "limit": limit,
+        "has_more": has_more,
+        "next_cursor": encode_search_cursor(hits[limit - 1]) if has_more else None
+    }
@@ -0,0 +1,167 @@
+import codecs
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Tuple, Union
+
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+from app.database.database import users_collection
+from app.models.schemas import UserCreate
+
+# Configuration
+USER_IMPORT_CHUNK_SIZE = int(os.getenv("USER_IMPORT_CHUNK_SIZE", "1000"))  # Rows validated and inserted per batch
+MAX_REPORTED_ERRORS = 1000  # Further failures are only counted
+EXPORT_BATCH_SIZE = 1000
+CSV_FIELDS = ["name", "email", "company", "preferences", "phone", "role"]
+EXPORT_FIELDS = ["user_id"] + CSV_FIELDS + ["created_at"]
+PREFERENCE_SEPARATOR = ";"
+
+# A parsed row, or the reason it couldn't be parsed, tagged with its 1-based row number
+Row = Tuple[int, Union[Dict[str, Any], str]]
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a streamed UTF-8 body into lines without buffering all of it"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+async def iter_ndjson_rows(lines: AsyncIterator[str]) -> AsyncIterator[Row]:
+    row_number = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield row_number, f"Invalid JSON: {e}"
+            continue
+        yield row_number, row if isinstance(row, dict) else "Expected a JSON object"
+
+
+async def iter_csv_rows(lines: AsyncIterator[str]) -> AsyncIterator[Row]:
+    """Parse CSV with a header row; quoted fields may span lines"""
+    header: List[str] = []
+    record = ""
+    row_number = 0
+    async for line in lines:
+        record = f"{record}\n{line}" if record else line
+        # An odd number of quotes means a quoted field continues on the next line
+        if record.count('"') % 2:
+            continue
+        values, record = next(csv.reader([record]), []), ""
+        if not values or not any(value.strip() for value in values):
+            continue
+        if not header:
+            header = [value.strip().lower() for value in values]
+            continue
+        row_number += 1
+        row = {key: value.strip() for key, value in zip(header, values) if value.strip()}
+        if "preferences" in row:
+            row["preferences"] = [p.strip() for p in row["preferences"].split(PREFERENCE_SEPARATOR) if p.strip()]
+        yield row_number, row
+    if record:
+        row_number += 1
+        yield row_number, "Unterminated quoted field"
+
+
+def _record_error(result: Dict[str, Any], row_number: int, error: str) -> None:
+    result["failed"] += 1
+    if len(result["errors"]) < MAX_REPORTED_ERRORS:
+        result["errors"].append({"row": row_number, "error": error})
+
+
+async def _insert_chunk(chunk: List[Tuple[int, Dict[str, Any]]], result: Dict[str, Any], dedupe_by_email: bool) -> None:
+    if dedupe_by_email:
+        emails = [doc["email"] for _, doc in chunk]
+        existing = {user["email"] async for user in users_collection.find({"email": {"$in": emails}}, {"email": 1})}
+        if existing:
+            result["duplicates"] += sum(1 for _, doc in chunk if doc["email"] in existing)
+            chunk = [(row_number, doc) for row_number, doc in chunk if doc["email"] not in existing]
+    if not chunk:
+        return
+    try:
+        inserted = await users_collection.insert_many([doc for _, doc in chunk], ordered=False)
+        result["inserted"] += len(inserted.inserted_ids)
+    except BulkWriteError as e:
+        result["inserted"] += e.details.get("nInserted", 0)
+        for error in e.details.get("writeErrors", []):
+            _record_error(result, chunk[error["index"]][0], error.get("errmsg", "Write failed"))
+
+
+async def import_users(rows: AsyncIterator[Row], dedupe_by_email: bool = False) -> Dict[str, Any]:
+    """Validate rows with UserCreate and insert them in unordered batches.
+
+    Memory is bounded by USER_IMPORT_CHUNK_SIZE rows (plus the emails seen so
+    far when deduplicating). Invalid rows are reported by row number and
+    don't stop the import.
+    """
+    result: Dict[str, Any] = {"received": 0, "inserted": 0, "duplicates": 0, "failed": 0, "errors": []}
+    chunk: List[Tuple[int, Dict[str, Any]]] = []
+    seen_emails = set()
+    async for row_number, row in rows:
+        result["received"] += 1
+        if isinstance(row, str):
+            _record_error(result, row_number, row)
+            continue
+        try:
+            user = UserCreate(**row)
+        except ValidationError as e:
+            _record_error(result, row_number, "; ".join(
+                f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in e.errors()
+            ))
+            continue
+        doc = user.dict()
+        doc["created_at"] = datetime.utcnow()
+        if dedupe_by_email:
+            if doc["email"] in seen_emails:
+                result["duplicates"] += 1
+                continue
+            seen_emails.add(doc["email"])
+        chunk.append((row_number, doc))
+        if len(chunk) >= USER_IMPORT_CHUNK_SIZE:
+            await _insert_chunk(chunk, result, dedupe_by_email)
+            chunk = []
+    await _insert_chunk(chunk, result, dedupe_by_email)
+    return result
+
+
+def _export_record(user: Dict[str, Any]) -> Dict[str, Any]:
+    user["user_id"] = str(user.pop("_id"))
+    if isinstance(user.get("created_at"), datetime):
+        user["created_at"] = user["created_at"].isoformat()
+    return user
+
+
+async def export_users(fmt: str = "ndjson") -> AsyncIterator[str]:
+    """Stream every user as NDJSON lines or CSV rows, one cursor batch at a time"""
+    cursor = users_collection.find({}, {"conversations": 0}).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE)
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        async for user in cursor:
+            record = _export_record(user)
+            record["preferences"] = PREFERENCE_SEPARATOR.join(record.get("preferences") or [])
+            writer.writerow(record)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        # Header only, for an empty collection
+        if buffer.getvalue():
+            yield buffer.getvalue()
+    else:
+        async for user in cursor:
+            yield json.dumps(_export_record(user), default=str) + "\n"
@@ -1,62 +1,395 @@
+import base64
+import os
+import time
+from collections import OrderedDict
 from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
 from bson.objectid import ObjectId
 from app.models.schemas import UserCreate, UserUpdate
-from app.database.database import users_collection
+from pymongo import ASCENDING, DESCENDING, InsertOne
+from app.database.database import users_collection, conversations_collection, analytics_collection
+from app.utils.singleflight import SingleFlight
+from app.services.write_behind import WriteBehindQueue
+from app.services.maintenance import purge_user_data
+from app.services.analytics import ANALYTICS_ENABLED, rollup_operations
+from app.services.calendar_service import busy_cache
+from app.utils.jobs import start_job
 
-def create_user(user: UserCreate):
+# Conversation documents are returned in the shape of the old embedded entries
+CONVERSATION_PROJECTION = {"_id": 0, "user_id": 0}
+CONVERSATION_PAGE_MAX = 200
+EXPORT_BATCH_SIZE = 500
+
+# Write-behind for conversation inserts (off by default)
+CONVERSATION_WRITE_BEHIND = os.getenv("CONVERSATION_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+WRITE_BEHIND_FLUSH_MS = int(os.getenv("WRITE_BEHIND_FLUSH_MS", "100"))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "10000"))
+
+conversation_writer = WriteBehindQueue(
+    "conversations",
+    conversations_collection,
+    flush_interval_ms=WRITE_BEHIND_FLUSH_MS,
+    batch_size=WRITE_BEHIND_BATCH_SIZE,
+    max_queue_size=WRITE_BEHIND_MAX_QUEUE
+)
+analytics_writer = WriteBehindQueue(
+    "conversation_analytics",
+    analytics_collection,
+    flush_interval_ms=WRITE_BEHIND_FLUSH_MS,
+    batch_size=WRITE_BEHIND_BATCH_SIZE,
+    max_queue_size=WRITE_BEHIND_MAX_QUEUE,
+    idempotent=False  # Rollups are $inc counters
+)
+
+# Per-user profile + recent history cache
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "1000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "300"))  # Bounds staleness from other workers
+USER_CACHE_HISTORY = 5  # Recent exchanges kept per cached user
+
+
+class UserContextCache:
+    """Bounded LRU cache of (profile, recent exchanges) per user.
+
+    Writes made through this module update or invalidate the entry, so a
+    worker always sees its own writes; the TTL bounds how long a change made
+    by another worker can go unseen. A load that raced with a write for the
+    same user is returned to its callers but not cached.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Optional[Dict[str, Any]], list]]" = OrderedDict()
+        self._loads: Dict[str, bool] = {}  # In-flight loads -> still valid to cache
+        self.lookups = 0
+        self.hits = 0
+        self.invalidations = 0
+
+    def begin_load(self, user_id: str) -> None:
+        self._loads[user_id] = True
+
+    def end_load(self, user_id: str) -> bool:
+        """Finish a load; True if no write for the user happened while it ran"""
+        return self._loads.pop(user_id, False)
+
+    def get(self, user_id: str) -> Optional[Tuple[Optional[Dict[str, Any]], list]]:
+        self.lookups += 1
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.ttl_seconds:
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[1], entry[2]
+
+    def put(self, user_id: str, user: Optional[Dict[str, Any]], recent: list) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[user_id] = (time.monotonic(), user, recent)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def append_conversation(self, user_id: str, conversation: Dict[str, Any]) -> None:
+        """Write-through for a newly saved exchange"""
+        if user_id in self._loads:
+            self._loads[user_id] = False
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            recent = (entry[2] + [conversation])[-USER_CACHE_HISTORY:]
+            self._entries[user_id] = (entry[0], entry[1], recent)
+
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        """Drop one user's entry, or every entry when user_id is None"""
+        self.invalidations += 1
+        if user_id is None:
+            self._entries.clear()
+            self._loads = {key: False for key in self._loads}
+            return
+        self._entries.pop(user_id, None)
+        if user_id in self._loads:
+            self._loads[user_id] = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "invalidations": self.invalidations
+        }
+
+
+user_cache = UserContextCache(USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL_SECONDS)
+_user_context_flight = SingleFlight("user_context", copy_result=None)  # get_user_context copies
+
+async def create_user(user: UserCreate):
     user_dict = user.dict()
-    user_dict["conversations"] = []
     user_dict["created_at"] = datetime.utcnow()
-    user_id = users_collection.insert_one(user_dict).inserted_id
-    return {"user_id": str(user_id)}
+    result = await users_collection.insert_one(user_dict)
+    return {"user_id": str(result.inserted_id)}
 
-def update_user(user: UserUpdate):
-    users_collection.update_one({"_id": ObjectId(user.user_id)}, {"$set": user.dict(exclude={"user_id"})})
+async def update_user(user: UserUpdate):
+    await users_collection.update_one({"_id": ObjectId(user.user_id)}, {"$set": user.dict(exclude={"user_id"})})
+    user_cache.invalidate(user.user_id)
     return {"message": "User updated"}
 
-def delete_user(user_id: str) -> bool:
-    """Delete a user and all their associated data"""
+async def delete_user(user_id: str) -> Optional[str]:
+    """Delete a user; their data in other collections is purged by a background job.
+
+    Returns the purge job's id, or None if the user doesn't exist.
+    """
     try:
-        result = users_collection.delete_one({"_id": ObjectId(user_id)})
-        return result.deleted_count > 0
+        result = await users_collection.delete_one({"_id": ObjectId(user_id)})
+        user_cache.invalidate(user_id)
+        if result.deleted_count == 0:
+            return None
+        # Queued inserts would otherwise land after the purge
+        await flush_pending_writes()
+
+        async def purge(job):
+            result = await purge_user_data(user_id, job)
+            user_cache.invalidate(user_id)
+            busy_cache.invalidate(user_id)
+            return result
+
+        return start_job("delete_user", purge, {"user_id": user_id}).job_id
     except Exception as e:
         print(f"Error deleting user: {e}")
-        return False
+        return None
+
 
+async def save_conversation(user_id: str, session_id: str, message: str, response: str, tags: list[str],
+                            response_time_ms: Optional[int] = None,
+                            centroid_tags: Optional[list[str]] = None) -> str:
+    """Store one exchange as its own document in the conversations collection.
 
-def save_conversation(user_id: str, session_id: str, message: str, response: str, tags: list[str]) -> str:
-    conversation_id = str(ObjectId())
+    With CONVERSATION_WRITE_BEHIND the insert is queued and written in bulk
+    shortly after; the id is generated here either way. centroid_tags (the
+    embedding classifier's share of tags) are kept separately so re-tagging,
+    which only sees the text, can merge them back in.
+    """
+    conversation_oid = ObjectId()
+    conversation_id = str(conversation_oid)
     entry = {
+        "_id": conversation_oid,
         "conversation_id": conversation_id,
+        "user_id": user_id,
         "session_id": session_id,
         "message": message,
         "response": response,
         "tags": tags,
+        "response_time_ms": response_time_ms,
         "timestamp": datetime.utcnow()
     }
-    users_collection.update_one(
-        {"_id": ObjectId(user_id)},
-        {"$push": {"conversations": entry}}
-    )
+    if centroid_tags:
+        entry["centroid_tags"] = centroid_tags
+    if CONVERSATION_WRITE_BEHIND:
+        await conversation_writer.enqueue(InsertOne(entry))
+    else:
+        await conversations_collection.insert_one(entry)
+    if ANALYTICS_ENABLED:
+        await _record_rollups(entry)
+    user_cache.append_conversation(user_id, {k: v for k, v in entry.items() if k not in CONVERSATION_PROJECTION})
     return conversation_id
 
 
-def get_conversations(user_id: str):
-    user = users_collection.find_one({"_id": ObjectId(user_id)}, {"conversations": 1})
-    return user.get("conversations", []) if user else []
+async def _record_rollups(entry: Dict[str, Any]) -> None:
+    """Count the exchange in the analytics rollups; never fails the save"""
+    try:
+        operations = rollup_operations(entry)
+        if CONVERSATION_WRITE_BEHIND:
+            for operation in operations:
+                await analytics_writer.enqueue(operation)
+        else:
+            await analytics_collection.bulk_write(operations, ordered=False)
+    except Exception as e:
+        print(f"Error updating conversation analytics: {e}")
 
 
-def get_user(user_id: str):
-    user = users_collection.find_one({"_id": ObjectId(user_id)})
+async def get_conversations(user_id: str):
+    cursor = conversations_collection.find({"user_id": user_id}, CONVERSATION_PROJECTION).sort(
+        [("timestamp", ASCENDING), ("_id", ASCENDING)]
+    )
+    return await cursor.to_list(length=None)
+
+
+def encode_conversation_cursor(conversation: Dict[str, Any]) -> str:
+    """Opaque keyset cursor for the position just after a conversation"""
+    raw = f"{conversation['timestamp'].isoformat()}|{conversation['conversation_id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_conversation_cursor(cursor: str) -> tuple[datetime, ObjectId]:
+    """Inverse of encode_conversation_cursor; raises ValueError on a malformed cursor"""
+    try:
+        timestamp, conversation_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(timestamp), ObjectId(conversation_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _conversation_query(user_id: str, session_id: Optional[str] = None, tag: Optional[str] = None,
+                        start: Optional[datetime] = None, end: Optional[datetime] = None,
+                        after: Optional[str] = None, descending: bool = False) -> Dict[str, Any]:
+    query: Dict[str, Any] = {"user_id": user_id}
+    if session_id:
+        query["session_id"] = session_id
+    if tag:
+        query["tags"] = tag
+    if start or end:
+        query["timestamp"] = {}
+        if start:
+            query["timestamp"]["$gte"] = start
+        if end:
+            query["timestamp"]["$lt"] = end
+    if after:
+        # Keyset condition: strictly past (timestamp, _id) of the cursor. The
+        # plain timestamp bound lets the index scan start at the cursor, so a
+        # deep page reads no more index entries than the first one
+        timestamp, oid = decode_conversation_cursor(after)
+        op = "$lt" if descending else "$gt"
+        bounds = query.setdefault("timestamp", {})
+        if descending:
+            bounds["$lte"] = timestamp
+        else:
+            bounds["$gte"] = max(bounds.get("$gte", timestamp), timestamp)
+        query["$or"] = [
+            {"timestamp": {op: timestamp}},
+            {"timestamp": timestamp, "_id": {op: oid}}
+        ]
+    return query
+
+
+async def get_conversation_page(user_id: str, session_id: Optional[str] = None, tag: Optional[str] = None,
+                                start: Optional[datetime] = None, end: Optional[datetime] = None,
+                                cursor: Optional[str] = None, limit: int = 50,
+                                descending: bool = False) -> Dict[str, Any]:
+    """One page of a user's conversations plus the cursor for the next page (None at the end)"""
+    limit = max(1, min(limit, CONVERSATION_PAGE_MAX))
+    direction = DESCENDING if descending else ASCENDING
+    query = _conversation_query(user_id, session_id, tag, start, end, cursor, descending)
+    # Fetch one extra row to learn whether another page exists
+    conversations = await conversations_collection.find(query, CONVERSATION_PROJECTION).sort(
+        [("timestamp", direction), ("_id", direction)]
+    ).limit(limit + 1).to_list(length=limit + 1)
+    has_more = len(conversations) > limit
+    conversations = conversations[:limit]
+    return {
+        "conversations": conversations,
+        "next_cursor": encode_conversation_cursor(conversations[-1]) if has_more else None
+    }
+
+
+async def iter_conversations(user_id: str, session_id: Optional[str] = None, tag: Optional[str] = None,
+                             start: Optional[datetime] = None, end: Optional[datetime] = None,
+                             descending: bool = False) -> AsyncIterator[Dict[str, Any]]:
+    """Stream a user's matching conversations without holding them all in memory"""
+    direction = DESCENDING if descending else ASCENDING
+    query = _conversation_query(user_id, session_id, tag, start, end, descending=descending)
+    cursor = conversations_collection.find(query, CONVERSATION_PROJECTION).sort(
+        [("timestamp", direction), ("_id", direction)]
+    ).batch_size(EXPORT_BATCH_SIZE)
+    async for conversation in cursor:
+        yield conversation
+
+
+async def get_user(user_id: str):
+    user = await users_collection.find_one({"_id": ObjectId(user_id)}, {"conversations": 0})
     if user:
         user["user_id"] = str(user["_id"])
         user.pop("_id", None)
         return user
     return None
 
-def get_conversation_history_for_context(user_id: str, limit: int = 5) -> str:
-    user = users_collection.find_one({"_id": ObjectId(user_id)}, {"conversations": 1})
-    if not user or "conversations" not in user:
-        return ""
-    history = user["conversations"][-limit:]
+async def _load_user_context(user_id: str) -> Tuple[Optional[Dict[str, Any]], list]:
+    """Profile and last USER_CACHE_HISTORY exchanges in one round trip"""
+    pipeline = [
+        {"$match": {"_id": ObjectId(user_id)}},
+        {"$project": {"conversations": 0}},
+        {"$lookup": {
+            "from": conversations_collection.name,
+            "pipeline": [
+                {"$match": {"user_id": user_id}},
+                {"$sort": {"timestamp": -1, "_id": -1}},
+                {"$limit": USER_CACHE_HISTORY},
+                {"$project": CONVERSATION_PROJECTION}
+            ],
+            "as": "recent_conversations"
+        }}
+    ]
+    users = await users_collection.aggregate(pipeline).to_list(length=1)
+    if not users:
+        # Conversations can be saved for ids without a profile
+        return None, await get_recent_conversations(user_id, USER_CACHE_HISTORY)
+    user = users[0]
+    recent = user.pop("recent_conversations")
+    recent.reverse()
+    user["user_id"] = str(user.pop("_id"))
+    return user, recent
+
+async def get_user_context(user_id: str) -> Tuple[Optional[Dict[str, Any]], list]:
+    """Cached (profile, recent exchanges oldest first) for building chat prompts"""
+    async def load():
+        user_cache.begin_load(user_id)
+        try:
+            user, recent = await _load_user_context(user_id)
+        finally:
+            unchanged = user_cache.end_load(user_id)
+        if unchanged:
+            user_cache.put(user_id, user, recent)
+        return user, recent
+
+    cached = user_cache.get(user_id)
+    if cached is None:
+        cached = await _user_context_flight.do(user_id, load)
+    user, recent = cached
+    # Callers get their own copies so they can't mutate the cached entry
+    return (dict(user) if user else None), [dict(conversation) for conversation in recent]
+
+def get_user_cache_stats() -> Dict[str, Any]:
+    return user_cache.stats()
+
+def get_write_behind_stats() -> Dict[str, Any]:
+    return {
+        "enabled": CONVERSATION_WRITE_BEHIND,
+        "conversations": conversation_writer.stats(),
+        "analytics": analytics_writer.stats()
+    }
+
+async def flush_pending_writes() -> None:
+    """Wait for queued conversation inserts, e.g. before deleting conversations"""
+    await conversation_writer.flush()
+    await analytics_writer.flush()
+
+async def close_conversation_writer() -> None:
+    """Write out queued conversations and stop the flusher; called on shutdown"""
+    await conversation_writer.close()
+    await analytics_writer.close()
+
+async def get_recent_conversations(user_id: str, limit: int = 5, session_id: Optional[str] = None) -> list[dict]:
+    """Return the user's (or one session's) last ``limit`` exchanges, oldest first"""
+    cursor = conversations_collection.find(_conversation_query(user_id, session_id), CONVERSATION_PROJECTION).sort(
+        [("timestamp", DESCENDING), ("_id", DESCENDING)]
+    ).limit(limit)
+    conversations = await cursor.to_list(length=limit)
+    conversations.reverse()
+    return conversations
+
+async def get_session_conversations(user_id: str, session_id: str, after: Optional[str] = None,
+                                    limit: int = 0) -> list[dict]:
+    """Return a session's exchanges in order, after the keyset cursor ``after`` (``limit`` 0 means all)"""
+    cursor = conversations_collection.find(
+        _conversation_query(user_id, session_id, after=after), CONVERSATION_PROJECTION
+    ).sort([("timestamp", ASCENDING), ("_id", ASCENDING)]).limit(limit)
+    return await cursor.to_list(length=None)
+
+async def get_conversation_history_for_context(user_id: str, limit: int = 5) -> str:
+    if limit <= USER_CACHE_HISTORY:
+        history = (await get_user_context(user_id))[1][-limit:]
+    else:
+        history = await get_recent_conversations(user_id, limit)
     return "\n".join([f"User: {conv['message']}\nBot: {conv['response']}" for conv in history])
@@ -0,0 +1,289 @@
+"""
+Shared LLM client.
+
+Every OpenAI call in the app goes through this module so that they share one
+pooled HTTP connection pool, the same connect/read deadlines, a jittered
+retry policy, optional hedged requests and a circuit breaker. Set
+``LLM_BASE_URL`` (for example ``http://localhost:8001/v1`` with
+``uvicorn app.mock_llm:app --port 8001``) to swap in another
+OpenAI-compatible server such as the local mock.
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError
+from app.utils.singleflight import SingleFlight
+
+load_dotenv()
+
+# Configuration
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))  # seconds
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "3"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "30"))
+LLM_POOL_TIMEOUT = float(os.getenv("LLM_POOL_TIMEOUT", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.25"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "4"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))  # Never hedge sooner than this
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+LLM_DEDUP_ENABLED = os.getenv("LLM_DEDUP_ENABLED", "false").lower() in ("1", "true", "yes")
+LLM_DEDUP_WINDOW_SECONDS = float(os.getenv("LLM_DEDUP_WINDOW_SECONDS", "2"))  # Identical completions reused this long
+LATENCY_WINDOW = 200  # Recent latencies kept per operation for the p95 estimate
+HEDGE_MIN_SAMPLES = 20  # Don't hedge until the p95 estimate means something
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling upstream while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open trial call"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.rejected_calls = 0
+        self._trial_in_flight = False
+
+    def before_call(self) -> None:
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                self.rejected_calls += 1
+                raise CircuitOpenError("LLM upstream is unhealthy; circuit breaker is open")
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._trial_in_flight:
+                self.rejected_calls += 1
+                raise CircuitOpenError("LLM upstream is unhealthy; waiting for trial request")
+            self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._trial_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Give up a half-open trial that ended without an upstream verdict"""
+        self._trial_in_flight = False
+
+
+class LatencyTracker:
+    """Sliding window of successful call latencies"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def hedge_delay(self) -> Optional[float]:
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(LLM_HEDGE_MIN_DELAY, self.percentile(95) or 0.0)
+
+
+_api_key = os.getenv("OPENAI_API_KEY") or ("mock" if LLM_BASE_URL else None)
+
+_http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+    ),
+    timeout=httpx.Timeout(
+        connect=LLM_CONNECT_TIMEOUT,
+        read=LLM_READ_TIMEOUT,
+        write=LLM_READ_TIMEOUT,
+        pool=LLM_POOL_TIMEOUT
+    )
+)
+
+# Initialize the shared OpenAI client only if it can be used
+client: Optional[AsyncOpenAI] = None
+if _api_key:
+    try:
+        client = AsyncOpenAI(
+            api_key=_api_key,
+            base_url=LLM_BASE_URL,
+            http_client=_http_client,
+            max_retries=0  # Retries are handled here, with jitter and the breaker
+        )
+    except Exception as e:
+        print(f"Warning: Could not initialize OpenAI client: {e}")
+        client = None
+
+breaker = CircuitBreaker(LLM_BREAKER_FAILURE_THRESHOLD, LLM_BREAKER_RESET_SECONDS)
+_completion_flight = SingleFlight("chat_completion", ttl_seconds=LLM_DEDUP_WINDOW_SECONDS)
+_latency: Dict[str, LatencyTracker] = {}
+_stats = {
+    "calls": 0,
+    "failures": 0,
+    "retries": 0,
+    "hedges_sent": 0,
+    "hedges_won": 0,
+}
+
+
+def is_available() -> bool:
+    """Whether an LLM backend is configured"""
+    return client is not None
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, APIConnectionError):  # Includes timeouts
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+def _backoff(attempt: int) -> float:
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+async def _hedged(operation: str, call: Callable[[], Awaitable[Any]]) -> Any:
+    """Run call, firing a duplicate if it is slower than the operation's p95"""
+    delay = _latency[operation].hedge_delay() if LLM_HEDGE_ENABLED else None
+    if delay is None:
+        return await call()
+
+    primary = asyncio.create_task(call())
+    pending = {primary}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return primary.result()
+
+        _stats["hedges_sent"] += 1
+        hedge = asyncio.create_task(call())
+        pending.add(hedge)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        _stats["hedges_won"] += 1
+                    return task.result()
+                error = task.exception()
+        raise error  # type: ignore[misc]
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _call(operation: str, call: Callable[[], Awaitable[Any]], hedge: bool = True) -> Any:
+    """Call upstream through the breaker with jittered retries"""
+    if client is None:
+        raise RuntimeError("OpenAI client is not initialized. Check your API key.")
+    tracker = _latency.setdefault(operation, LatencyTracker())
+
+    attempt = 0
+    while True:
+        breaker.before_call()
+        _stats["calls"] += 1
+        started = time.monotonic()
+        try:
+            result = await (_hedged(operation, call) if hedge else call())
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception as e:
+            _stats["failures"] += 1
+            if not _is_retryable(e):
+                breaker.release()
+                raise
+            breaker.record_failure()
+            if attempt >= LLM_MAX_RETRIES or breaker.state == "open":
+                raise
+            attempt += 1
+            _stats["retries"] += 1
+            await asyncio.sleep(_backoff(attempt))
+            continue
+        tracker.record(time.monotonic() - started)
+        breaker.record_success()
+        return result
+
+
+async def chat_completion(dedupe: bool = False, **kwargs: Any) -> Any:
+    """Create a chat completion (hedged when enabled).
+
+    Callers pass ``dedupe=True`` for stateless prompts (e.g. summaries), never
+    for user chat turns, whose answers must be sampled independently. With
+    LLM_DEDUP_ENABLED, identical concurrent requests then share one upstream
+    call and the answer is reused for LLM_DEDUP_WINDOW_SECONDS.
+    """
+    if not (dedupe and LLM_DEDUP_ENABLED):
+        return await _call("chat", lambda: client.chat.completions.create(**kwargs))
+    key = json.dumps(kwargs, sort_keys=True, default=str)
+    return await _completion_flight.do(key, lambda: _call("chat", lambda: client.chat.completions.create(**kwargs)))
+
+
+async def stream_chat_completion(**kwargs: Any) -> Any:
+    """Open a streamed chat completion; retries cover establishing the stream only"""
+    return await _call("chat_stream", lambda: client.chat.completions.create(stream=True, **kwargs), hedge=False)
+
+
+async def create_embedding(**kwargs: Any) -> Any:
+    """Create embeddings (hedged when enabled)"""
+    return await _call("embedding", lambda: client.embeddings.create(**kwargs))
+
+
+def get_llm_stats() -> Dict[str, Any]:
+    """Client counters, breaker state and latency percentiles for monitoring"""
+    return {
+        **_stats,
+        "base_url": LLM_BASE_URL or "https://api.openai.com/v1",
+        "hedging_enabled": LLM_HEDGE_ENABLED,
+        "dedup_enabled": LLM_DEDUP_ENABLED,
+        "circuit_breaker": {
+            "state": breaker.state,
+            "consecutive_failures": breaker.consecutive_failures,
+            "rejected_calls": breaker.rejected_calls,
+        },
+        "latency_ms": {
+            operation: {
+                "samples": len(tracker.samples),
+                "p50": round((tracker.percentile(50) or 0) * 1000, 1),
+                "p95": round((tracker.percentile(95) or 0) * 1000, 1),
+            }
+            for operation, tracker in _latency.items()
+        },
+    }
+
+
+async def close_llm_client() -> None:
+    """Close pooled connections on shutdown"""
+    await _http_client.aclose()
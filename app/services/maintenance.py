@@ -0,0 +1,95 @@
+"""
+Heavy maintenance operations, run as background jobs.
+
+Deletes go through ``_delete_in_batches``: at most MAINTENANCE_BATCH_SIZE
+documents per round trip with a MAINTENANCE_BATCH_PAUSE_MS pause in between,
+so a global reset or a long-tenured user's deletion doesn't monopolise the
+database while live requests are being served.
+"""
+
+import asyncio
+import os
+from typing import Any, Dict, Optional
+
+from bson.objectid import ObjectId
+from app.database.database import (
+    users_collection, conversations_collection, sessions_collection, calendar_events_collection,
+    analytics_collection
+)
+from app.services.analytics import ANALYTICS_ENABLED, backfill_analytics
+from app.utils.jobs import Job
+
+# Configuration
+MAINTENANCE_BATCH_SIZE = int(os.getenv("MAINTENANCE_BATCH_SIZE", "500"))
+MAINTENANCE_BATCH_PAUSE_MS = int(os.getenv("MAINTENANCE_BATCH_PAUSE_MS", "50"))
+
+# Collections holding per-user data, keyed by the user's id string
+USER_DATA_COLLECTIONS = [conversations_collection, sessions_collection, calendar_events_collection]
+
+
+async def _pause() -> None:
+    await asyncio.sleep(MAINTENANCE_BATCH_PAUSE_MS / 1000)
+
+
+async def _delete_in_batches(collection: Any, query: Dict[str, Any], job: Optional[Job] = None) -> int:
+    """Delete matching documents a batch of _ids at a time"""
+    deleted = 0
+    while True:
+        ids = [doc["_id"] async for doc in collection.find(query, {"_id": 1}).limit(MAINTENANCE_BATCH_SIZE)]
+        if not ids:
+            return deleted
+        result = await collection.delete_many({"_id": {"$in": ids}})
+        deleted += result.deleted_count
+        if job:
+            job.advance(result.deleted_count)
+        await _pause()
+
+
+async def purge_user_data(user_id: str, job: Optional[Job] = None) -> Dict[str, int]:
+    """Delete everything stored for a user across collections, including their analytics rollup.
+
+    Day and tag rollups are aggregates over all users and keep counting the
+    deleted user's past exchanges.
+    """
+    if job:
+        job.total = sum([await collection.count_documents({"user_id": user_id}) for collection in USER_DATA_COLLECTIONS])
+    result = {
+        collection.name: await _delete_in_batches(collection, {"user_id": user_id}, job)
+        for collection in USER_DATA_COLLECTIONS
+    }
+    rollup = await analytics_collection.delete_one({"_id": f"user:{user_id}"})
+    result[analytics_collection.name] = rollup.deleted_count
+    return result
+
+
+async def reset_all_conversations(job: Optional[Job] = None) -> Dict[str, int]:
+    """Delete every conversation and session that existed when the reset started.
+
+    ObjectIds grow with time, so anything created after the cutoff (new chats
+    arriving during a long reset) is left alone. The analytics rollups are
+    then rebuilt from what is left, so they stop counting deleted exchanges.
+    """
+    cutoff = {"_id": {"$lte": ObjectId()}}
+    if job:
+        job.total = (await conversations_collection.estimated_document_count()
+                     + await sessions_collection.estimated_document_count())
+    result = {
+        "conversations": await _delete_in_batches(conversations_collection, cutoff, job),
+        "conversation_sessions": await _delete_in_batches(sessions_collection, cutoff, job)
+    }
+
+    # Users not yet migrated may still carry an embedded conversations array
+    legacy = {"conversations": {"$exists": True}}
+    result["legacy_arrays_cleared"] = 0
+    while True:
+        ids = [doc["_id"] async for doc in users_collection.find(legacy, {"_id": 1}).limit(MAINTENANCE_BATCH_SIZE)]
+        if not ids:
+            break
+        update = await users_collection.update_many({"_id": {"$in": ids}}, {"$unset": {"conversations": ""}})
+        result["legacy_arrays_cleared"] += update.modified_count
+        await _pause()
+
+    if ANALYTICS_ENABLED:
+        rebuilt = await backfill_analytics()
+        result["analytics_conversations"] = rebuilt["conversations"]
+    return result
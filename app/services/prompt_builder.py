@@ -0,0 +1,179 @@
+import asyncio
+import os
+from typing import List, Dict, Any, Optional, Tuple
+from openai.types.chat import ChatCompletionMessageParam
+from app.services.rag import CHUNK_OVERLAP
+
+# Try to import tiktoken, fallback to a character-based estimate if not available
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# Configuration
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))  # Leaves room for the 1000-token answer in a 4k window
+PROMPT_CONTEXT_SHARE = float(os.getenv("PROMPT_CONTEXT_SHARE", "0.6"))  # Share of the free budget given to RAG context before history
+TOKENIZER_MODEL = "gpt-3.5-turbo"
+CHARS_PER_TOKEN = 4  # Fallback estimate when tiktoken is unavailable
+MESSAGE_OVERHEAD_TOKENS = 4  # Role/separator tokens added per chat message
+REPLY_PRIMING_TOKENS = 3
+MIN_PARTIAL_TOKENS = 50  # Don't bother including a truncated chunk smaller than this
+MIN_OVERLAP_CHARS = 20
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """Load the tokenizer once; tiktoken may need to fetch its vocabulary on first use"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        if TIKTOKEN_AVAILABLE:
+            try:
+                _encoding = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+            except Exception as e:
+                print(f"Warning: Could not load tokenizer, estimating token counts: {e}")
+    return _encoding
+
+
+async def load_tokenizer() -> None:
+    """Load the tokenizer at startup in a worker thread, so a vocabulary download doesn't block the event loop"""
+    await asyncio.to_thread(_get_encoding)
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens in text with the local tokenizer"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Keep the leading part of text that fits in max_tokens"""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text)
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    return text[:max_tokens * CHARS_PER_TOKEN]
+
+
+def strip_overlap(text: str, kept: List[str], max_overlap: int = CHUNK_OVERLAP) -> str:
+    """Remove the parts of text already present in kept chunks.
+
+    Neighbouring chunks of the same document share up to ``max_overlap``
+    characters, so a chunk's head may repeat the tail of a kept chunk (or its
+    tail may repeat a kept chunk's head). Exact or contained duplicates are
+    dropped entirely.
+    """
+    for existing in kept:
+        if not text:
+            break
+        if text in existing:
+            return ""
+        limit = min(max_overlap, len(existing), len(text))
+        for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+            if existing.endswith(text[:size]):
+                text = text[size:]
+                break
+        limit = min(max_overlap, len(existing), len(text))
+        for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+            if text.endswith(existing[:size]):
+                text = text[:-size]
+                break
+    return text.strip()
+
+
+def _format_turn(conv: Dict[str, Any]) -> str:
+    return f"User: {conv['message']}\nBot: {conv['response']}"
+
+
+def build_prompt(system_prompt: str, message: str, chunks: List[Dict[str, Any]],
+                 history: List[Dict[str, Any]], summary: Optional[str] = None
+                 ) -> Tuple[List[ChatCompletionMessageParam], List[str], Dict[str, int]]:
+    """Assemble the chat messages within PROMPT_TOKEN_BUDGET.
+
+    The system prompt and current question are always sent. Of the remaining
+    budget, PROMPT_CONTEXT_SHARE goes to retrieved chunks (most relevant
+    first, overlap removed) and whatever is left goes to history: the rolling
+    session summary, then the most recent turns. Returns the messages, the
+    context chunks that were used and per-section token counts.
+    """
+    fixed_tokens = (count_tokens(system_prompt) + count_tokens(message)
+                    + 2 * MESSAGE_OVERHEAD_TOKENS + REPLY_PRIMING_TOKENS)
+    available = max(0, PROMPT_TOKEN_BUDGET - fixed_tokens)
+
+    # Retrieved context, most relevant first
+    context_budget = int(available * PROMPT_CONTEXT_SHARE)
+    context_used: List[str] = []
+    context_tokens = 0
+    for chunk in sorted(chunks, key=lambda c: c.get("similarity", 0), reverse=True):
+        text = strip_overlap(chunk["content"], context_used)
+        if not text:
+            continue
+        tokens = count_tokens(text)
+        remaining = context_budget - context_tokens
+        if tokens > remaining:
+            if remaining >= MIN_PARTIAL_TOKENS:
+                text = truncate_to_tokens(text, remaining)
+                context_used.append(text)
+                context_tokens += count_tokens(text)
+            break
+        context_used.append(text)
+        context_tokens += tokens
+
+    # Conversation history gets everything context didn't use: summary first,
+    # then raw turns, most recent first
+    history_budget = available - context_tokens
+    history_tokens = 0
+    if summary:
+        summary = truncate_to_tokens(summary, history_budget)
+        history_tokens += count_tokens(summary)
+    history_turns: List[str] = []
+    for conv in reversed(history):
+        turn = _format_turn(conv)
+        tokens = count_tokens(turn) + 1
+        if history_tokens + tokens > history_budget:
+            break
+        history_turns.append(turn)
+        history_tokens += tokens
+    history_turns.reverse()
+
+    # Build the conversation context
+    context_parts = []
+    if context_used:
+        context_parts.append("Relevant Knowledge Base Information:\n" + "\n".join(context_used))
+    if summary:
+        context_parts.append(f"Conversation Summary:\n{summary}")
+    if history_turns:
+        context_parts.append("Recent Conversation History:\n" + "\n".join(history_turns))
+    context_text = "\n\n".join(context_parts)
+
+    messages: List[ChatCompletionMessageParam] = [
+        {"role": "system", "content": system_prompt}
+    ]
+    if context_text:
+        messages.append({"role": "user", "content": f"Context:\n{context_text}\n\nCurrent question: {message}"})
+    else:
+        messages.append({"role": "user", "content": message})
+
+    stats = {
+        "system_tokens": count_tokens(system_prompt),
+        "context_tokens": context_tokens,
+        "summary_tokens": count_tokens(summary) if summary else 0,
+        "history_tokens": history_tokens,
+        "question_tokens": count_tokens(message),
+        "total_tokens": sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages) + REPLY_PRIMING_TOKENS,
+        "budget": PROMPT_TOKEN_BUDGET,
+        "chunks_used": len(context_used),
+        "chunks_available": len(chunks),
+        "turns_used": len(history_turns),
+        "turns_available": len(history),
+    }
+    return messages, context_used, stats
@@ -1,13 +1,16 @@
-import os
 import csv
 import json
 import PyPDF2
 
 import io
+import os
+import time
 from datetime import datetime
-from typing import List, Dict, Any, Optional
-from openai import OpenAI
-from app.database.database import documents_collection, document_chunks_collection
+from typing import List, Dict, Any, Optional, Tuple
+from pymongo import ReturnDocument
+from app.database.database import documents_collection, document_chunks_collection, app_state_collection
+from app.services.llm_client import create_embedding, is_available as llm_available
+from app.utils.singleflight import SingleFlight, normalize_key
 from dotenv import load_dotenv
 
 # Try to import numpy, fallback to manual calculation if not available
@@ -19,48 +22,105 @@ except ImportError:
 
 load_dotenv()
 
-# Initialize OpenAI client for embeddings
-openai_client = None
-if os.getenv("OPENAI_API_KEY"):
-    openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
 # Configuration
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
 SIMILARITY_THRESHOLD = 0.1
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB limit
 MAX_CHUNKS_PER_DOCUMENT = 100  # Prevent processing extremely large documents
+EMBEDDING_MODEL = "text-embedding-ada-002"
+EMBEDDING_BATCH_SIZE = 1000  # Inputs per embeddings request (the API accepts up to 2048)
+
+def _copy_embedding(embedding: Optional[List[float]]) -> Optional[List[float]]:
+    return list(embedding) if embedding is not None else None
+
+def _copy_retrieval(result: Tuple[Optional[List[float]], List[Dict[str, Any]]]) -> Tuple[Optional[List[float]], List[Dict[str, Any]]]:
+    embedding, chunks = result
+    return _copy_embedding(embedding), [dict(chunk) for chunk in chunks]
+
+# Concurrent identical queries share one embedding call / chunk scan; the
+# copiers are shallow since floats and chunk fields are immutable
+_embedding_flight = SingleFlight("embedding", copy_result=_copy_embedding)
+_retrieval_flight = SingleFlight("retrieval", copy_result=_copy_retrieval)
+
+# Bumped whenever documents are added or removed so caches of answers
+# derived from the corpus can tell they are stale. The counter lives in
+# MongoDB so every worker sees it; each worker re-reads it at most every
+# CORPUS_VERSION_TTL_SECONDS, which bounds how long another worker's stale
+# answers can be served.
+CORPUS_VERSION_TTL_SECONDS = float(os.getenv("CORPUS_VERSION_TTL_SECONDS", "5"))
+_corpus_version = 0
+_corpus_version_read_at = 0.0
 
-def retrieve_context(query: str) -> str:
+async def get_corpus_version() -> int:
+    global _corpus_version, _corpus_version_read_at
+    if time.monotonic() - _corpus_version_read_at >= CORPUS_VERSION_TTL_SECONDS:
+        try:
+            state = await app_state_collection.find_one({"_id": "corpus"})
+            _corpus_version = state["version"] if state else 0
+        except Exception as e:
+            print(f"Error reading corpus version: {e}")
+        _corpus_version_read_at = time.monotonic()
+    return _corpus_version
+
+async def bump_corpus_version() -> None:
+    global _corpus_version, _corpus_version_read_at
+    try:
+        state = await app_state_collection.find_one_and_update(
+            {"_id": "corpus"}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        _corpus_version = state["version"]
+    except Exception as e:
+        # This worker still drops its own stale answers
+        print(f"Error bumping corpus version: {e}")
+        _corpus_version += 1
+    _corpus_version_read_at = time.monotonic()
+
+async def retrieve_context(query: str) -> str:
     """Retrieve relevant context from document chunks using semantic search"""
+    similar_chunks = await retrieve_context_chunks(query)
+    if similar_chunks:
+        return "\n".join([chunk["content"] for chunk in similar_chunks])
+    return ""
+
+async def retrieve_context_chunks(query: str, limit: int = 3) -> List[Dict[str, Any]]:
+    """Retrieve the most relevant chunks (best first) for a query"""
+    _, chunks = await retrieve_with_embedding(query, limit)
+    return chunks
+
+async def retrieve_with_embedding(query: str, limit: int = 3) -> Tuple[Optional[List[float]], List[Dict[str, Any]]]:
+    """Retrieve the query embedding and the most relevant chunks (best first)"""
+    return await _retrieval_flight.do((normalize_key(query), limit), lambda: _retrieve_with_embedding(query, limit))
+
+async def _retrieve_with_embedding(query: str, limit: int) -> Tuple[Optional[List[float]], List[Dict[str, Any]]]:
+    query_embedding = None
     try:
-        if not openai_client:
-            return ""
+        if not llm_available():
+            return None, []
         
         # Get query embedding
-        query_embedding = get_embedding(query)
+        query_embedding = await get_embedding(query)
         if not query_embedding:
-            return ""
+            return None, []
         
         # Find similar chunks
-        similar_chunks = find_similar_chunks(query_embedding, limit=3)
-        
-        if similar_chunks:
-            return "\n".join([chunk["content"] for chunk in similar_chunks])
-        return ""
+        return query_embedding, await find_similar_chunks(query_embedding, limit=limit)
         
     except Exception as e:
         print(f"Error retrieving context: {e}")
-        return ""
+        return query_embedding, []
 
-def get_embedding(text: str) -> Optional[List[float]]:
+async def get_embedding(text: str) -> Optional[List[float]]:
     """Get embedding for text using OpenAI"""
+    return await _embedding_flight.do(normalize_key(text), lambda: _get_embedding(text))
+
+async def _get_embedding(text: str) -> Optional[List[float]]:
     try:
-        if not openai_client:
+        if not llm_available():
             return None
         
-        response = openai_client.embeddings.create(
-            model="text-embedding-ada-002",
+        response = await create_embedding(
+            model=EMBEDDING_MODEL,
             input=text
         )
         return response.data[0].embedding
@@ -68,18 +128,37 @@ def get_embedding(text: str) -> Optional[List[float]]:
         print(f"Error getting embedding: {e}")
         return None
 
-def find_similar_chunks(query_embedding: List[float], limit: int = 3) -> List[Dict[str, Any]]:
+async def get_embeddings(texts: List[str]) -> Optional[List[List[float]]]:
+    """Embed many texts, EMBEDDING_BATCH_SIZE per request; None if any request fails"""
+    try:
+        if not llm_available():
+            return None
+        embeddings: List[List[float]] = []
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            response = await create_embedding(
+                model=EMBEDDING_MODEL,
+                input=texts[start:start + EMBEDDING_BATCH_SIZE]
+            )
+            embeddings.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        return embeddings
+    except Exception as e:
+        print(f"Error getting embeddings: {e}")
+        return None
+
+async def find_similar_chunks(query_embedding: List[float], limit: int = 3) -> List[Dict[str, Any]]:
     """Find similar document chunks using cosine similarity"""
     try:
-        chunks = list(document_chunks_collection.find({}))
         similar_chunks = []
         
-        for chunk in chunks:
+        projection = {"content": 1, "embedding": 1, "doc_id": 1, "chunk_index": 1}
+        async for chunk in document_chunks_collection.find({}, projection):
             if "embedding" in chunk:
                 similarity = cosine_similarity(query_embedding, chunk["embedding"])
                 if similarity > SIMILARITY_THRESHOLD:
                     similar_chunks.append({
                         "id": str(chunk["_id"]),
+                        "doc_id": chunk.get("doc_id"),
+                        "chunk_index": chunk.get("chunk_index", 0),
                         "content": chunk["content"],
                         "similarity": similarity
                     })
@@ -154,12 +233,12 @@ async def process_document(file_content: bytes, filename: str, content_type: str
             return {"error": "Could not extract text from file. File may be empty or corrupted."}
         
         # Check if document already exists
-        existing_doc = documents_collection.find_one({"filename": filename})
+        existing_doc = await documents_collection.find_one({"filename": filename})
         if existing_doc:
             return {"error": f"Document with filename '{filename}' already exists"}
         
         # Create document record
-        doc_id = documents_collection.insert_one({
+        insert_result = await documents_collection.insert_one({
             "filename": filename,
             "content_type": content_type,
             "size": len(file_content),
@@ -167,7 +246,8 @@ async def process_document(file_content: bytes, filename: str, content_type: str
             "processed": False,  # Will be set to True after processing
             "created_at": datetime.utcnow(),
             "updated_at": datetime.utcnow()
-        }).inserted_id
+        })
+        doc_id = insert_result.inserted_id
         
         # Chunk the text
         chunks = chunk_text(text_content)
@@ -187,10 +267,10 @@ async def process_document(file_content: bytes, filename: str, content_type: str
                     continue
                 
                 # Get embedding for chunk
-                embedding = get_embedding(chunk)
+                embedding = await get_embedding(chunk)
                 if embedding:
                     # Store chunk with embedding
-                    document_chunks_collection.insert_one({
+                    await document_chunks_collection.insert_one({
                         "doc_id": str(doc_id),
                         "chunk_index": i,
                         "content": chunk,
@@ -207,7 +287,8 @@ async def process_document(file_content: bytes, filename: str, content_type: str
                 print(f"Error processing chunk {i}: {e}")
         
         # Update document status
-        documents_collection.update_one(
+        await bump_corpus_version()
+        await documents_collection.update_one(
             {"_id": doc_id},
             {
                 "$set": {
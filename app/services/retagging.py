@@ -0,0 +1,134 @@
+"""
+Re-tag stored conversations after the tag taxonomy changes.
+
+Conversations are streamed in _id order, tagged across a process pool
+(tagging is CPU-bound, so threads wouldn't help) and only the ones whose
+tags changed are written back, with one unordered bulk write per batch.
+Tags the embedding classifier added at save time (``centroid_tags``) can't
+be recomputed from the text, so they are merged back into the new tags.
+After every batch the last processed _id is checkpointed in
+``job_checkpoints`` so an interrupted run can resume where it stopped.
+Analytics tag deltas come from the tags a batch actually changed, so a
+batch that is re-read on resume (its tags already written) adds nothing
+again; only a run stopped between a batch's two bulk writes leaves that
+batch's deltas uncounted.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+from app.database.database import conversations_collection, analytics_collection, checkpoints_collection
+from app.services.analytics import ANALYTICS_ENABLED, tag_count_operations
+from app.services.crm_logic import user_cache
+from app.services.tag_classifier import merge_tags
+from app.utils.jobs import Job
+from app.utils.tagging import tag_batch
+
+# Configuration
+RETAG_BATCH_SIZE = int(os.getenv("RETAG_BATCH_SIZE", "5000"))  # Conversations read, tagged and written per round
+RETAG_WORKERS = int(os.getenv("RETAG_WORKERS", str(os.cpu_count() or 2)))
+CHECKPOINT_ID = "retag_conversations"
+
+
+async def get_retag_checkpoint() -> Optional[Dict[str, Any]]:
+    return await checkpoints_collection.find_one({"_id": CHECKPOINT_ID})
+
+
+async def _tag_in_pool(pool: ProcessPoolExecutor, items: List[Any]) -> List[Any]:
+    """Split items across the pool's workers and tag them in parallel"""
+    loop = asyncio.get_running_loop()
+    size = max(1, -(-len(items) // RETAG_WORKERS))
+    chunks = [items[i:i + size] for i in range(0, len(items), size)]
+    results = await asyncio.gather(*(loop.run_in_executor(pool, tag_batch, chunk) for chunk in chunks))
+    return [pair for chunk in results for pair in chunk]
+
+
+async def retag_conversations(job: Optional[Job] = None, resume: bool = False) -> Dict[str, Any]:
+    """Recompute every conversation's tags with the current taxonomy"""
+    query: Dict[str, Any] = {}
+    processed = updated = 0
+    checkpoint = await get_retag_checkpoint() if resume else None
+    if checkpoint and checkpoint.get("last_id") is not None:
+        query["_id"] = {"$gt": checkpoint["last_id"]}
+        processed, updated = checkpoint.get("processed", 0), checkpoint.get("updated", 0)
+    if job:
+        job.total = processed + await conversations_collection.count_documents(query)
+        job.processed = processed
+
+    started = time.monotonic()
+    resumed_from = processed
+    # Spawned workers import only the tagging module, not the server's state
+    pool = ProcessPoolExecutor(max_workers=RETAG_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        cursor = conversations_collection.find(query, {"response": 1, "tags": 1, "centroid_tags": 1}).sort("_id", 1).batch_size(RETAG_BATCH_SIZE)
+        batch: List[Dict[str, Any]] = []
+
+        async def process(batch: List[Dict[str, Any]]) -> None:
+            nonlocal processed, updated
+            current = {conv["_id"]: conv.get("tags") or [] for conv in batch}
+            kept = {conv["_id"]: conv.get("centroid_tags") or [] for conv in batch}
+            tagged = await _tag_in_pool(pool, [(conv["_id"], conv.get("response") or "") for conv in batch])
+
+            operations = []
+            tag_deltas: Dict[str, int] = defaultdict(int)
+            for conversation_id, keyword_tags in tagged:
+                tags = merge_tags(keyword_tags, kept[conversation_id])
+                old_tags = current[conversation_id]
+                if sorted(tags) == sorted(old_tags):
+                    continue
+                operations.append(UpdateOne({"_id": conversation_id}, {"$set": {"tags": tags}}))
+                for tag in set(old_tags):
+                    tag_deltas[tag] -= 1
+                for tag in set(tags):
+                    tag_deltas[tag] += 1
+            if operations:
+                await conversations_collection.bulk_write(operations, ordered=False)
+                if ANALYTICS_ENABLED:
+                    rollups = tag_count_operations(tag_deltas)
+                    if rollups:
+                        await analytics_collection.bulk_write(rollups, ordered=False)
+
+            processed += len(batch)
+            updated += len(operations)
+            await checkpoints_collection.update_one(
+                {"_id": CHECKPOINT_ID},
+                {"$set": {
+                    "last_id": batch[-1]["_id"],
+                    "processed": processed,
+                    "updated": updated,
+                    "updated_at": datetime.utcnow()
+                }},
+                upsert=True
+            )
+            if job:
+                job.processed = processed
+                elapsed = time.monotonic() - started
+                job.details["messages_per_second"] = round((processed - resumed_from) / elapsed, 1) if elapsed else None
+
+        async for conversation in cursor:
+            batch.append(conversation)
+            if len(batch) >= RETAG_BATCH_SIZE:
+                await process(batch)
+                batch = []
+        if batch:
+            await process(batch)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    # A completed run leaves nothing to resume
+    await checkpoints_collection.delete_one({"_id": CHECKPOINT_ID})
+    user_cache.invalidate()  # Cached recent history carries the old tags
+    elapsed = time.monotonic() - started
+    return {
+        "processed": processed,
+        "updated": updated,
+        "elapsed_seconds": round(elapsed, 2),
+        "messages_per_second": round((processed - resumed_from) / elapsed, 1) if elapsed else None
+    }
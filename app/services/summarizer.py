@@ -0,0 +1,149 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Set, Tuple
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+from app.database.database import sessions_collection
+from app.models.schemas import Conversation
+from app.services.crm_logic import (
+    get_session_conversations, get_recent_conversations, get_user_context, encode_conversation_cursor
+)
+from app.services.llm_client import chat_completion, is_available as llm_available
+
+# Configuration
+SUMMARY_REFRESH_TURNS = int(os.getenv("SUMMARY_REFRESH_TURNS", "4"))  # Fold turns into the summary every K turns
+SUMMARY_RAW_TURNS = int(os.getenv("SUMMARY_RAW_TURNS", "3"))  # Most recent turns always sent verbatim
+SUMMARY_MODEL = "gpt-3.5-turbo"
+SUMMARY_MAX_TOKENS = 300
+
+# Sessions with a refresh in flight, and strong references to the running tasks
+_refreshing: Set[Tuple[str, str]] = set()
+_background_tasks: Set[asyncio.Task] = set()
+
+
+async def record_turn(user_id: str, session_id: str) -> None:
+    """Count a stored exchange against its session and refresh the summary every K turns"""
+    now = datetime.utcnow()
+    new_session = Conversation(
+        conversation_id=str(ObjectId()),
+        user_id=user_id,
+        session_id=session_id,
+        created_at=now,
+        updated_at=now
+    ).dict(exclude={"messages", "turn_count", "updated_at"})
+    session = await sessions_collection.find_one_and_update(
+        {"user_id": user_id, "session_id": session_id},
+        {
+            "$inc": {"turn_count": 1},
+            "$set": {"updated_at": now},
+            "$setOnInsert": new_session
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    unsummarized = session["turn_count"] - SUMMARY_RAW_TURNS - session.get("summarized_turns", 0)
+    if unsummarized >= SUMMARY_REFRESH_TURNS:
+        schedule_summary_refresh(user_id, session_id)
+
+
+def schedule_summary_refresh(user_id: str, session_id: str) -> None:
+    """Refresh a session summary in the background, at most once at a time per session"""
+    key = (user_id, session_id)
+    if key in _refreshing:
+        return
+    _refreshing.add(key)
+    task = asyncio.create_task(refresh_summary(user_id, session_id))
+    _background_tasks.add(task)
+
+    def _done(finished: asyncio.Task) -> None:
+        _background_tasks.discard(finished)
+        _refreshing.discard(key)
+
+    task.add_done_callback(_done)
+
+
+async def refresh_summary(user_id: str, session_id: str) -> Optional[str]:
+    """Fold the turns that left the raw window into the session's rolling summary"""
+    try:
+        session = await sessions_collection.find_one({"user_id": user_id, "session_id": session_id})
+        if not session:
+            return None
+        start = session.get("summarized_turns", 0)
+        end = session.get("turn_count", 0) - SUMMARY_RAW_TURNS
+        if end <= start:
+            return session.get("summary")
+
+        turns = await get_session_conversations(user_id, session_id, after=session.get("summary_cursor"),
+                                                limit=end - start)
+        if not turns:
+            return session.get("summary")
+        summary = await _summarize(session.get("summary"), turns)
+        if summary is None:
+            return session.get("summary")
+
+        # Only apply if no other refresh moved the summary forward meanwhile
+        await sessions_collection.update_one(
+            {"user_id": user_id, "session_id": session_id, "summarized_turns": start},
+            {"$set": {
+                "summary": summary,
+                "summarized_turns": start + len(turns),
+                "summary_cursor": encode_conversation_cursor(turns[-1]),
+                "updated_at": datetime.utcnow()
+            }}
+        )
+        return summary
+    except Exception as e:
+        print(f"Error refreshing conversation summary: {e}")
+        return None
+
+
+async def _summarize(previous_summary: Optional[str], turns: List[Dict[str, Any]]) -> Optional[str]:
+    """Ask the LLM to merge new exchanges into the previous summary"""
+    if not llm_available():
+        return None
+    exchanges = "\n".join([f"User: {conv['message']}\nBot: {conv['response']}" for conv in turns])
+    prompt = (
+        f"Current summary:\n{previous_summary or '(none)'}\n\n"
+        f"New exchanges:\n{exchanges}\n\n"
+        "Write the updated summary."
+    )
+    # Stateless: the prompt is only the previous summary and the turns, so identical ones may share a call
+    response = await chat_completion(
+        dedupe=True,
+        model=SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": (
+                "You maintain a running summary of a support conversation. Keep the user's goals, "
+                "preferences, names, properties and figures discussed, decisions made and open "
+                "questions. Drop greetings and small talk. Answer with the summary only, under 150 words."
+            )},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.2,
+        max_tokens=SUMMARY_MAX_TOKENS
+    )
+    return response.choices[0].message.content
+
+
+async def get_history_context(user_id: str, session_id: str) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """Return (summary, raw turns not yet covered by it) for prompt construction.
+
+    A session without any stored turns falls back to the user's most recent
+    exchanges across sessions.
+    """
+    session = await sessions_collection.find_one(
+        {"user_id": user_id, "session_id": session_id},
+        {"summary": 1, "summarized_turns": 1, "summary_cursor": 1, "turn_count": 1}
+    )
+    if not session:
+        return None, (await get_user_context(user_id))[1]
+
+    # Normally everything after the summary; capped if refreshes are failing
+    summarized = session.get("summarized_turns", 0)
+    start = max(summarized, session.get("turn_count", 0) - SUMMARY_REFRESH_TURNS - SUMMARY_RAW_TURNS)
+    if start == summarized:
+        turns = await get_session_conversations(user_id, session_id, after=session.get("summary_cursor"))
+    else:
+        turns = await get_recent_conversations(user_id, session["turn_count"] - start, session_id)
+    return session.get("summary"), turns
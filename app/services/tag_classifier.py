@@ -0,0 +1,166 @@
+"""
+Embedding-centroid tag classifier.
+
+Each tag with ``seed_phrases`` in the taxonomy is represented by the mean
+embedding of its seeds. A message gets every tag whose centroid is within
+CENTROID_TAG_THRESHOLD cosine similarity of the message embedding, which
+catches paraphrases the keyword matcher misses ("my card was charged twice"
+-> billing). Chat turns reuse the embedding the RAG step already computed,
+so tagging them costs no extra API call; seeds are embedded once per
+taxonomy version.
+"""
+
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.services.rag import get_embeddings
+from app.utils.singleflight import SingleFlight
+from app.utils.tagging import TagMatcher, get_tag_matcher
+
+# Try to import numpy, fallback to manual calculation if not available
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Configuration
+CENTROID_TAGGING_ENABLED = os.getenv("CENTROID_TAGGING_ENABLED", "false").lower() in ("1", "true", "yes")
+CENTROID_TAG_THRESHOLD = float(os.getenv("CENTROID_TAG_THRESHOLD", "0.82"))
+CENTROID_RETRY_SECONDS = 60  # Wait before embedding the seeds again after a failure
+CLASSIFY_MAX_MESSAGES = 10000  # Per batch classification request
+
+
+def _unit(vector: Sequence[float]) -> List[float]:
+    norm = sum(x * x for x in vector) ** 0.5
+    return [x / norm for x in vector] if norm else list(vector)
+
+
+class CentroidClassifier:
+    """Unit-length tag centroids, scored against a whole batch of embeddings at once"""
+
+    def __init__(self, seed_embeddings: Dict[str, List[List[float]]], threshold: float):
+        self.tags = [tag for tag, embeddings in seed_embeddings.items() if embeddings]
+        self.threshold = threshold
+        if NUMPY_AVAILABLE:
+            centroids = np.stack([
+                np.asarray(seed_embeddings[tag], dtype=np.float32).mean(axis=0) for tag in self.tags
+            ])
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            self._centroids = centroids / np.where(norms == 0, 1, norms)
+        else:
+            self._centroids = [
+                _unit([sum(column) / len(seed_embeddings[tag]) for column in zip(*seed_embeddings[tag])])
+                for tag in self.tags
+            ]
+
+    def score_batch(self, embeddings: Sequence[Sequence[float]]) -> List[Dict[str, float]]:
+        """Per embedding: similarity of each tag at or above the threshold, in taxonomy order"""
+        if not embeddings:
+            return []
+        if NUMPY_AVAILABLE:
+            # One (messages x dims) @ (dims x tags) product scores every pair
+            matrix = np.asarray(embeddings, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            similarities = (matrix @ self._centroids.T) / np.where(norms == 0, 1, norms)
+            return [
+                {self.tags[i]: round(float(row[i]), 4) for i in np.flatnonzero(row >= self.threshold)}
+                for row in similarities
+            ]
+        results = []
+        for embedding in embeddings:
+            unit = _unit(embedding)
+            scores = {}
+            for tag, centroid in zip(self.tags, self._centroids):
+                similarity = sum(a * b for a, b in zip(unit, centroid))
+                if similarity >= self.threshold:
+                    scores[tag] = round(similarity, 4)
+            results.append(scores)
+        return results
+
+    def classify_batch(self, embeddings: Sequence[Sequence[float]]) -> List[List[str]]:
+        return [list(scores) for scores in self.score_batch(embeddings)]
+
+
+_classifier: Optional[CentroidClassifier] = None
+_classifier_source: Optional[TagMatcher] = None  # Taxonomy the centroids were built from
+_last_failure = 0.0
+_build_flight = SingleFlight("tag_centroids", copy_result=None)  # The classifier is shared and never mutated
+
+
+async def _build(matcher: TagMatcher) -> Optional[CentroidClassifier]:
+    global _classifier, _classifier_source, _last_failure
+    seeds = [(tag, phrase) for tag in matcher.tags if tag != matcher.default_tag
+             for phrase in matcher.seed_phrases.get(tag, [])]
+    if not seeds:
+        _classifier, _classifier_source = None, matcher
+        return None
+    embeddings = await get_embeddings([phrase for _, phrase in seeds])
+    if embeddings is None:
+        _last_failure = time.monotonic()
+        return None
+
+    grouped: Dict[str, List[List[float]]] = {}
+    for (tag, _), embedding in zip(seeds, embeddings):
+        grouped.setdefault(tag, []).append(embedding)
+    _classifier, _classifier_source = CentroidClassifier(grouped, CENTROID_TAG_THRESHOLD), matcher
+    print(f"Built tag centroids for {len(_classifier.tags)} tags from {len(seeds)} seed phrases")
+    return _classifier
+
+
+async def get_centroid_classifier() -> Optional[CentroidClassifier]:
+    """Classifier for the current taxonomy, rebuilt when the taxonomy is reloaded"""
+    matcher = get_tag_matcher()
+    if _classifier_source is matcher:
+        return _classifier
+    if time.monotonic() - _last_failure < CENTROID_RETRY_SECONDS:
+        return None
+    return await _build_flight.do(id(matcher), lambda: _build(matcher))
+
+
+def merge_tags(keyword_tags: List[str], extra_tags: List[str]) -> List[str]:
+    """Union in taxonomy order; a fallback default tag gives way to extra tags"""
+    if not extra_tags:
+        return keyword_tags
+    matcher = get_tag_matcher()
+    if keyword_tags == [matcher.default_tag]:
+        keyword_tags = []
+    found = set(keyword_tags) | set(extra_tags)
+    return [tag for tag in matcher.tags if tag in found] + sorted(found.difference(matcher.tags))
+
+
+async def centroid_tags(embedding: Optional[List[float]]) -> List[str]:
+    """Centroid tags for one message embedding; empty when disabled or unavailable"""
+    if not CENTROID_TAGGING_ENABLED or not embedding:
+        return []
+    try:
+        classifier = await get_centroid_classifier()
+        return classifier.classify_batch([embedding])[0] if classifier else []
+    except Exception as e:
+        print(f"Error classifying message by tag centroids: {e}")
+        return []
+
+
+async def classify_messages(messages: List[str]) -> Dict[str, Any]:
+    """Keyword and centroid tags for many messages, embedded in batched requests"""
+    start_time = time.time()
+    classifier = await get_centroid_classifier()
+    if classifier is None:
+        return {"error": "Tag centroids are unavailable: add seed_phrases to the taxonomy and check the LLM connection"}
+    embeddings = await get_embeddings(messages)
+    if embeddings is None:
+        return {"error": "Could not embed messages"}
+
+    matcher = get_tag_matcher()
+    results = [
+        {"tags": merge_tags(matcher.tag(message), list(scores)), "similarities": scores}
+        for message, scores in zip(messages, classifier.score_batch(embeddings))
+    ]
+    elapsed = time.time() - start_time
+    return {
+        "results": results,
+        "count": len(results),
+        "threshold": classifier.threshold,
+        "messages_per_second": round(len(results) / elapsed, 1) if elapsed > 0 else None
+    }
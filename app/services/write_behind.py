@@ -0,0 +1,141 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from pymongo.errors import BulkWriteError
+
+DUPLICATE_KEY_ERROR = 11000
+RETRY_BASE_DELAY = 0.5  # Seconds, doubled per attempt
+
+
+class WriteBehindQueue:
+    """Buffer writes for a collection and apply them in bulk in the background.
+
+    ``enqueue`` returns as soon as the operation is queued; a flusher task
+    sends whatever has accumulated with one unordered ``bulk_write`` every
+    ``flush_interval_ms`` or ``batch_size`` operations, whichever comes
+    first. When ``max_queue_size`` operations are waiting, ``enqueue`` blocks
+    until the flusher catches up, so a slow database slows callers down
+    instead of growing memory without bound. ``close`` drains the queue.
+
+    Only operations the server reports as failed are retried. When the
+    outcome of a batch is unknown (e.g. the connection dropped) it is
+    retried only if ``idempotent``; counter updates such as ``$inc`` must
+    pass False, since re-applying them would count twice.
+    """
+
+    def __init__(self, name: str, collection: Any, flush_interval_ms: int, batch_size: int,
+                 max_queue_size: int, max_retries: int = 3, idempotent: bool = True):
+        self.name = name
+        self.collection = collection
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = batch_size
+        self.max_queue_size = max_queue_size
+        self.max_retries = max_retries
+        self.idempotent = idempotent
+        self._queue: Optional[asyncio.Queue] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.blocked_enqueues = 0
+
+    def _ensure_started(self) -> asyncio.Queue:
+        # Created lazily so the queue and task bind to the serving event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._run())
+        return self._queue
+
+    async def enqueue(self, operation: Any) -> None:
+        queue = self._ensure_started()
+        if queue.full():
+            self.blocked_enqueues += 1
+        await queue.put(operation)
+        self.enqueued += 1
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write(self, batch: List[Any]) -> None:
+        pending = batch  # Operations not known to have been applied
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.collection.bulk_write(pending, ordered=False)
+                pending = []
+                break
+            except BulkWriteError as e:
+                # Operations not listed in writeErrors were applied; write concern
+                # errors mean they were applied but not yet replicated, so neither
+                # is retried. Inserts that landed on an earlier attempt come back
+                # as duplicate keys
+                if e.details.get("writeConcernErrors"):
+                    print(f"Warning: {self.name} writes not yet replicated: {e.details['writeConcernErrors'][0]}")
+                errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != DUPLICATE_KEY_ERROR]
+                pending = [pending[error["index"]] for error in errors]
+                if not pending:
+                    break
+                error_message = errors[0].get("errmsg", "write error")
+            except Exception as e:
+                error_message = str(e)
+                if not self.idempotent:
+                    # Some of them may have been applied, and applying them again would count twice
+                    print(f"Error flushing {len(pending)} {self.name} writes, not retrying them: {error_message}")
+                    break
+            if attempt == self.max_retries:
+                print(f"Error flushing {len(pending)} {self.name} writes, dropping them: {error_message}")
+                break
+            await asyncio.sleep(RETRY_BASE_DELAY * (2 ** attempt))
+        self.failed += len(pending)
+        self.written += len(batch) - len(pending)
+        if len(pending) < len(batch):
+            self.batches += 1
+
+    async def flush(self) -> None:
+        """Wait until everything queued so far has been written"""
+        if self._queue is not None and self._flusher is not None and not self._flusher.done():
+            await self._queue.join()
+
+    async def close(self) -> None:
+        """Flush everything queued, then stop the flusher"""
+        if self._flusher is None:
+            return
+        await self.flush()
+        self._flusher.cancel()
+        try:
+            await self._flusher
+        except asyncio.CancelledError:
+            pass
+        self._flusher = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches,
+            "avg_batch_size": round(self.written / self.batches, 2) if self.batches else 0.0,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_size": self.max_queue_size,
+            "blocked_enqueues": self.blocked_enqueues
+        }
@@ -0,0 +1,133 @@
+"""
+Free-slot search over busy intervals.
+
+Busy intervals are sorted and merged once, then a single sweep walks each
+day's working hours (in the requested time zone) alongside them, so finding
+every free slot costs O(n log n) in the number of events plus the number of
+slots produced, however long the horizon.
+"""
+
+from datetime import datetime, time, timedelta, timezone, tzinfo
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+Interval = Tuple[datetime, datetime]
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+
+def as_utc(value: datetime) -> datetime:
+    """Aware UTC datetime; naive values (as MongoDB returns them) are taken to be UTC"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def get_timezone(name: str) -> tzinfo:
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown time zone: {name}")
+
+
+def parse_clock(value: str) -> time:
+    """'09:00' -> time(9, 0)"""
+    try:
+        return time.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid time of day: {value} (expected HH:MM)")
+
+
+def parse_weekdays(names: Iterable[str]) -> Set[int]:
+    """Day names ('monday', 'Tue', ...) -> date.weekday() numbers"""
+    days = set()
+    for name in names:
+        key = name.strip().lower()
+        matches = [i for i, day in enumerate(WEEKDAYS) if len(key) >= 3 and day.startswith(key)]
+        if not matches:
+            raise ValueError(f"Unknown day: {name}")
+        days.add(matches[0])
+    return days
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """Sort and coalesce overlapping or touching intervals; empty ones are dropped"""
+    merged: List[Interval] = []
+    for start, end in sorted(intervals):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def working_windows(start: datetime, end: datetime, tz: tzinfo, day_start: time, day_end: time,
+                    weekdays: Optional[Set[int]] = None) -> Iterator[Interval]:
+    """Working hours, in UTC, of each local day from start's date to end's date"""
+    if day_end <= day_start:
+        raise ValueError("Working day must end after it starts")
+    local_day = start.astimezone(tz).date()
+    last_day = end.astimezone(tz).date()
+    while local_day <= last_day:
+        if weekdays is None or local_day.weekday() in weekdays:
+            yield (datetime.combine(local_day, day_start, tzinfo=tz).astimezone(timezone.utc),
+                   datetime.combine(local_day, day_end, tzinfo=tz).astimezone(timezone.utc))
+        local_day += timedelta(days=1)
+
+
+def _align(moment: datetime, anchor: datetime, step: timedelta) -> datetime:
+    """First anchor + k * step at or after moment"""
+    if moment <= anchor:
+        return anchor
+    return anchor + -(-(moment - anchor) // step) * step
+
+
+def free_slots(busy: Sequence[Interval], windows: Iterable[Interval], start: datetime, end: datetime,
+               duration: timedelta, granularity: timedelta) -> Iterator[Interval]:
+    """Every slot of the given duration inside a window, within [start, end) and clear of busy.
+
+    ``busy`` must be merged (see ``merge_intervals``) and windows ascending.
+    Slot starts fall on granularity steps from each window's opening time,
+    e.g. 09:00, 09:30, 10:00 for 30 minutes.
+    """
+    i = 0
+    for open_at, close_at in windows:
+        cursor = _align(max(open_at, start), open_at, granularity)
+        limit = min(close_at, end)
+        while cursor + duration <= limit:
+            # Busy intervals that ended already can't conflict with any later slot
+            while i < len(busy) and busy[i][1] <= cursor:
+                i += 1
+            if i < len(busy) and busy[i][0] < cursor + duration:
+                cursor = _align(busy[i][1], open_at, granularity)
+                continue
+            yield (cursor, cursor + duration)
+            cursor += granularity
+
+
+def slot_conflicts(busy_by_key: Dict[str, Sequence[Interval]], windows: Iterable[Interval], start: datetime,
+                   end: datetime, duration: timedelta, granularity: timedelta) -> Iterator[Tuple[datetime, datetime, List[str]]]:
+    """Every candidate slot, as in ``free_slots``, with the keys whose busy intervals overlap it.
+
+    Each key's intervals must be merged; one pointer per key only moves
+    forward, so the cost is O(keys x slots + intervals).
+    """
+    pointers = {key: 0 for key in busy_by_key}
+    for open_at, close_at in windows:
+        cursor = _align(max(open_at, start), open_at, granularity)
+        limit = min(close_at, end)
+        while cursor + duration <= limit:
+            slot_end = cursor + duration
+            busy_keys = []
+            for key, busy in busy_by_key.items():
+                i = pointers[key]
+                while i < len(busy) and busy[i][1] <= cursor:
+                    i += 1
+                pointers[key] = i
+                if i < len(busy) and busy[i][0] < slot_end:
+                    busy_keys.append(key)
+            yield (cursor, slot_end, busy_keys)
+            cursor += granularity
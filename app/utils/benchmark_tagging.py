@@ -0,0 +1,80 @@
+"""
+Micro-benchmark for response tagging.
+
+Run with ``python -m app.utils.benchmark_tagging``. Compares the compiled
+matcher against the previous per-keyword substring scan on synthetic long
+responses, with the configured taxonomy and with larger ones
+(``--extra-keywords``), since the old scan's cost grows with every keyword
+added while the compiled matcher's does not.
+"""
+
+import argparse
+import random
+import time
+from typing import Callable, Dict, List
+
+from app.utils.tagging import TagMatcher, get_tag_matcher
+
+# Mostly non-keyword words, like a typical leasing answer
+VOCABULARY = ("the office space lease tenant broker square feet rent monthly building floor suite "
+              "available this located midtown parking amenities conference rooms kitchen renewal").split()
+KEYWORDS_PER_RESPONSE = 3
+
+
+def _legacy_tags(response: str, keywords: Dict[str, List[str]]) -> List[str]:
+    """The previous implementation: lowercase, then one substring scan per keyword"""
+    response_lower = response.lower()
+    tags = [tag for tag, words in keywords.items() if any(word in response_lower for word in words)]
+    return tags or ["general"]
+
+
+def _measure(name: str, tag: Callable[[str], List[str]], responses: List[str]) -> float:
+    started = time.perf_counter()
+    for response in responses:
+        tag(response)
+    elapsed = time.perf_counter() - started
+    total_mb = sum(len(r) for r in responses) / 1_000_000
+    print(f"  {name:<10} {len(responses) / elapsed:>10.0f} responses/s  {total_mb / elapsed:>8.1f} MB/s")
+    return elapsed
+
+
+def _taxonomy(extra_keywords: int, rng: random.Random) -> Dict[str, List[str]]:
+    matcher = get_tag_matcher()
+    taxonomy = {tag: [k for k, tags in matcher._tags_by_keyword.items() if tag in tags] for tag in matcher.tags}
+    for i in range(extra_keywords):
+        taxonomy[f"synthetic_{i % 20}"] = taxonomy.get(f"synthetic_{i % 20}", []) + [
+            "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(8))
+        ]
+    return taxonomy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark response tagging throughput")
+    parser.add_argument("--responses", type=int, default=1000)
+    parser.add_argument("--words", type=int, default=1000, help="Words per response")
+    parser.add_argument("--extra-keywords", type=int, nargs="*", default=[0, 500, 5000],
+                        help="Synthetic keywords added to the taxonomy, one run per value")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    matcher = get_tag_matcher()
+    keywords = list(matcher._tags_by_keyword)
+    responses = []
+    for _ in range(args.responses):
+        words = [rng.choice(VOCABULARY) for _ in range(args.words)]
+        for _ in range(KEYWORDS_PER_RESPONSE):
+            words[rng.randrange(len(words))] = rng.choice(keywords)
+        responses.append(" ".join(words))
+
+    print(f"{args.responses} responses x {args.words} words")
+    for extra in args.extra_keywords:
+        taxonomy = _taxonomy(extra, rng)
+        compiled_matcher = TagMatcher(taxonomy)
+        print(f"taxonomy with {sum(len(k) for k in taxonomy.values())} keywords")
+        legacy = _measure("legacy", lambda r: _legacy_tags(r, taxonomy), responses)
+        compiled = _measure("compiled", compiled_matcher.tag, responses)
+        print(f"  speedup    {legacy / compiled:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Per-user, per-day free/busy bitmaps.
+
+A UTC day is 96 fifteen-minute slots; bit i of a day's integer is set when
+the user has an event overlapping slot i. Events are rounded outward to slot
+boundaries, so a meeting ending at 10:10 keeps the user busy until 10:15.
+Checking a time range, combining attendees or adding an event are then
+bitwise operations on a handful of integers.
+"""
+
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from app.utils.availability import Interval
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+SLOT = timedelta(minutes=SLOT_MINUTES)
+FULL_DAY = (1 << SLOTS_PER_DAY) - 1
+
+
+def day_start(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+
+def days_between(start: datetime, end: datetime) -> List[date]:
+    """UTC days touched by [start, end); start and end must be aware"""
+    first = start.astimezone(timezone.utc).date()
+    last = (end.astimezone(timezone.utc) - timedelta(microseconds=1)).date()
+    return [first + timedelta(days=i) for i in range((last - first).days + 1)] if end > start else []
+
+
+def day_mask(day: date, start: datetime, end: datetime) -> int:
+    """Bits of the day's slots overlapping [start, end)"""
+    base = day_start(day)
+    first = max(0, (start - base) // SLOT)
+    last = min(SLOTS_PER_DAY, -(-(end - base) // SLOT))
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def mark_busy(bitmaps: Dict[date, int], start: datetime, end: datetime) -> None:
+    """OR [start, end) into the bitmaps of the days present in the dict"""
+    for day in days_between(start, end):
+        if day in bitmaps:
+            bitmaps[day] |= day_mask(day, start, end)
+
+
+def bitmap_intervals(day: date, bitmap: int) -> Iterator[Interval]:
+    """Runs of busy slots as (start, end) datetimes"""
+    base = day_start(day)
+    slot = 0
+    while bitmap:
+        # Skip free slots, then measure the run of busy ones
+        skip = (bitmap & -bitmap).bit_length() - 1
+        bitmap >>= skip
+        slot += skip
+        run = (~bitmap & (bitmap + 1)).bit_length() - 1
+        yield (base + slot * SLOT, base + (slot + run) * SLOT)
+        bitmap >>= run
+        slot += run
+
+
+def busy_intervals(bitmaps: Dict[date, int]) -> List[Interval]:
+    """Busy intervals across days, joined over midnight"""
+    intervals: List[Interval] = []
+    for day in sorted(bitmaps):
+        for start, end in bitmap_intervals(day, bitmaps[day]):
+            if intervals and intervals[-1][1] == start:
+                intervals[-1] = (intervals[-1][0], end)
+            else:
+                intervals.append((start, end))
+    return intervals
+
+
+def is_free(bitmaps: Dict[date, int], start: datetime, end: datetime) -> bool:
+    return all(not bitmaps.get(day, 0) & day_mask(day, start, end) for day in days_between(start, end))
+
+
+class FreeBusyCache:
+    """Bounded LRU of day bitmaps keyed by (user_id, UTC day).
+
+    Creating an event ORs it into the cached days it touches; updates and
+    deletes drop the affected days, since clearing bits could free time
+    another event still holds. As with the user context cache, loads that
+    raced with a write for the same user are not cached and the TTL bounds
+    staleness from writes made by other workers.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, date], Tuple[float, int]]" = OrderedDict()
+        self._loads: Dict[str, int] = {}  # In-flight loads per user
+        self._stale_loads: Set[str] = set()  # Users written to while a load was in flight
+        self.lookups = 0
+        self.hits = 0
+
+    def get(self, user_id: str, day: date) -> Optional[int]:
+        self.lookups += 1
+        entry = self._entries.get((user_id, day))
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.ttl_seconds:
+            del self._entries[(user_id, day)]
+            return None
+        self._entries.move_to_end((user_id, day))
+        self.hits += 1
+        return entry[1]
+
+    def begin_load(self, user_id: str) -> None:
+        self._loads[user_id] = self._loads.get(user_id, 0) + 1
+
+    def end_load(self, user_id: str) -> bool:
+        """Finish a load; True if no write for the user happened while it ran"""
+        remaining = self._loads.get(user_id, 0) - 1
+        valid = user_id not in self._stale_loads
+        if remaining > 0:
+            self._loads[user_id] = remaining
+        else:
+            self._loads.pop(user_id, None)
+            self._stale_loads.discard(user_id)
+        return valid
+
+    def put(self, user_id: str, day: date, bitmap: int) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[(user_id, day)] = (time.monotonic(), bitmap)
+        self._entries.move_to_end((user_id, day))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _written(self, user_id: str) -> None:
+        if user_id in self._loads:
+            self._stale_loads.add(user_id)
+
+    def add_busy(self, user_id: str, start: datetime, end: datetime) -> None:
+        """Write-through for a new event"""
+        self._written(user_id)
+        for day in days_between(start, end):
+            entry = self._entries.get((user_id, day))
+            if entry is not None:
+                self._entries[(user_id, day)] = (entry[0], entry[1] | day_mask(day, start, end))
+
+    def invalidate(self, user_id: str, days: Optional[List[date]] = None) -> None:
+        """Drop some of a user's days, or all of them when days is None"""
+        self._written(user_id)
+        if days is None:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+            return
+        for day in days:
+            self._entries.pop((user_id, day), None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else None
+        }
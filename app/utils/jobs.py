@@ -0,0 +1,96 @@
+import asyncio
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+MAX_FINISHED_JOBS = 100  # Finished jobs kept for status queries
+
+
+class Job:
+    """Status and progress of one background job"""
+
+    def __init__(self, kind: str, params: Optional[Dict[str, Any]] = None):
+        self.job_id = str(uuid.uuid4())
+        self.kind = kind
+        self.params = params or {}
+        self.status = "pending"
+        self.processed = 0
+        self.total: Optional[int] = None
+        self.result: Any = None
+        self.details: Dict[str, Any] = {}  # Live job-specific figures, e.g. throughput
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+
+    def advance(self, count: int) -> None:
+        self.processed += count
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "processed": self.processed,
+            "total": self.total,
+            "progress": round(min(1.0, self.processed / self.total), 4) if self.total else None,
+            "details": self.details,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+
+_jobs: "OrderedDict[str, Job]" = OrderedDict()
+_tasks: Set[asyncio.Task] = set()
+
+
+async def _run(job: Job, work: Callable[[Job], Awaitable[Any]]) -> None:
+    job.status = "running"
+    job.started_at = datetime.utcnow()
+    try:
+        job.result = await work(job)
+        job.status = "completed"
+    except asyncio.CancelledError:
+        job.status = "cancelled"
+        raise
+    except Exception as e:
+        print(f"Background job {job.kind} {job.job_id} failed: {e}")
+        job.error = str(e)
+        job.status = "failed"
+    finally:
+        job.finished_at = datetime.utcnow()
+
+
+def start_job(kind: str, work: Callable[[Job], Awaitable[Any]], params: Optional[Dict[str, Any]] = None) -> Job:
+    """Run work(job) in the background and return the job for status polling"""
+    job = Job(kind, params)
+    _jobs[job.job_id] = job
+    finished = [job_id for job_id, j in _jobs.items() if j.finished_at is not None]
+    for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del _jobs[job_id]
+
+    task = asyncio.create_task(_run(job, work))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    job = _jobs.get(job_id)
+    return job.to_dict() if job else None
+
+
+def list_jobs() -> List[Dict[str, Any]]:
+    return [job.to_dict() for job in reversed(_jobs.values())]
+
+
+async def cancel_jobs() -> None:
+    """Cancel running jobs on shutdown"""
+    for task in list(_tasks):
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
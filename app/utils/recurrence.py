@@ -0,0 +1,81 @@
+"""
+Recurring events.
+
+A recurring event is stored once: its first occurrence's start and end, an
+RFC 5545 RRULE such as ``FREQ=WEEKLY;BYDAY=MO,WE``, the time zone whose wall
+clock it repeats in (so a 9:00 meeting stays at 9:00 across DST) and the
+start times of cancelled occurrences. Occurrences are generated lazily and
+only within the window being read.
+"""
+
+import re
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Any, Dict, Iterator
+
+from dateutil.rrule import rrule, rrulestr
+from app.utils.availability import Interval, as_utc, get_timezone
+
+SERIES_OPEN_END = datetime(9999, 12, 31)  # recurrence_end of a series without UNTIL or COUNT
+MAX_SERIES_OCCURRENCES = 100000  # Longer finite series are treated as open-ended
+_UTC_UNTIL = re.compile(r"UNTIL=(\d{8}T\d{6})Z", re.IGNORECASE)
+_BOUNDED = re.compile(r"\b(UNTIL|COUNT)=", re.IGNORECASE)
+
+
+def _local(moment: datetime, tz: tzinfo) -> datetime:
+    """Naive wall-clock time in tz, which is what the rule repeats"""
+    return as_utc(moment).astimezone(tz).replace(tzinfo=None)
+
+
+def _utc(wall_clock: datetime, tz: tzinfo) -> datetime:
+    return wall_clock.replace(tzinfo=tz).astimezone(timezone.utc)
+
+
+def parse_rule(rule: str, start: datetime, tz: tzinfo) -> rrule:
+    """The rule's occurrences (as naive wall-clock times in tz) from start; raises ValueError"""
+    text = rule.strip()
+    if text.upper().startswith("RRULE:"):
+        text = text[len("RRULE:"):]
+    if not text or "\n" in text:
+        raise ValueError("Recurrence must be a single RRULE, e.g. FREQ=WEEKLY;BYDAY=MO")
+    # Occurrences are computed in wall-clock time, so a UTC UNTIL is converted to it
+    text = _UTC_UNTIL.sub(lambda m: "UNTIL=" + _local(
+        datetime.strptime(m.group(1), "%Y%m%dT%H%M%S"), tz).strftime("%Y%m%dT%H%M%S"), text)
+    try:
+        parsed = rrulestr(text, dtstart=_local(start, tz))
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"Invalid recurrence rule {rule!r}: {e}")
+    if not isinstance(parsed, rrule):
+        raise ValueError("Recurrence must be a single RRULE, e.g. FREQ=WEEKLY;BYDAY=MO")
+    return parsed
+
+
+def series_end(rule: str, start: datetime, end: datetime, tz: tzinfo) -> datetime:
+    """End of the last occurrence (UTC, naive like stored datetimes), or SERIES_OPEN_END"""
+    parsed = parse_rule(rule, start, tz)
+    if not _BOUNDED.search(rule):
+        return SERIES_OPEN_END
+    last = None
+    for count, last in enumerate(parsed, 1):
+        if count > MAX_SERIES_OCCURRENCES:
+            return SERIES_OPEN_END
+    if last is None:
+        return as_utc(end).replace(tzinfo=None)
+    return (_utc(last, tz) + (as_utc(end) - as_utc(start))).replace(tzinfo=None)
+
+
+def iter_occurrences(event: Dict[str, Any], start: datetime, end: datetime) -> Iterator[Interval]:
+    """(start, end) in UTC of each non-cancelled occurrence overlapping [start, end), in order"""
+    tz = get_timezone(event.get("recurrence_tz") or "UTC")
+    first_start, first_end = as_utc(event["start_time"]), as_utc(event["end_time"])
+    duration = first_end - first_start
+    parsed = parse_rule(event["recurrence"], first_start, tz)
+    cancelled = {as_utc(moment) for moment in event.get("exdates") or []}
+    start, end = as_utc(start), as_utc(end)
+    # A day of slack covers wall-clock shifts around DST changes; exact bounds are checked below
+    for wall_clock in parsed.xafter(_local(start - duration - timedelta(days=1), tz), inc=True):
+        occurrence = _utc(wall_clock, tz)
+        if occurrence >= end:
+            return
+        if occurrence + duration <= start or occurrence in cancelled:
+            continue
+        yield (occurrence, occurrence + duration)
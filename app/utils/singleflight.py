@@ -0,0 +1,96 @@
+import asyncio
+import copy
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+# Every SingleFlight registers itself here so /metrics can report savings
+_registry: Dict[str, "SingleFlight"] = {}
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one in-flight computation.
+
+    The first caller for a key starts the work as a task; callers arriving
+    while it runs await the same task instead of repeating it. With
+    ``ttl_seconds`` > 0 a successful result is also reused for that long after
+    it completes, which deduplicates bursts of identical requests.
+
+    Every caller gets its own copy of the result (``copy_result``, a deep
+    copy by default), so one caller mutating it can't corrupt what the
+    others see. Pass ``copy_result=None`` only for results that are never
+    mutated.
+    """
+
+    def __init__(self, name: str, ttl_seconds: float = 0.0,
+                 copy_result: Optional[Callable[[Any], Any]] = copy.deepcopy):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.copy_result = copy_result
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._recent: Dict[Hashable, Tuple[float, Any]] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.reused = 0
+        _registry[name] = self
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+
+        if self.ttl_seconds > 0:
+            recent = self._recent.get(key)
+            if recent is not None:
+                if time.monotonic() - recent[0] <= self.ttl_seconds:
+                    self.reused += 1
+                    return self._copy(recent[1])
+                del self._recent[key]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda finished: self._finish(key, finished))
+
+        # Shield so one caller being cancelled doesn't cancel the shared work
+        return self._copy(await asyncio.shield(task))
+
+    def _copy(self, result: Any) -> Any:
+        return self.copy_result(result) if self.copy_result is not None and result is not None else result
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled():
+            return
+        error = task.exception()  # Marks the exception retrieved even if every caller went away
+        if error is None and self.ttl_seconds > 0:
+            now = time.monotonic()
+            self._recent[key] = (now, task.result())
+            # Drop expired entries so the window doesn't grow without bound
+            expired = [k for k, (at, _) in self._recent.items() if now - at > self.ttl_seconds]
+            for k in expired:
+                del self._recent[k]
+
+    def stats(self) -> Dict[str, Any]:
+        saved = self.coalesced + self.reused
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "reused_within_window": self.reused,
+            "saved_ratio": round(saved / self.calls, 4) if self.calls else 0.0,
+            "in_flight": len(self._inflight),
+        }
+
+
+def normalize_key(text: str) -> str:
+    """Case- and whitespace-insensitive key for user text"""
+    return " ".join(text.lower().split())
+
+
+def get_singleflight_stats() -> Dict[str, Dict[str, Any]]:
+    """Work saved by every registered SingleFlight"""
+    return {name: flight.stats() for name, flight in _registry.items()}
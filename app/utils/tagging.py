@@ -1,26 +1,196 @@
-from typing import List
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Tag taxonomy: {"default_tag": ..., "tags": {tag: [keywords or phrases]}, "seed_phrases": {tag: [examples]}}
+TAG_TAXONOMY_PATH = os.getenv("TAG_TAXONOMY_PATH", os.path.join(os.path.dirname(__file__), "tag_taxonomy.json"))
+TAXONOMY_RELOAD_CHECK_SECONDS = 5  # How often the file's mtime is checked for hot reload
+
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+class TagMatcher:
+    """Keyword tagger compiled once from a taxonomy.
+
+    Text is tokenized into whole words in a single regex pass and each word
+    is looked up in a hash table, so "hi" no longer matches inside "this"
+    nor "new" inside "renewal", and the cost no longer grows with the number
+    of keywords. Multi-word phrases are matched by one combined word-boundary
+    regex, only when their first word occurs in the text.
+    """
+
+    def __init__(self, tags: Dict[str, List[str]], default_tag: Optional[str] = "general",
+                 seed_phrases: Optional[Dict[str, List[str]]] = None):
+        self.tags = list(tags)
+        self.default_tag = default_tag
+        # Example messages per tag, for the embedding-centroid classifier
+        self.seed_phrases = seed_phrases or {}
+        self._tags_by_keyword: Dict[str, List[str]] = {}
+        for tag, keywords in tags.items():
+            for keyword in keywords:
+                normalized = " ".join(WORD_PATTERN.findall(keyword.lower()))
+                if normalized and tag not in self._tags_by_keyword.get(normalized, []):
+                    self._tags_by_keyword.setdefault(normalized, []).append(tag)
+        phrases = sorted((k for k in self._tags_by_keyword if " " in k), key=len, reverse=True)
+        self._phrase_first_words = {phrase.split(" ", 1)[0] for phrase in phrases}
+        self._phrase_pattern = re.compile(
+            r"\b(?:" + "|".join(r"\W+".join(map(re.escape, p.split(" "))) for p in phrases) + r")\b",
+            re.IGNORECASE
+        ) if phrases else None
+
+    def _phrase_matches(self, text: str, words: Any) -> List[Tuple[str, Tuple[int, int]]]:
+        if self._phrase_pattern is None or self._phrase_first_words.isdisjoint(words):
+            return []
+        return [(" ".join(WORD_PATTERN.findall(m.group(0).lower())), m.span())
+                for m in self._phrase_pattern.finditer(text)]
+
+    def match(self, text: str) -> Dict[str, Dict[str, Any]]:
+        """Per tag: number of keyword matches and their (start, end) positions"""
+        found: List[Tuple[str, Tuple[int, int]]] = []
+        words = set()
+        for token in WORD_PATTERN.finditer(text):
+            word = token.group(0).lower()
+            words.add(word)
+            if word in self._tags_by_keyword:
+                found.append((word, token.span()))
+        found.extend(self._phrase_matches(text, words))
+        found.sort(key=lambda item: item[1])
+
+        matches: Dict[str, Dict[str, Any]] = {}
+        for keyword, span in found:
+            for tag in self._tags_by_keyword[keyword]:
+                entry = matches.setdefault(tag, {"count": 0, "positions": []})
+                entry["count"] += 1
+                entry["positions"].append(span)
+        return matches
+
+    def tag(self, text: str) -> List[str]:
+        """Matched tags in taxonomy order, or the default tag if none matched"""
+        words = set(WORD_PATTERN.findall(text.lower()))
+        keywords = words.intersection(self._tags_by_keyword)
+        keywords.update(keyword for keyword, _ in self._phrase_matches(text, words))
+        matched = {tag for keyword in keywords for tag in self._tags_by_keyword[keyword]}
+        tags = [tag for tag in self.tags if tag in matched]
+        if not tags and self.default_tag:
+            tags.append(self.default_tag)
+        return tags
+
+
+def load_taxonomy(path: str = TAG_TAXONOMY_PATH) -> TagMatcher:
+    with open(path, "r", encoding="utf-8") as f:
+        taxonomy = json.load(f)
+    return TagMatcher(taxonomy["tags"], taxonomy.get("default_tag", "general"), taxonomy.get("seed_phrases"))
+
+
+_matcher: Optional[TagMatcher] = None
+_matcher_mtime: Optional[float] = None
+_last_reload_check = 0.0
+_reload_lock = threading.Lock()
+
+
+def reload_taxonomy(path: str = TAG_TAXONOMY_PATH) -> TagMatcher:
+    """Rebuild the matcher from the taxonomy file; the old one keeps serving if it is invalid"""
+    global _matcher, _matcher_mtime
+    with _reload_lock:
+        try:
+            mtime = os.path.getmtime(path)
+            _matcher = load_taxonomy(path)
+            _matcher_mtime = mtime
+            print(f"Loaded tag taxonomy from {path}: {len(_matcher.tags)} tags")
+        except Exception as e:
+            if _matcher is None:
+                raise
+            print(f"Error reloading tag taxonomy, keeping the previous one: {e}")
+    return _matcher
+
+
+def get_tag_matcher() -> TagMatcher:
+    """Current matcher, reloaded when the taxonomy file changes"""
+    global _last_reload_check
+    now = time.monotonic()
+    if _matcher is None:
+        return reload_taxonomy()
+    if now - _last_reload_check >= TAXONOMY_RELOAD_CHECK_SECONDS:
+        _last_reload_check = now
+        try:
+            if os.path.getmtime(TAG_TAXONOMY_PATH) != _matcher_mtime:
+                reload_taxonomy()
+        except OSError as e:
+            print(f"Error checking tag taxonomy: {e}")
+    return _matcher
 
 
 def extract_tags_from_response(response: str) -> List[str]:
     """Extract tags from LLM response based on content analysis"""
-    tags = []
-    
-    # Simple keyword-based tagging
-    keywords = {
-        "technical": ["error", "bug", "code", "programming", "technical", "implementation"],
-        "billing": ["payment", "billing", "invoice", "cost", "price", "subscription"],
-        "support": ["help", "support", "assistance", "issue", "problem"],
-        "feature": ["feature", "functionality", "capability", "new", "enhancement"],
-        "general": ["hello", "hi", "thanks", "thank you", "goodbye"]
-    }
-    
-    response_lower = response.lower()
-    for tag, words in keywords.items():
-        if any(word in response_lower for word in words):
-            tags.append(tag)
-    
-    # Default tag if none found
-    if not tags:
-        tags.append("general")
-    
-    return tags
\ No newline at end of file
+    return get_tag_matcher().tag(response)
+
+
+def tag_batch(items: List[Tuple[Any, str]]) -> List[Tuple[Any, List[str]]]:
+    """Tag (key, text) pairs; module-level so process pool workers can run it"""
+    matcher = get_tag_matcher()
+    return [(key, matcher.tag(text)) for key, text in items]
+
+
+def match_tags(response: str) -> Dict[str, Dict[str, Any]]:
+    """Tag matches with counts and positions, for inspection and debugging"""
+    return get_tag_matcher().match(response)
+
+
+# Phrases that make up trivial conversational turns
+INTENT_PHRASES = {
+    "greeting": ["hello", "hi", "hey", "hiya", "good morning", "good afternoon", "good evening", "greetings"],
+    "thanks": ["thanks", "thank you", "thx", "ty", "appreciate it", "much appreciated", "cheers"],
+    "goodbye": ["goodbye", "bye", "bye bye", "see you", "see ya", "talk later", "have a good day", "good night"]
+}
+
+# Words that may accompany a trivial turn without making it a real question
+INTENT_FILLER = {"there", "so", "very", "much", "a", "lot", "again", "you", "all", "ok", "okay",
+                 "great", "the", "team", "everyone", "and", "for", "your", "help", "now", "oh"}
+
+# Signals that a question needs more reasoning than a simple lookup
+COMPLEXITY_KEYWORDS = ["compare", "comparison", "difference", "versus", "vs", "pros and cons",
+                       "explain", "why", "analyze", "analyse", "calculate", "recommend",
+                       "trade-off", "tradeoff", "strategy", "step by step", "evaluate"]
+
+MAX_TRIVIAL_WORDS = 8
+
+
+def classify_intent(message: str) -> Optional[str]:
+    """Return "greeting", "thanks" or "goodbye" for trivial turns, None otherwise.
+
+    A turn is trivial only if, once intent phrases and filler words are
+    removed, nothing is left, so "hi, what's the rent on suite 5?" is not.
+    """
+    words = re.findall(r"[a-z']+", message.lower())
+    if not words or len(words) > MAX_TRIVIAL_WORDS:
+        return None
+    text = " " + " ".join(words) + " "
+    matched = None
+    for intent, phrases in INTENT_PHRASES.items():
+        for phrase in sorted(phrases, key=len, reverse=True):
+            if f" {phrase} " in text:
+                text = text.replace(f" {phrase} ", " ")
+                matched = matched or intent
+    if matched is None:
+        return None
+    leftover = [word for word in text.split() if word not in INTENT_FILLER]
+    return matched if not leftover else None
+
+
+def estimate_complexity(message: str) -> str:
+    """Cheap heuristic: "complex" for long, multi-part or analytical questions"""
+    message_lower = message.lower()
+    words = re.findall(r"[a-z0-9']+", message_lower)
+    score = 0
+    if len(words) > 40:
+        score += 1
+    if message.count("?") > 1:
+        score += 1
+    keyword_hits = sum(1 for keyword in COMPLEXITY_KEYWORDS
+                       if re.search(rf"\b{re.escape(keyword)}\b", message_lower))
+    score += min(keyword_hits, 2)
+    return "complex" if score >= 2 else "simple"
@@ -0,0 +1,25 @@
+"""
+Pytest hooks for the test scripts.
+
+The services are coroutines backed by a single Motor client, and Motor binds
+to the first event loop it is used from, so every ``async def`` test runs on
+one shared loop instead of a fresh ``asyncio.run`` per test.
+"""
+
+import asyncio
+import inspect
+
+import pytest
+
+_loop = asyncio.new_event_loop()
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    """Run coroutine test functions on the shared event loop"""
+    if inspect.iscoroutinefunction(pyfuncitem.obj):
+        funcargs = pyfuncitem.funcargs
+        argnames = pyfuncitem._fixtureinfo.argnames
+        _loop.run_until_complete(pyfuncitem.obj(**{name: funcargs[name] for name in argnames}))
+        return True
+    return None
@@ -14,18 +14,18 @@ from app.services.rag import process_document, retrieve_context
 from app.database.database import test_connection
 from app.models.schemas import UserCreate
 
-def test_database_connection():
+async def test_database_connection():
     """Test database connection"""
     print("🔍 Testing Database Connection...")
     
-    if test_connection():
+    if await test_connection():
         print("✅ Database connection successful")
         return True
     else:
         print("❌ Database connection failed")
         return False
 
-def test_user_management():
+async def test_user_management():
     """Test user CRUD operations"""
     print("\n🧪 Testing User Management...")
     
@@ -39,12 +39,12 @@ def test_user_management():
     
     try:
         # Create user
-        result = create_user(test_user)
+        result = await create_user(test_user)
         user_id = result["user_id"]
         print(f"✅ User created with ID: {user_id}")
         
         # Get user
-        user = get_user(user_id)
+        user = await get_user(user_id)
         if user and user.get("name") == "Test User":
             print("✅ User retrieval successful")
         else:
@@ -52,7 +52,7 @@ def test_user_management():
             return False
         
         # Test conversation storage
-        conversation_id = save_conversation(
+        conversation_id = await save_conversation(
             user_id=user_id,
             session_id="test_session",
             message="Hello, this is a test message",
@@ -62,7 +62,7 @@ def test_user_management():
         print(f"✅ Conversation saved with ID: {conversation_id}")
         
         # Get conversations
-        conversations = get_conversations(user_id)
+        conversations = await get_conversations(user_id)
         if len(conversations) > 0:
             print(f"✅ Retrieved {len(conversations)} conversations")
         else:
@@ -70,11 +70,11 @@ def test_user_management():
             return False
         
         # Test user deletion
-        if delete_user(user_id):
+        if await delete_user(user_id):
             print("✅ User deletion successful")
             
             # Verify deletion
-            deleted_user = get_user(user_id)
+            deleted_user = await get_user(user_id)
             if deleted_user is None:
                 print("✅ User deletion verified")
                 return True
@@ -89,7 +89,7 @@ def test_user_management():
         print(f"❌ User management test failed: {e}")
         return False
 
-def test_calendar_functionality():
+async def test_calendar_functionality():
     """Test calendar operations"""
     print("\n🧪 Testing Calendar Functionality...")
     
@@ -100,11 +100,11 @@ def test_calendar_functionality():
             email=EmailStr("calendar@example.com"),
             company="Calendar Corp"
         )
-        user_result = create_user(test_user)
+        user_result = await create_user(test_user)
         user_id = user_result["user_id"]
         
         # Create event
-        event_result = calendar_service.create_event(
+        event_result = await calendar_service.create_event(
             user_id=user_id,
             title="Test Meeting",
             description="This is a test meeting",
@@ -116,7 +116,7 @@ def test_calendar_functionality():
             event_id = event_result["event_id"]
             
             # Get events
-            events = calendar_service.get_user_events(user_id)
+            events = await calendar_service.get_user_events(user_id)
             if len(events) > 0:
                 print(f"✅ Retrieved {len(events)} calendar events")
             else:
@@ -124,7 +124,7 @@ def test_calendar_functionality():
                 return False
             
             # Update event
-            update_result = calendar_service.update_event(
+            update_result = await calendar_service.update_event(
                 event_id, 
                 description="Updated test meeting description"
             )
@@ -135,7 +135,7 @@ def test_calendar_functionality():
                 return False
             
             # Delete event
-            delete_result = calendar_service.delete_event(event_id)
+            delete_result = await calendar_service.delete_event(event_id)
             if "error" not in delete_result:
                 print("✅ Calendar event deleted successfully")
             else:
@@ -143,7 +143,7 @@ def test_calendar_functionality():
                 return False
             
             # Clean up test user
-            delete_user(user_id)
+            await delete_user(user_id)
             return True
         else:
             print(f"❌ Calendar event creation failed: {event_result['error']}")
@@ -183,7 +183,7 @@ async def test_rag_functionality():
             print(f"   Failed chunks: {result['failed_chunks']}")
             
             # Test context retrieval
-            context = retrieve_context("test document")
+            context = await retrieve_context("test document")
             if context:
                 print(f"✅ Context retrieval successful ({len(context)} characters)")
             else:
@@ -198,13 +198,13 @@ async def test_rag_functionality():
         print(f"❌ RAG functionality test failed: {e}")
         return False
 
-def test_error_handling():
+async def test_error_handling():
     """Test error handling scenarios"""
     print("\n🧪 Testing Error Handling...")
     
     try:
         # Test getting non-existent user
-        non_existent_user = get_user("507f1f77bcf86cd799439011")
+        non_existent_user = await get_user("507f1f77bcf86cd799439011")
         if non_existent_user is None:
             print("✅ Non-existent user handling correct")
         else:
@@ -212,14 +212,14 @@ def test_error_handling():
             return False
         
         # Test deleting non-existent user
-        if not delete_user("507f1f77bcf86cd799439011"):
+        if not await delete_user("507f1f77bcf86cd799439011"):
             print("✅ Non-existent user deletion handling correct")
         else:
             print("❌ Non-existent user deletion handling incorrect")
             return False
         
         # Test calendar operations with invalid data
-        invalid_event_result = calendar_service.create_event(
+        invalid_event_result = await calendar_service.create_event(
             user_id="invalid_user_id",
             title=""
         )
@@ -252,12 +252,12 @@ async def main():
     
     try:
         # Run tests
-        test_results.append(("Database Connection", test_database_connection()))
+        test_results.append(("Database Connection", await test_database_connection()))
         
         if test_results[-1][1]:  # If database connection successful
-            test_results.append(("User Management", test_user_management()))
-            test_results.append(("Calendar Functionality", test_calendar_functionality()))
-            test_results.append(("Error Handling", test_error_handling()))
+            test_results.append(("User Management", await test_user_management()))
+            test_results.append(("Calendar Functionality", await test_calendar_functionality()))
+            test_results.append(("Error Handling", await test_error_handling()))
             
             if has_openai:
                 test_results.append(("RAG Functionality", await test_rag_functionality()))
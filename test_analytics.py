@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Test script for the analytics rollups written on save and rebuilt by the backfill
+"""
+
+import asyncio
+from datetime import datetime
+import app.services.analytics as analytics
+import app.services.crm_logic as crm_logic
+from app.services.crm_logic import UserContextCache
+
+
+def patch(module, **values):
+    originals = {name: getattr(module, name) for name in values}
+    for name, value in values.items():
+        setattr(module, name, value)
+    return originals
+
+
+def apply_update(doc, update):
+    """The update operators rollups use, with dotted paths for the histogram"""
+    for path, value in update.get("$inc", {}).items():
+        *parents, field = path.split(".")
+        target = doc
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[field] = target.get(field, 0) + value
+    for field, value in update.get("$max", {}).items():
+        doc[field] = max(doc.get(field, value), value)
+
+
+class FakeRollups:
+    """A rollup collection; rename moves its documents over the target's"""
+
+    def __init__(self, database, name):
+        self.database, self.name, self.docs = database, name, {}
+
+    async def bulk_write(self, operations, ordered=False):
+        for operation in operations:
+            rollup_id = operation._filter["_id"]
+            if rollup_id not in self.docs:
+                self.docs[rollup_id] = {"_id": rollup_id, **operation._doc.get("$setOnInsert", {})}
+            apply_update(self.docs[rollup_id], operation._doc)
+
+    async def drop(self):
+        self.docs = {}
+
+    async def create_indexes(self, indexes):
+        pass
+
+    async def rename(self, name, dropTarget=False):
+        self.database[name].docs, self.docs = self.docs, {}
+        await self.database.on_rename()
+
+
+class FakeDatabase(dict):
+    def __init__(self):
+        super().__init__()
+        self.on_rename = None
+
+    def __missing__(self, name):
+        self[name] = FakeRollups(self, name)
+        return self[name]
+
+
+class FakeCursor:
+    """Matches when iteration starts; on_next runs before each document, like writes landing mid-scan"""
+
+    def __init__(self, collection, query):
+        self.collection, self.query = collection, query
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        bounds = self.query["_id"]
+
+        async def iterate():
+            for doc in [doc for doc in self.collection.docs if all(
+                    (doc["_id"] <= bound) if op == "$lte" else (doc["_id"] > bound) for op, bound in bounds.items())]:
+                if self.collection.on_next:
+                    await self.collection.on_next()
+                yield doc
+        return iterate()
+
+
+class FakeConversations:
+    def __init__(self):
+        self.docs, self.on_next = [], None
+
+    async def insert_one(self, doc):
+        self.docs.append(doc)
+
+    async def count_documents(self, query):
+        return len([doc for doc in self.docs if doc["_id"] <= query["_id"]["$lte"]])
+
+    def find(self, query, projection=None):
+        return FakeCursor(self, query)
+
+
+class FakeWriter:
+    def __init__(self):
+        self.operations = []
+
+    async def enqueue(self, operation):
+        self.operations.append(operation)
+
+
+def fakes():
+    database = FakeDatabase()
+    return database, database["conversation_analytics"], FakeConversations()
+
+
+async def save(message, tags, response_time_ms=None, user_id="user-1"):
+    return await crm_logic.save_conversation(user_id, "session-1", message, "Answer.", tags, response_time_ms)
+
+
+async def test_rollup_operations():
+    """A save increments its day (with histogram), user and each distinct tag once"""
+    print("🧪 Testing Rollup Operations...")
+    writer = FakeWriter()
+    originals = patch(crm_logic, conversations_collection=FakeConversations(), analytics_writer=writer,
+                      conversation_writer=FakeWriter(), user_cache=UserContextCache(10, 60),
+                      CONVERSATION_WRITE_BEHIND=True, ANALYTICS_ENABLED=True)
+    try:
+        await save("Is parking included?", ["billing", "parking", "billing"], response_time_ms=420)
+        await save("Thanks", ["general"])
+    finally:
+        patch(crm_logic, **originals)
+    updates = [(op._filter["_id"], op._doc) for op in writer.operations]
+    day = f"day:{datetime.utcnow():%Y-%m-%d}"
+    (day_id, day_update), (user_id, user_update), *tags = updates[:4]
+    assert day_id == day and day_update["$inc"] == {
+        "count": 1, "response_time.count": 1, "response_time.total_ms": 420, "response_time.histogram.le_500": 1
+    }
+    assert day_update["$setOnInsert"] == {"type": "day", "bucket": day[4:]} and "$max" not in day_update
+    assert user_id == "user:user-1" and user_update["$inc"] == {"count": 1}
+    assert isinstance(user_update["$max"]["last_conversation_at"], datetime)
+    assert sorted((tag_id, update["$inc"]["count"]) for tag_id, update in tags) == [("tag:billing", 1), ("tag:parking", 1)]
+    # Without a response time only the count moves
+    assert updates[4] == (day, {"$inc": {"count": 1}, "$setOnInsert": {"type": "day", "bucket": day[4:]}})
+    assert updates[6][0] == "tag:general" and len(updates) == 7
+    assert all(op._upsert for op in writer.operations)
+    print("✅ Rollup increments built")
+
+
+async def test_backfill_with_live_writes():
+    """Exchanges saved while the rebuild scans, and after the swap, are all counted exactly once"""
+    print("\n🧪 Testing Backfill During Live Writes...")
+    database, rollups, conversations = fakes()
+    originals = patch(crm_logic, conversations_collection=conversations, analytics_collection=rollups,
+                      user_cache=UserContextCache(10, 60), CONVERSATION_WRITE_BEHIND=False, ANALYTICS_ENABLED=True)
+    analytics_originals = patch(analytics, conversations_collection=conversations, analytics_collection=rollups,
+                                BACKFILL_BATCH_SIZE=3)
+    try:
+        for i in range(7):
+            await save(f"Old question {i}", ["billing"] if i % 2 else ["parking"], response_time_ms=100 * i)
+        rollups.docs.clear()  # Rollups lost: only the backfill can restore the old exchanges
+
+        live = iter([("During scan", ["billing"], 300, "user-2"), ("During scan", ["zoning"], None, "user-1")])
+
+        async def saved_during_scan():
+            entry = next(live, None)
+            if entry:
+                await save(*entry)
+
+        async def saved_after_swap():
+            conversations.on_next = None
+            await save("After swap", ["billing"], 50, "user-3")
+
+        conversations.on_next, database.on_rename = saved_during_scan, saved_after_swap
+        result = await analytics.backfill_analytics()
+    finally:
+        patch(crm_logic, **originals)
+        patch(analytics, **analytics_originals)
+
+    assert result == {"conversations": 9, "saved_during_rebuild": 2}
+    assert len(conversations.docs) == 10
+    # The live collection matches rollups counted from scratch over every stored exchange
+    _, recount, _ = fakes()
+    await recount.bulk_write([op for doc in conversations.docs for op in analytics.rollup_operations(doc)])
+    assert rollups.docs == recount.docs
+    assert rollups.docs["tag:billing"]["count"] == 5 and rollups.docs[f"day:{datetime.utcnow():%Y-%m-%d}"]["count"] == 10
+    assert "conversation_analytics_rebuild" in database and database["conversation_analytics_rebuild"].docs == {}
+    print("✅ Rebuilt totals are exact")
+
+
+if __name__ == "__main__":
+    async def main():
+        await test_rollup_operations()
+        await test_backfill_with_live_writes()
+
+    asyncio.run(main())
+    print("\n🎉 All analytics tests passed!")
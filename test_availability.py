@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Test script for calendar availability (free-slot search)
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from app.utils.recurrence import iter_occurrences, series_end, SERIES_OPEN_END
+from app.utils.freebusy import FreeBusyCache, day_mask, busy_intervals, is_free
+from app.utils.availability import (
+    merge_intervals, working_windows, free_slots, slot_conflicts, parse_weekdays, parse_clock, get_timezone
+)
+
+UTC = timezone.utc
+
+
+def at(day: int, hour: int, minute: int = 0) -> datetime:
+    return datetime(2025, 6, day, hour, minute, tzinfo=UTC)
+
+
+def test_merge_intervals():
+    """Overlapping and touching intervals are coalesced after sorting"""
+    print("🧪 Testing Interval Merging...")
+    merged = merge_intervals([(at(2, 11), at(2, 12)), (at(2, 9), at(2, 10)), (at(2, 9, 30), at(2, 10, 30)),
+                              (at(2, 12), at(2, 13)), (at(2, 15), at(2, 15))])
+    assert merged == [(at(2, 9), at(2, 10, 30)), (at(2, 11), at(2, 13))]
+    print("✅ Intervals merged")
+
+
+def test_free_slots_sweep():
+    """Slots fall on granularity steps within working hours and skip busy time"""
+    print("\n🧪 Testing Free Slot Sweep...")
+    busy = merge_intervals([(at(2, 9, 10), at(2, 10)), (at(2, 11), at(2, 16, 45))])
+    windows = working_windows(at(2, 0), at(3, 23), UTC, parse_clock("09:00"), parse_clock("17:00"), {0})
+    slots = list(free_slots(busy, windows, at(2, 0), at(3, 23), timedelta(minutes=30), timedelta(minutes=30)))
+    # Monday only: 10:00 and 10:30 fit before 11:00, nothing fits 16:45-17:00
+    assert slots == [(at(2, 10), at(2, 10, 30)), (at(2, 10, 30), at(2, 11))]
+
+    # The search starts at "now", realigned to the next step
+    windows = working_windows(at(3, 13, 7), at(3, 23), UTC, parse_clock("09:00"), parse_clock("17:00"))
+    slots = list(free_slots([], windows, at(3, 13, 7), at(3, 23), timedelta(hours=1), timedelta(minutes=15)))
+    assert slots[0] == (at(3, 13, 15), at(3, 14, 15)) and slots[-1] == (at(3, 16), at(3, 17))
+    print("✅ Free slots found")
+
+
+def test_slot_conflicts():
+    """Each candidate slot lists the attendees who are busy then"""
+    print("\n🧪 Testing Attendee Conflicts...")
+    busy = {
+        "broker": merge_intervals([(at(2, 9), at(2, 10))]),
+        "associate": merge_intervals([(at(2, 9, 30), at(2, 11))]),
+        "client": []
+    }
+    windows = working_windows(at(2, 0), at(2, 23), UTC, parse_clock("09:00"), parse_clock("12:00"))
+    slots = list(slot_conflicts(busy, windows, at(2, 0), at(2, 23), timedelta(hours=1), timedelta(hours=1)))
+    assert [busy_keys for _, _, busy_keys in slots] == [["broker", "associate"], ["associate"], []]
+    print("✅ Conflicts listed per slot")
+
+
+def test_freebusy_bitmaps():
+    """Events round out to 15-minute slots and the cache is updated incrementally"""
+    print("\n🧪 Testing Free/Busy Bitmaps...")
+    day = at(2, 0).date()
+    bitmaps = {day: day_mask(day, at(2, 9, 5), at(2, 10, 10)) | day_mask(day, at(2, 10, 15), at(2, 11))}
+    assert busy_intervals(bitmaps) == [(at(2, 9), at(2, 11))]
+    assert not is_free(bitmaps, at(2, 10, 10), at(2, 10, 20)) and is_free(bitmaps, at(2, 11), at(2, 12))
+
+    cache = FreeBusyCache(max_entries=2, ttl_seconds=60)
+    cache.put("broker", day, bitmaps[day])
+    cache.add_busy("broker", at(2, 23), at(3, 1))  # Only the cached day is updated
+    assert busy_intervals({day: cache.get("broker", day)})[-1] == (at(2, 23), at(3, 0))
+    cache.begin_load("broker")
+    cache.invalidate("broker", [day])
+    assert cache.get("broker", day) is None and not cache.end_load("broker")
+    for hour in range(3):
+        cache.put("associate", at(2 + hour, 0).date(), 1)
+    assert cache.get("associate", day) is None and cache.stats()["entries"] == 2
+    print("✅ Bitmaps and cache behave")
+
+
+def test_recurring_occurrences():
+    """Series expand lazily in their own time zone and skip cancelled occurrences"""
+    print("\n🧪 Testing Recurring Events...")
+    tz = get_timezone("America/New_York")
+    standup = {
+        "start_time": datetime(2025, 3, 3, 14), "end_time": datetime(2025, 3, 3, 14, 30),
+        "recurrence": "FREQ=WEEKLY;BYDAY=MO", "recurrence_tz": "America/New_York",
+        "exdates": [datetime(2025, 3, 17, 13)]
+    }
+    occurrences = list(iter_occurrences(standup, datetime(2025, 3, 1), datetime(2025, 3, 25)))
+    # 9:00 New York is 14:00 UTC before the DST change on March 9 and 13:00 after
+    assert [start for start, _ in occurrences] == [
+        datetime(2025, 3, 3, 14, tzinfo=UTC), datetime(2025, 3, 10, 13, tzinfo=UTC), datetime(2025, 3, 24, 13, tzinfo=UTC)
+    ]
+    assert next(iter_occurrences(standup, datetime(2030, 1, 1), datetime(2030, 1, 8)))[0] == datetime(2030, 1, 7, 14, tzinfo=UTC)
+    assert series_end("FREQ=DAILY;COUNT=3", datetime(2025, 3, 3, 14), datetime(2025, 3, 3, 15), tz) == datetime(2025, 3, 5, 15)
+    assert series_end(standup["recurrence"], datetime(2025, 3, 3, 14), datetime(2025, 3, 3, 15), tz) == SERIES_OPEN_END
+    try:
+        series_end("FREQ=SOMETIMES", datetime(2025, 3, 3, 14), datetime(2025, 3, 3, 15), tz)
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    print("✅ Occurrences expanded")
+
+
+def test_time_zones_and_days():
+    """Working hours follow the local time zone, including DST"""
+    print("\n🧪 Testing Time Zones...")
+    tz = get_timezone("America/New_York")
+    windows = list(working_windows(at(2, 0), at(2, 23), tz, parse_clock("09:00"), parse_clock("17:00")))
+    assert windows[-1] == (at(2, 13), at(2, 21))  # EDT is UTC-4
+    winter = list(working_windows(datetime(2025, 1, 6, 12, tzinfo=UTC), datetime(2025, 1, 6, 13, tzinfo=UTC),
+                                  tz, parse_clock("09:00"), parse_clock("17:00")))
+    assert winter == [(datetime(2025, 1, 6, 14, tzinfo=UTC), datetime(2025, 1, 6, 22, tzinfo=UTC))]
+    assert parse_weekdays(["Monday", "tue", "FRIDAY"]) == {0, 1, 4}
+    for bad in (lambda: parse_weekdays(["mo"]), lambda: get_timezone("Mars/Olympus")):
+        try:
+            bad()
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
+    print("✅ Time zones and days handled")
+
+
+def test_partial_availability_ranking():
+    """Bucketed ranking matches sorting every slot, and stops once everyone-free slots fill the page"""
+    print("\n🧪 Testing Partial Availability Ranking...")
+    from app.services.calendar_service import CalendarService
+    service = CalendarService()
+    attendees = ["a", "b", "c"]
+    # Half-hour slots over three days, with a rotating set of busy attendees
+    slots = [(at(day, 9) + timedelta(minutes=30 * i), at(day, 9) + timedelta(minutes=30 * i + 30),
+              [user for j, user in enumerate(attendees) if (i + day + j) % (j + 2) == 0])
+             for day in (2, 3, 4) for i in range(16)]
+    for max_unavailable in (1, 2):
+        for limit, per_day in ((5, 1), (5, 2), (20, 0), (100, 3)):
+            expected = service._cap_per_day(
+                sorted((slot for slot in slots if len(slot[2]) <= max_unavailable), key=lambda s: (len(s[2]), s[0])),
+                UTC, limit, per_day)
+            ranked = service._rank_partial(iter(slots), max_unavailable, UTC, limit, per_day)
+            assert service._cap_per_day(ranked, UTC, limit, per_day) == expected, (max_unavailable, limit, per_day)
+
+    consumed = []
+
+    def counting(slots):
+        for slot in slots:
+            consumed.append(slot)
+            yield slot
+
+    free = [(at(2, 9) + timedelta(minutes=30 * i), at(2, 9, 30) + timedelta(minutes=30 * i), []) for i in range(1000)]
+    ranked = service._rank_partial(counting(free), 2, UTC, 5, 0)
+    assert len(ranked) == 5 and len(consumed) == 5
+    print("✅ Partial slots ranked without sorting the whole horizon")
+
+
+class FakeEvents:
+    """find() over stored events for the queried user(s); time filtering is left to the caller"""
+
+    def __init__(self, events):
+        self.events = events
+
+    def find(self, query, projection=None):
+        users = query["user_id"]["$in"] if isinstance(query["user_id"], dict) else [query["user_id"]]
+
+        async def matches():
+            for event in self.events:
+                if event["user_id"] in users:
+                    yield dict(event)
+        return matches()
+
+
+async def test_exact_conflicts():
+    """Bitmap hits are confirmed against exact times, so back-to-back events don't conflict"""
+    print("\n🧪 Testing Exact Conflict Checks...")
+    from app.services.calendar_service import CalendarService
+    service = CalendarService()
+    user_id = f"exact-conflicts-{time.time()}"  # Nothing cached for this user yet
+    service.collection = FakeEvents([
+        {"user_id": user_id, "start_time": at(2, 10), "end_time": at(2, 10, 10)},
+        {"user_id": user_id, "start_time": at(2, 14), "end_time": at(2, 15),
+         "recurrence": "FREQ=DAILY;COUNT=3", "recurrence_tz": "UTC", "exdates": []}
+    ])
+    assert await service.is_user_free(user_id, at(2, 10, 10), at(2, 10, 20))
+    assert not await service.is_user_free(user_id, at(2, 10, 5), at(2, 10, 20))
+    assert await service.is_user_free(user_id, at(3, 15), at(3, 15, 5))
+    assert not await service.is_user_free(user_id, at(4, 14, 55), at(4, 15, 5))
+    assert not await service._conflicts(user_id, {"start_time": at(2, 10, 10), "end_time": at(2, 10, 20)})
+
+    def daily(hour, minute):
+        start = at(2, hour, minute)
+        return {"start_time": start, "end_time": start + timedelta(minutes=10), "recurrence": "FREQ=DAILY;COUNT=3",
+                "recurrence_tz": "UTC", "exdates": [], "recurrence_end": start + timedelta(days=2, minutes=10)}
+
+    assert not await service._conflicts(user_id, daily(10, 10))  # Shares a 15-minute slot on the 2nd only
+    assert await service._conflicts(user_id, daily(14, 30))
+    print("✅ Only exact overlaps conflict")
+
+
+def test_many_events_performance():
+    """A year of dense calendar is swept quickly"""
+    print("\n🧪 Testing Free Slot Performance...")
+    start = at(2, 0)
+    events = [(start + timedelta(hours=h), start + timedelta(hours=h, minutes=45)) for h in range(0, 24 * 365, 2)]
+    began = time.perf_counter()
+    busy = merge_intervals(events)
+    windows = working_windows(start, start + timedelta(days=365), UTC, parse_clock("09:00"), parse_clock("17:00"))
+    slots = list(free_slots(busy, windows, start, start + timedelta(days=365),
+                            timedelta(minutes=60), timedelta(minutes=15)))
+    elapsed = time.perf_counter() - began
+    assert slots and all(slot_start.minute in (45, 0) for slot_start, _ in slots)
+    print(f"✅ {len(events)} events, {len(slots)} slots in {elapsed * 1000:.1f} ms")
+    assert elapsed < 2
+
+
+if __name__ == "__main__":
+    test_merge_intervals()
+    test_free_slots_sweep()
+    test_slot_conflicts()
+    test_freebusy_bitmaps()
+    test_recurring_occurrences()
+    test_time_zones_and_days()
+    test_partial_availability_ranking()
+    asyncio.run(test_exact_conflicts())
+    test_many_events_performance()
+    print("\n🎉 All availability tests passed!")
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Test script for streaming iCalendar imports
+"""
+
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import app.services.calendar_import as calendar_import
+from app.services.calendar_import import iter_unfolded, iter_vevents, import_ics
+from app.services.calendar_service import overlap_query
+from app.services.crm_bulk import iter_lines
+from app.utils.availability import get_timezone
+
+UTC = timezone.utc
+USER_ID = "ics-user"
+
+
+async def stream(*chunks: str):
+    for chunk in chunks:
+        yield chunk.encode("utf-8")
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+def calendar(*events: str) -> str:
+    return "BEGIN:VCALENDAR\r\nVERSION:2.0\r\n" + "".join(
+        "BEGIN:VEVENT\r\n" + event.strip().replace("\n", "\r\n") + "\r\nEND:VEVENT\r\n" for event in events
+    ) + "END:VCALENDAR\r\n"
+
+
+class FakeEvents:
+    """Stores inserted events; find answers the import's UID lookup the way Mongo would (naive datetimes)"""
+
+    def __init__(self):
+        self.docs, self.updates = [], []
+
+    def find(self, query, projection=None):
+        uids = set(query["ical_uid"]["$in"])
+
+        async def matches():
+            for doc in self.docs:
+                if doc["user_id"] == query["user_id"] and doc["ical_uid"] in uids:
+                    recurrence_id = doc["ical_recurrence_id"]
+                    yield {"ical_uid": doc["ical_uid"],
+                           "ical_recurrence_id": recurrence_id.replace(tzinfo=None) if recurrence_id else None}
+        return matches()
+
+    async def insert_many(self, docs, ordered=False):
+        self.docs.extend(docs)
+        return SimpleNamespace(inserted_ids=[None] * len(docs))
+
+    async def bulk_write(self, operations, ordered=False):
+        self.updates.extend(operations)
+
+
+async def run_import(body: str, events: FakeEvents, tz_name: str = "UTC"):
+    original = calendar_import.calendar_events_collection
+    calendar_import.calendar_events_collection = events
+    try:
+        return await import_ics(iter_lines(stream(body)), USER_ID, get_timezone(tz_name))
+    finally:
+        calendar_import.calendar_events_collection = original
+
+
+async def test_unfolding_and_alarms():
+    """Folded lines are joined and properties inside VALARM don't leak into the event"""
+    print("🧪 Testing Line Folding and Alarms...")
+    body = calendar("""
+UID:folded
+SUMMARY:Showing at 12 Main St\\, unit 4 with a title long enough to be
+  folded\\nsecond line
+DTSTART:20250310T140000Z
+BEGIN:VALARM
+TRIGGER:-PT15M
+SUMMARY:Alarm text
+DESCRIPTION:Reminder
+END:VALARM
+DURATION:PT45M
+""")
+    lines = await collect(iter_unfolded(iter_lines(stream(body[:90], body[90:]))))
+    assert "SUMMARY:Showing at 12 Main St\\, unit 4 with a title long enough to be folded\\nsecond line" in lines
+    [(index, props)] = await collect(iter_vevents(iter_lines(stream(body))))
+    assert index == 1 and len(props["SUMMARY"]) == 1 and "DESCRIPTION" not in props and "TRIGGER" not in props
+
+    events = FakeEvents()
+    result = await run_import(body, events)
+    assert result["imported"] == 1
+    doc = events.docs[0]
+    assert doc["title"] == "Showing at 12 Main St, unit 4 with a title long enough to be folded\nsecond line"
+    assert doc["end_time"] == datetime(2025, 3, 10, 14, 45, tzinfo=UTC)
+    print("✅ Lines unfolded, alarms skipped")
+
+
+async def test_time_zones():
+    """TZID (IANA, Windows, path-style), trailing Z and floating times all become UTC"""
+    print("\n🧪 Testing Time Zones...")
+    body = calendar(
+        'UID:iana\nDTSTART;TZID="America/New_York":20250310T090000\nDURATION:PT1H',
+        "UID:windows\nDTSTART;TZID=Pacific Standard Time:20250110T090000\nDURATION:PT1H",
+        "UID:path\nDTSTART;TZID=/mozilla.org/20050126_1/Europe/London:20250710T090000\nDURATION:PT1H",
+        "UID:utc\nDTSTART:20250310T090000Z\nDTEND:20250310T100000Z",
+        "UID:floating\nDTSTART:20250310T090000\nDURATION:PT1H",
+        "UID:unknown\nDTSTART;TZID=Mars/Base:20250310T090000\nDURATION:PT1H"
+    )
+    events = FakeEvents()
+    result = await run_import(body, events, tz_name="Asia/Tokyo")
+    starts = {doc["ical_uid"]: doc["start_time"] for doc in events.docs}
+    assert starts["iana"] == datetime(2025, 3, 10, 13, tzinfo=UTC)  # EDT started on the 9th
+    assert starts["windows"] == datetime(2025, 1, 10, 17, tzinfo=UTC)
+    assert starts["path"] == datetime(2025, 7, 10, 8, tzinfo=UTC)
+    assert starts["utc"] == datetime(2025, 3, 10, 9, tzinfo=UTC)
+    assert starts["floating"] == starts["unknown"] == datetime(2025, 3, 10, 0, tzinfo=UTC)
+    assert result["unknown_timezones"] == ["Mars/Base"]
+    print("✅ Times converted to UTC")
+
+
+async def test_recurrence_overrides():
+    """EXDATEs are kept on the series and RECURRENCE-ID overrides cancel the occurrence they replace"""
+    print("\n🧪 Testing EXDATE and RECURRENCE-ID...")
+    body = calendar("""
+UID:weekly
+RECURRENCE-ID;TZID=America/New_York:20250324T090000
+SUMMARY:Team (moved)
+DTSTART;TZID=America/New_York:20250324T110000
+DTEND;TZID=America/New_York:20250324T113000
+""", """
+UID:weekly
+SUMMARY:Team
+DTSTART;TZID=America/New_York:20250303T090000
+DTEND;TZID=America/New_York:20250303T093000
+RRULE:FREQ=WEEKLY;BYDAY=MO
+EXDATE;TZID=America/New_York:20250310T090000,20250317T090000
+""", "UID:gone\nSTATUS:CANCELLED\nDTSTART:20250310T140000Z", "UID:broken\nSUMMARY:No start")
+    events = FakeEvents()
+    result = await run_import(body, events)
+    assert {k: result[k] for k in ("received", "imported", "cancelled", "failed")} == {
+        "received": 4, "imported": 2, "cancelled": 1, "failed": 1
+    }
+    override, series = events.docs
+    assert override["ical_recurrence_id"] == datetime(2025, 3, 24, 13, tzinfo=UTC) and "recurrence" not in override
+    assert series["recurrence"] == "FREQ=WEEKLY;BYDAY=MO" and series["recurrence_tz"] == "America/New_York"
+    assert series["exdates"] == [datetime(2025, 3, 10, 13, tzinfo=UTC), datetime(2025, 3, 17, 13, tzinfo=UTC)]
+    # Applied after every batch, so an override may come before its series in the file
+    [update] = events.updates
+    assert update._filter["ical_uid"] == "weekly" and update._filter["ical_recurrence_id"] is None
+    assert update._doc == {"$addToSet": {"exdates": datetime(2025, 3, 24, 13, tzinfo=UTC)}}
+    print("✅ Series exceptions recorded")
+
+
+async def test_reimport_dedupe():
+    """Re-importing a file skips every stored event; repeats within a file and empty UIDs are handled"""
+    print("\n🧪 Testing Re-import...")
+    body = calendar(
+        "UID:a@example.com\nDTSTART:20250310T090000Z\nDURATION:PT1H",
+        "UID:a@example.com\nDTSTART:20250310T090000Z\nDURATION:PT1H",
+        "UID:series\nDTSTART:20250303T090000Z\nDURATION:PT1H\nRRULE:FREQ=DAILY;COUNT=5",
+        "UID:series\nRECURRENCE-ID:20250304T090000Z\nDTSTART:20250304T100000Z\nDURATION:PT1H",
+        "UID:\nSUMMARY:Blank UID\nDTSTART:20250311T090000Z\nDURATION:PT1H"
+    )
+    events = FakeEvents()
+    first = await run_import(body, events)
+    assert first["imported"] == 4 and first["duplicates"] == 1
+    assert events.docs[-1]["ical_uid"] is None  # Kept out of the unique (user, UID) index
+    original_batch = calendar_import.CALENDAR_IMPORT_BATCH_SIZE
+    calendar_import.CALENDAR_IMPORT_BATCH_SIZE = 2
+    try:
+        second = await run_import(body, events)
+    finally:
+        calendar_import.CALENDAR_IMPORT_BATCH_SIZE = original_batch
+    # Events without a UID can't be recognised, so only they are imported again
+    assert second["imported"] == 1 and second["duplicates"] == 4 and len(events.docs) == 5
+    print("✅ Re-import skipped stored events")
+
+
+async def test_transparent_events():
+    """Free-time entries and unmarked all-day events are stored but never block availability"""
+    print("\n🧪 Testing TRANSP...")
+    body = calendar(
+        "UID:busy\nDTSTART:20250310T090000Z\nDURATION:PT1H",
+        "UID:free\nDTSTART:20250310T090000Z\nDURATION:PT1H\nTRANSP:TRANSPARENT",
+        "UID:holiday\nDTSTART;VALUE=DATE:20250311",
+        "UID:offsite\nDTSTART;VALUE=DATE:20250312\nTRANSP:OPAQUE"
+    )
+    events = FakeEvents()
+    await run_import(body, events)
+    transparent = {doc["ical_uid"]: doc.get("transparent", False) for doc in events.docs}
+    assert transparent == {"busy": False, "free": True, "holiday": True, "offsite": False}
+    holiday = events.docs[2]
+    assert holiday["end_time"] - holiday["start_time"] == datetime(2025, 3, 12) - datetime(2025, 3, 11)
+    assert overlap_query(datetime(2025, 3, 10, tzinfo=UTC), datetime(2025, 3, 13, tzinfo=UTC))["transparent"] == {"$ne": True}
+    print("✅ Transparent events don't count as busy")
+
+
+if __name__ == "__main__":
+    async def main():
+        await test_unfolding_and_alarms()
+        await test_time_zones()
+        await test_recurrence_overrides()
+        await test_reimport_dedupe()
+        await test_transparent_events()
+
+    asyncio.run(main())
+    print("\n🎉 All calendar import tests passed!")
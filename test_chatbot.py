@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Test script for the chat pipeline around the LLM call: semantic cache and streaming
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+from types import SimpleNamespace
+import app.services.chatbot as chatbot
+from app.models.schemas import ChatRequest
+from app.routes.chat import chat_stream
+
+USER_ID, SESSION_ID = "user-1", "session-1"
+PREPARED = {"messages": [{"role": "user", "content": "Is parking included?"}], "context_used": ["Parking FAQ"],
+            "user_info": None, "query_embedding": [0.1, 0.2], "chunk_ids": ("chunk-1",)}
+
+
+def patch(**values):
+    originals = {name: getattr(chatbot, name) for name in values}
+    for name, value in values.items():
+        setattr(chatbot, name, value)
+    return originals
+
+
+def completion(text):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+def delta(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+def parse_sse(chunk):
+    """(event, data) from one server-sent event, checking its framing"""
+    assert chunk.endswith("\n\n") and chunk.count("\n") == 3, repr(chunk)
+    event_line, data_line = chunk[:-2].split("\n")
+    assert event_line.startswith("event: ") and data_line.startswith("data: ")
+    return event_line[len("event: "):], json.loads(data_line[len("data: "):])
+
+
+def chat_stubs(saved, **overrides):
+    """Stubs for everything around the LLM call; saved collects the stored answers"""
+    async def prepare(user_id, session_id, message):
+        return dict(PREPARED)
+
+    async def finalize(user_id, session_id, message, answer, response_time_ms=None, query_embedding=None):
+        saved.append(answer)
+        return ["general"], "conversation-1"
+
+    async def corpus_version():
+        return 1
+
+    stubs = dict(route_message=lambda message: ("small", "test-model"), _prepare_chat=prepare,
+                 _finalize_chat=finalize, get_corpus_version=corpus_version,
+                 semantic_cache=chatbot.SemanticCache(0.95, 10))
+    stubs.update(overrides)
+    return stubs
+
+
+async def test_cache_store_failure_keeps_answer():
+    """A failing cache store is logged; the LLM's answer is still returned and saved"""
+    print("🧪 Testing Cache Store Failures...")
+    saved = []
+
+    async def broken_corpus_version():
+        raise RuntimeError("app_state unavailable")
+
+    calls = []
+
+    async def answer(**kwargs):
+        calls.append(kwargs)
+        return completion("Parking is included.")
+
+    originals = patch(**chat_stubs(saved, get_corpus_version=broken_corpus_version, chat_completion=answer))
+    try:
+        result = await chatbot.get_chat_response(USER_ID, "Is parking included?", SESSION_ID)
+    finally:
+        patch(**originals)
+    assert result["response"] == "Parking is included." and saved == ["Parking is included."]
+    assert not calls[0].get("dedupe")  # Personalized turns are never coalesced
+    print("✅ Answer kept when caching fails")
+
+
+async def test_stream_cache_store_failure_keeps_answer():
+    """Streamed tokens are followed by done, not error, when the cache store fails"""
+    print("\n🧪 Testing Streamed Cache Store Failures...")
+    saved = []
+    cache = chatbot.SemanticCache(0.95, 10)
+
+    def broken_store(*args, **kwargs):
+        raise RuntimeError("cache full")
+
+    cache.store = broken_store
+
+    async def tokens():
+        for text in ("Parking ", "is included."):
+            yield delta(text)
+
+    async def stream(**kwargs):
+        return tokens()
+
+    originals = patch(**chat_stubs(saved, semantic_cache=cache, stream_chat_completion=stream))
+    try:
+        events = [event async for event in chatbot.stream_chat_response(USER_ID, "Is parking included?", SESSION_ID)]
+    finally:
+        patch(**originals)
+    assert [event.split("\n", 1)[0] for event in events] == [
+        "event: metadata", "event: token", "event: token", "event: done"
+    ]
+    assert saved == ["Parking is included."]
+    print("✅ Stream finished cleanly")
+
+
+def test_format_sse():
+    """One event line, one JSON data line and a blank line"""
+    print("\n🧪 Testing SSE Framing...")
+    assert chatbot.format_sse("token", {"content": "Hi\nthere"}) == 'event: token\ndata: {"content": "Hi\\nthere"}\n\n'
+    assert parse_sse(chatbot.format_sse("done", {"tags": ["general"]})) == ("done", {"tags": ["general"]})
+    print("✅ Events framed")
+
+
+async def stream_route(saved, chunks, fail_after=None):
+    """Events from /chat/stream with a stubbed LLM stream; fail_after raises after that many chunks"""
+    calls = []
+
+    async def tokens():
+        for i, chunk in enumerate(chunks):
+            if i == fail_after:
+                raise RuntimeError("upstream closed")
+            yield chunk
+
+    async def stream(**kwargs):
+        calls.append(kwargs)
+        return tokens()
+
+    originals = patch(**chat_stubs(saved, stream_chat_completion=stream))
+    try:
+        response = await chat_stream(ChatRequest(user_id=USER_ID, message="Is parking included?", session_id=SESSION_ID))
+        assert response.media_type == "text/event-stream" and response.headers["cache-control"] == "no-cache"
+        events = [parse_sse(chunk) async for chunk in response.body_iterator]
+    finally:
+        patch(**originals)
+    return events, calls
+
+
+async def test_stream_route_events():
+    """/chat/stream sends metadata, one token per non-empty delta, then done, and no error"""
+    print("\n🧪 Testing Streamed Chat Events...")
+    saved = []
+    chunks = [delta("Parking "), SimpleNamespace(choices=[]), delta(""), delta("is "), delta("included.")]
+    events, calls = await stream_route(saved, chunks)
+    assert [event for event, _ in events] == ["metadata", "token", "token", "token", "done"]
+    metadata, done = events[0][1], events[-1][1]
+    assert metadata == {"session_id": SESSION_ID, "context_used": ["Parking FAQ"], "route": "small"}
+    assert "".join(data["content"] for event, data in events if event == "token") == "Parking is included."
+    assert saved == ["Parking is included."]
+    assert done["conversation_id"] == "conversation-1" and done["tags"] == ["general"]
+    assert done["session_id"] == SESSION_ID and done["cached"] is False and done["route"] == "small"
+    assert done["time_to_first_token_ms"] <= done["response_time_ms"]
+    assert calls == [{"model": "test-model", "messages": PREPARED["messages"],
+                      "temperature": chatbot.CHAT_TEMPERATURE, "max_tokens": chatbot.CHAT_MAX_TOKENS}]
+
+    # A failure mid-stream is an error event; the partial exchange is still stored and closed with done
+    saved = []
+    events, _ = await stream_route(saved, [delta("Parking "), delta("is included.")], fail_after=1)
+    assert [event for event, _ in events] == ["metadata", "token", "error", "done"]
+    assert "upstream closed" in events[2][1]["detail"] and saved[0].startswith("Parking I apologize")
+    print("✅ Events sent in order")
+
+
+async def test_stream_metrics():
+    """Streamed turns feed /metrics counters instead of printing per-request lines"""
+    print("\n🧪 Testing Chat Metrics...")
+    before = chatbot.get_routing_stats()["stream_time_to_first_token"]["samples"]
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        await stream_route([], [delta("Parking is included.")])
+    assert "Chat stream" not in output.getvalue() and USER_ID not in output.getvalue()
+    assert chatbot.get_routing_stats()["stream_time_to_first_token"]["samples"] == before + 1
+
+    originals = patch(_prompt_totals={}, _prompt_count=0)
+    try:
+        assert chatbot.get_prompt_stats() == {"prompts": 0, "budget": chatbot.PROMPT_TOKEN_BUDGET, "avg": {}}
+        chatbot._record_prompt({"total_tokens": 300, "chunks_used": 2, "budget": 3000})
+        chatbot._record_prompt({"total_tokens": 500, "chunks_used": 1, "budget": 3000})
+        stats = chatbot.get_prompt_stats()
+        assert stats["prompts"] == 2 and stats["avg"] == {"total_tokens": 400.0, "chunks_used": 1.5}
+    finally:
+        patch(**originals)
+    print("✅ Metrics recorded")
+
+
+if __name__ == "__main__":
+    async def main():
+        await test_cache_store_failure_keeps_answer()
+        await test_stream_cache_store_failure_keeps_answer()
+        test_format_sse()
+        await test_stream_route_events()
+        await test_stream_metrics()
+
+    asyncio.run(main())
+    print("\n🎉 All chat pipeline tests passed!")
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Test script for keyset pagination and streaming of a user's conversations
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+import app.services.crm_logic as crm_logic
+from app.services.crm_logic import _conversation_query, get_conversation_page, iter_conversations
+
+BASE = datetime(2025, 6, 2, 9)
+OPS = {"$lt": lambda a, b: a < b, "$lte": lambda a, b: a <= b,
+       "$gt": lambda a, b: a > b, "$gte": lambda a, b: a >= b}
+
+
+def matches(doc, query):
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(doc, branch) for branch in condition):
+                return False
+        elif isinstance(condition, dict):
+            if not all(OPS[op](doc[key], bound) for op, bound in condition.items()):
+                return False
+        elif key == "tags":
+            if condition not in doc.get("tags", []):
+                return False
+        elif doc.get(key) != condition:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, docs, projection):
+        self.docs, self.projection = docs, projection
+
+    def sort(self, keys):
+        for key, direction in reversed(keys):
+            self.docs.sort(key=lambda doc: doc[key], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def _project(self):
+        return [{k: v for k, v in doc.items() if k not in self.projection} for doc in self.docs]
+
+    async def to_list(self, length):
+        return self._project()[:length]
+
+    def __aiter__(self):
+        async def iterate():
+            for doc in self._project():
+                yield doc
+        return iterate()
+
+
+class FakeConversations:
+    def __init__(self, docs):
+        self.docs, self.queries = docs, []
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        return FakeCursor([doc for doc in self.docs if matches(doc, query)], projection or {})
+
+
+def conversation(minute, user_id="user-1", session_id="session-1", tags=None):
+    oid = ObjectId()
+    return {"_id": oid, "conversation_id": str(oid), "user_id": user_id, "session_id": session_id,
+            "timestamp": BASE + timedelta(minutes=minute), "message": f"Question at {minute}", "tags": tags or []}
+
+
+def order(docs, descending=False):
+    mine = [doc for doc in docs if doc["user_id"] == "user-1"]
+    return [doc["conversation_id"] for doc in sorted(mine, key=lambda doc: (doc["timestamp"], doc["_id"]),
+                                                      reverse=descending)]
+
+
+async def pages(conversations, limit, **kwargs):
+    """Follow next_cursor to the end; returns the ids seen and the size of each page"""
+    seen, sizes, cursor = [], [], None
+    original = crm_logic.conversations_collection
+    crm_logic.conversations_collection = conversations
+    try:
+        while True:
+            page = await get_conversation_page("user-1", cursor=cursor, limit=limit, **kwargs)
+            seen += [conv["conversation_id"] for conv in page["conversations"]]
+            sizes.append(len(page["conversations"]))
+            cursor = page["next_cursor"]
+            if not cursor:
+                return seen, sizes
+    finally:
+        crm_logic.conversations_collection = original
+
+
+def test_query():
+    """Filters and the keyset condition on (timestamp, _id) in both directions"""
+    print("🧪 Testing Conversation Query...")
+    start, end = datetime(2025, 6, 1), datetime(2025, 7, 1)
+    assert _conversation_query("user-1", "session-1", "billing", start, end) == {
+        "user_id": "user-1", "session_id": "session-1", "tags": "billing",
+        "timestamp": {"$gte": start, "$lt": end}
+    }
+    last = conversation(5)
+    cursor = crm_logic.encode_conversation_cursor(last)
+    assert crm_logic.decode_conversation_cursor(cursor) == (last["timestamp"], last["_id"])
+    query = _conversation_query("user-1", start=start, after=cursor)
+    assert query["timestamp"] == {"$gte": last["timestamp"]} and query["$or"] == [
+        {"timestamp": {"$gt": last["timestamp"]}}, {"timestamp": last["timestamp"], "_id": {"$gt": last["_id"]}}
+    ]
+    query = _conversation_query("user-1", end=end, after=cursor, descending=True)
+    assert query["timestamp"] == {"$lt": end, "$lte": last["timestamp"]}
+    assert query["$or"][1]["_id"] == {"$lt": last["_id"]}
+    try:
+        _conversation_query("user-1", after="not-a-cursor")
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    print("✅ Query built")
+
+
+async def test_pages_with_ties():
+    """Pages of limit follow (timestamp, _id) through timestamp ties without duplicates or gaps"""
+    print("\n🧪 Testing Conversation Pages...")
+    # Runs of up to three exchanges share a timestamp, so ties straddle page boundaries
+    docs = [conversation(i // 3) for i in range(17)] + [conversation(0, user_id="user-2")]
+    conversations = FakeConversations(docs)
+    for descending in (False, True):
+        seen, sizes = await pages(conversations, 4, descending=descending)
+        assert seen == order(docs, descending) and sizes == [4, 4, 4, 4, 1]
+
+    # limit + 1 detects the end: an exactly full last page has no next cursor
+    seen, sizes = await pages(FakeConversations(docs[:8]), 4)
+    assert len(seen) == 8 and sizes == [4, 4]
+    seen, sizes = await pages(FakeConversations([]), 4)
+    assert seen == [] and sizes == [0]
+    print("✅ Paged through every conversation once")
+
+
+async def test_page_limits_and_filters():
+    """The limit is clamped, and filters hold on every page"""
+    print("\n🧪 Testing Page Limits...")
+    docs = [conversation(i, tags=["billing"] if i % 2 else []) for i in range(10)]
+    conversations = FakeConversations(docs)
+    original = crm_logic.conversations_collection
+    crm_logic.conversations_collection = conversations
+    try:
+        page = await get_conversation_page("user-1", limit=0)
+        assert len(page["conversations"]) == 1 and page["next_cursor"]
+        assert "_id" not in page["conversations"][0] and "user_id" not in page["conversations"][0]
+    finally:
+        crm_logic.conversations_collection = original
+    seen, sizes = await pages(conversations, 2, tag="billing")
+    assert seen == order([doc for doc in docs if doc["tags"]]) and sizes == [2, 2, 1]
+    print("✅ Limits and filters applied")
+
+
+async def test_iter_conversations():
+    """Streaming yields the same order as paging, newest first when descending"""
+    print("\n🧪 Testing Conversation Streaming...")
+    docs = [conversation(i // 2) for i in range(9)] + [conversation(1, session_id="session-2")]
+    original = crm_logic.conversations_collection
+    crm_logic.conversations_collection = FakeConversations(docs)
+    try:
+        streamed = [conv["conversation_id"] async for conv in iter_conversations("user-1", descending=True)]
+        session = [conv["conversation_id"] async for conv in iter_conversations("user-1", session_id="session-2")]
+    finally:
+        crm_logic.conversations_collection = original
+    assert streamed == order(docs, descending=True) and session == [docs[-1]["conversation_id"]]
+    print("✅ Streamed in order")
+
+
+if __name__ == "__main__":
+    test_query()
+
+    async def main():
+        await test_pages_with_ties()
+        await test_page_limits_and_filters()
+        await test_iter_conversations()
+
+    asyncio.run(main())
+    print("\n🎉 All conversation paging tests passed!")
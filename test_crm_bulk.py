@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test script for streamed bulk user import parsing
+"""
+
+import asyncio
+import app.services.crm_bulk as crm_bulk
+from app.services.crm_bulk import iter_lines, iter_ndjson_rows, iter_csv_rows, import_users
+
+
+async def stream(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+class FakeUsers:
+    """Records inserted documents; find returns the emails given as already existing"""
+
+    def __init__(self, existing_emails=()):
+        self.existing_emails = set(existing_emails)
+        self.inserted = []
+
+    def find(self, query, projection=None):
+        async def matches():
+            for email in query["email"]["$in"]:
+                if email in self.existing_emails:
+                    yield {"email": email}
+        return matches()
+
+    async def insert_many(self, docs, ordered=False):
+        self.inserted.extend(docs)
+
+        class Result:
+            inserted_ids = [None] * len(docs)
+        return Result()
+
+
+async def test_line_splitting():
+    """Lines split across chunks, CRLF endings and multi-byte characters split mid-sequence"""
+    print("🧪 Testing Streamed Line Splitting...")
+    body = "first\r\nséc".encode("utf-8")
+    lines = await collect(iter_lines(stream(body[:9], body[9:], b"ond\nthird")))
+    assert lines == ["first", "sécond", "third"]
+    print("✅ Lines split correctly")
+
+
+async def test_ndjson_rows():
+    """Blank lines are skipped and bad rows are reported by row number"""
+    print("\n🧪 Testing NDJSON Parsing...")
+    body = b'{"name": "Ann", "email": "ann@example.com"}\n\n{not json}\n[1, 2]\n'
+    rows = await collect(iter_ndjson_rows(iter_lines(stream(body))))
+    assert rows[0] == (1, {"name": "Ann", "email": "ann@example.com"})
+    assert rows[1][0] == 2 and rows[1][1].startswith("Invalid JSON")
+    assert rows[2] == (3, "Expected a JSON object")
+    print("✅ NDJSON rows parsed")
+
+
+async def test_csv_rows():
+    """Header names are normalised, quoted fields may span lines and preferences are split"""
+    print("\n🧪 Testing CSV Parsing...")
+    body = ('Name,Email,Preferences,Company\n'
+            'Ann,ann@example.com,"lofts; parking",\n'
+            '\n'
+            '"Bob ""B"" Lee",bob@example.com,,"Acme\nNorth"\n'
+            'Cy,"cy@example.com\n').encode("utf-8")
+    rows = await collect(iter_csv_rows(iter_lines(stream(body))))
+    assert rows[0] == (1, {"name": "Ann", "email": "ann@example.com", "preferences": ["lofts", "parking"]})
+    assert rows[1] == (2, {"name": 'Bob "B" Lee', "email": "bob@example.com", "company": "Acme\nNorth"})
+    assert rows[2] == (3, "Unterminated quoted field")
+    print("✅ CSV rows parsed")
+
+
+async def test_import_validation_and_dedupe():
+    """Invalid rows are reported, duplicate emails skipped, and valid rows inserted in chunks"""
+    print("\n🧪 Testing User Import...")
+    users = FakeUsers(existing_emails={"old@example.com"})
+    original_collection, original_chunk = crm_bulk.users_collection, crm_bulk.USER_IMPORT_CHUNK_SIZE
+    crm_bulk.users_collection, crm_bulk.USER_IMPORT_CHUNK_SIZE = users, 2
+    try:
+        body = "\n".join([
+            '{"name": "Ann", "email": "ann@example.com"}',
+            '{"name": "Ann again", "email": "ann@example.com"}',
+            '{"name": "Old", "email": "old@example.com"}',
+            '{"name": "No email"}',
+            '{"name": "Dee", "email": "dee@example.com", "preferences": ["condos"]}',
+            'oops'
+        ]).encode("utf-8")
+        result = await import_users(iter_ndjson_rows(iter_lines(stream(body))), dedupe_by_email=True)
+    finally:
+        crm_bulk.users_collection, crm_bulk.USER_IMPORT_CHUNK_SIZE = original_collection, original_chunk
+    assert {k: result[k] for k in ("received", "inserted", "duplicates", "failed")} == {
+        "received": 6, "inserted": 2, "duplicates": 2, "failed": 2
+    }
+    assert [error["row"] for error in result["errors"]] == [4, 6] and "email" in result["errors"][0]["error"]
+    assert [user["email"] for user in users.inserted] == ["ann@example.com", "dee@example.com"]
+    print(f"✅ Import result: {result}")
+
+
+if __name__ == "__main__":
+    async def main():
+        await test_line_splitting()
+        await test_ndjson_rows()
+        await test_csv_rows()
+        await test_import_validation_and_dedupe()
+
+    asyncio.run(main())
+    print("\n🎉 All bulk import tests passed!")
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Test script for index creation, retirement and the indexes CLI
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import sys
+import app.database.indexes as indexes
+from app.database.indexes import INDEXES, RETIRED_BEFORE_BUILD, RETIRED_INDEXES, ensure_indexes, index_report
+
+
+class FakeCollection:
+    """Indexes by name; create_indexes fails the way Mongo does on a conflicting spec or a second text index"""
+
+    def __init__(self, specs=None):
+        self.specs = {"_id_": {"key": {"_id": 1}}, **(specs or {})}
+        self.created, self.dropped = [], []
+
+    async def _list(self):
+        for name, spec in self.specs.items():
+            yield {"name": name, **spec}
+
+    def list_indexes(self):
+        return self._list()
+
+    async def create_indexes(self, models):
+        for model in models:
+            spec = {k: v for k, v in model.document.items() if k != "name"}
+            name = model.document["name"]
+            if name in self.specs:
+                if self.specs[name] != spec:
+                    raise RuntimeError(f"An existing index has the same name as the requested index: {name}")
+                continue
+            is_text = "text" in spec["key"].values()
+            if is_text and any("text" in other["key"].values() for other in self.specs.values()):
+                raise RuntimeError("Index with the same key pattern but a different name exists, only one text index")
+            self.specs[name] = spec
+            self.created.append(name)
+        return [model.document["name"] for model in models]
+
+    async def drop_index(self, name):
+        del self.specs[name]
+        self.dropped.append(name)
+
+    def aggregate(self, pipeline):
+        class Cursor:
+            async def to_list(inner, length):
+                return [{"name": name, "accesses": {"ops": 0 if name == "user_timestamp_id" else 5}}
+                        for name in self.specs]
+        return Cursor()
+
+
+def legacy_conversations():
+    """The conversations collection as an older release left it"""
+    return FakeCollection({
+        "user_timestamp": {"key": {"user_id": 1, "timestamp": 1}},
+        "user_tags_timestamp": {"key": {"user_id": 1, "tags": 1, "timestamp": 1}},
+        "message_response_text": {"key": {"_fts": "text", "_ftsx": 1}},
+    })
+
+
+def fake_db(**collections):
+    db = {name: FakeCollection() for name in INDEXES}
+    db.update(collections)
+    return db
+
+
+def declared(name):
+    return {model.document["name"] for model in INDEXES[name]}
+
+
+async def test_retired_indexes_dropped():
+    """Retired indexes go (the old text index before its replacement is built) and every declared one exists"""
+    print("🧪 Testing Index Retirement...")
+    conversations = legacy_conversations()
+    db = fake_db(conversations=conversations)
+    original = indexes.db
+    indexes.db = db
+    try:
+        results = await ensure_indexes()
+    finally:
+        indexes.db = original
+    assert all("error" not in result for result in results.values())
+    assert set(conversations.specs) == declared("conversations") | {"_id_"}
+    assert conversations.dropped[0] == "message_response_text"
+    assert set(conversations.dropped) == {"message_response_text", "user_timestamp", "user_tags_timestamp"}
+    assert set(RETIRED_BEFORE_BUILD["conversations"]) <= set(conversations.dropped)
+    assert not set(RETIRED_INDEXES["conversations"]) & set(conversations.specs)
+    for name in INDEXES:
+        assert declared(name) <= set(db[name].specs)
+    print("✅ Retired indexes dropped")
+
+
+async def test_idempotent():
+    """A second run creates and drops nothing; a failing collection doesn't stop the others"""
+    print("\n🧪 Testing Idempotent Runs...")
+    db = fake_db(conversations=legacy_conversations())
+    original = indexes.db
+    indexes.db = db
+    try:
+        await ensure_indexes()
+        before = {name: dict(collection.specs) for name, collection in db.items()}
+        for collection in db.values():
+            collection.created, collection.dropped = [], []
+        second = await ensure_indexes()
+        assert all(not collection.created and not collection.dropped for collection in db.values())
+        assert {name: collection.specs for name, collection in db.items()} == before
+        assert second["conversations"] == [model.document["name"] for model in INDEXES["conversations"]]
+
+        # An index under a declared name but with another spec is reported, not silently kept
+        db["users"] = FakeCollection({"email": {"key": {"email": -1}}})
+        third = await ensure_indexes(["users", "documents"])
+        assert "error" in third["users"] and third["documents"] == ["filename", "processed"]
+    finally:
+        indexes.db = original
+    print("✅ Re-runs change nothing")
+
+
+async def test_report():
+    """The report lists missing, undeclared and unused indexes"""
+    print("\n🧪 Testing Index Report...")
+    original = indexes.db
+    indexes.db = fake_db(conversations=legacy_conversations())
+    try:
+        before = await index_report()
+        await ensure_indexes(["conversations"])
+        after = await index_report()
+    finally:
+        indexes.db = original
+    assert set(before["conversations"]["missing"]) == declared("conversations")
+    assert set(before["conversations"]["undeclared"]) == {"user_timestamp", "user_tags_timestamp", "message_response_text"}
+    assert after["conversations"]["missing"] == [] and after["conversations"]["undeclared"] == []
+    assert after["conversations"]["unused"] == ["user_timestamp_id"]
+    print("✅ Report accurate")
+
+
+def run_cli(*args):
+    output = io.StringIO()
+    original_argv = sys.argv
+    sys.argv = ["indexes", *args]
+    try:
+        with contextlib.redirect_stdout(output):
+            indexes.main()
+    finally:
+        sys.argv = original_argv
+    text = output.getvalue()
+    return text, json.loads(text[text.index("{"):])  # After any "Dropped retired index" lines
+
+
+def test_cli():
+    """build honours --collection and prints the result as JSON, as does report"""
+    print("\n🧪 Testing Index CLI...")
+    db = fake_db(conversations=legacy_conversations())
+    original = indexes.db
+    indexes.db = db
+    try:
+        text, results = run_cli("build", "--collection", "conversations", "--collection", "users")
+        assert set(results) == {"conversations", "users"} and results["users"] == ["email"]
+        assert "Dropped retired index conversations.message_response_text" in text
+        assert db["documents"].created == []
+        _, report = run_cli("report")
+        assert report["documents"]["missing"] == ["filename", "processed"] and report["conversations"]["missing"] == []
+    finally:
+        indexes.db = original
+    print("✅ CLI works")
+
+
+if __name__ == "__main__":
+    async def main():
+        await test_retired_indexes_dropped()
+        await test_idempotent()
+        await test_report()
+
+    asyncio.run(main())
+    test_cli()
+    print("\n🎉 All index tests passed!")
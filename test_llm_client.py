@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Test script for the shared LLM client: circuit breaker, retries and hedging
+"""
+
+import asyncio
+import time
+import httpx
+from openai import APIConnectionError
+import app.services.llm_client as llm_client
+from app.services.llm_client import CircuitBreaker, CircuitOpenError, LatencyTracker
+
+
+def connection_error() -> APIConnectionError:
+    return APIConnectionError(request=httpx.Request("POST", "http://llm.test/v1/chat/completions"))
+
+
+def test_circuit_breaker():
+    """Opens after N consecutive failures, then lets one trial through after the reset time"""
+    print("🧪 Testing Circuit Breaker...")
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=0.05)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    breaker.before_call()
+    breaker.record_success()  # A success resets the count
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == "open"
+    try:
+        breaker.before_call()
+        assert False, "expected CircuitOpenError"
+    except CircuitOpenError:
+        pass
+
+    time.sleep(0.06)
+    breaker.before_call()  # The single half-open trial
+    assert breaker.state == "half_open"
+    try:
+        breaker.before_call()
+        assert False, "expected CircuitOpenError while the trial is in flight"
+    except CircuitOpenError:
+        pass
+    breaker.record_failure()  # A failed trial reopens immediately
+    assert breaker.state == "open" and breaker.rejected_calls == 2
+
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.consecutive_failures == 0
+    print("✅ Breaker opens, trials and closes")
+
+
+def test_latency_percentiles():
+    """Hedging waits for enough samples and never fires sooner than the minimum delay"""
+    print("\n🧪 Testing Latency Tracker...")
+    tracker = LatencyTracker(window=100)
+    for ms in range(1, 11):
+        tracker.record(ms / 1000)
+    assert tracker.percentile(50) in (0.005, 0.006) and tracker.percentile(95) == 0.01
+    assert tracker.hedge_delay() is None  # Fewer than HEDGE_MIN_SAMPLES
+    for _ in range(llm_client.HEDGE_MIN_SAMPLES):
+        tracker.record(2.0)
+    assert tracker.hedge_delay() == 2.0
+    tracker.samples.clear()
+    for _ in range(llm_client.HEDGE_MIN_SAMPLES):
+        tracker.record(0.001)
+    assert tracker.hedge_delay() == llm_client.LLM_HEDGE_MIN_DELAY
+    print("✅ Percentiles and hedge delay computed")
+
+
+async def test_retries_and_breaker():
+    """Retryable errors are retried until the breaker opens; other errors are raised at once"""
+    print("\n🧪 Testing Retries...")
+    originals = (llm_client.client, llm_client.breaker, llm_client.LLM_RETRY_BASE_DELAY, llm_client.LLM_MAX_RETRIES)
+    llm_client.client = object()
+    llm_client.LLM_RETRY_BASE_DELAY = 0
+    llm_client.LLM_MAX_RETRIES = 5
+    try:
+        llm_client.breaker = CircuitBreaker(failure_threshold=3, reset_seconds=60)
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise connection_error()
+            return "ok"
+
+        assert await llm_client._call("test", flaky, hedge=False) == "ok" and len(attempts) == 3
+
+        async def down():
+            attempts.append(1)
+            raise connection_error()
+
+        attempts.clear()
+        try:
+            await llm_client._call("test", down, hedge=False)
+            assert False, "expected APIConnectionError"
+        except APIConnectionError:
+            pass
+        # Stops retrying once the breaker opens rather than at LLM_MAX_RETRIES
+        assert len(attempts) == 3 and llm_client.breaker.state == "open"
+
+        llm_client.breaker = CircuitBreaker(failure_threshold=3, reset_seconds=60)
+
+        async def bad_request():
+            attempts.append(1)
+            raise ValueError("invalid model")
+
+        attempts.clear()
+        try:
+            await llm_client._call("test", bad_request, hedge=False)
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
+        assert len(attempts) == 1 and llm_client.breaker.consecutive_failures == 0
+    finally:
+        llm_client.client, llm_client.breaker, llm_client.LLM_RETRY_BASE_DELAY, llm_client.LLM_MAX_RETRIES = originals
+    print("✅ Retries bounded by the breaker")
+
+
+async def test_hedged_requests():
+    """A slow primary gets a duplicate after the p95 delay and the first success wins"""
+    print("\n🧪 Testing Hedged Requests...")
+    originals = (llm_client.LLM_HEDGE_ENABLED, llm_client.LLM_HEDGE_MIN_DELAY, dict(llm_client._stats))
+    llm_client.LLM_HEDGE_ENABLED = True
+    llm_client.LLM_HEDGE_MIN_DELAY = 0.01
+    tracker = llm_client._latency.setdefault("hedge_test", LatencyTracker())
+    for _ in range(llm_client.HEDGE_MIN_SAMPLES):
+        tracker.record(0.01)
+    try:
+        delays = [0.5, 0.01]  # Primary stalls, the hedge is fast
+        started = []
+
+        async def call():
+            started.append(1)
+            await asyncio.sleep(delays[len(started) - 1])
+            return len(started)
+
+        began = time.monotonic()
+        assert await llm_client._hedged("hedge_test", call) == 2
+        assert time.monotonic() - began < 0.4
+        assert llm_client._stats["hedges_sent"] == originals[2]["hedges_sent"] + 1
+        assert llm_client._stats["hedges_won"] == originals[2]["hedges_won"] + 1
+
+        # A primary that answers before the delay is never duplicated
+        delays[:] = [0.0]
+        started.clear()
+        assert await llm_client._hedged("hedge_test", call) == 1 and len(started) == 1
+    finally:
+        llm_client.LLM_HEDGE_ENABLED, llm_client.LLM_HEDGE_MIN_DELAY = originals[:2]
+        llm_client._stats.update(originals[2])
+        del llm_client._latency["hedge_test"]
+    print("✅ Hedge fired only when the primary was slow")
+
+
+if __name__ == "__main__":
+    test_circuit_breaker()
+    test_latency_percentiles()
+    asyncio.run(test_retries_and_breaker())
+    asyncio.run(test_hedged_requests())
+    print("\n🎉 All LLM client tests passed!")
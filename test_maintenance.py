@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Test script for throttled maintenance deletes and the background job registry
+"""
+
+import asyncio
+from types import SimpleNamespace
+from bson.objectid import ObjectId
+from fastapi import HTTPException
+import app.services.maintenance as maintenance
+import app.utils.jobs as jobs
+from app.routes.jobs import get_jobs, get_job_status
+from app.utils.jobs import Job, start_job
+
+
+def patch(module, **values):
+    originals = {name: getattr(module, name) for name in values}
+    for name, value in values.items():
+        setattr(module, name, value)
+    return originals
+
+
+def matches(doc, query):
+    for key, condition in query.items():
+        value = doc.get(key)
+        if isinstance(condition, dict):
+            for op, bound in condition.items():
+                if op == "$in" and value not in bound:
+                    return False
+                if op == "$lte" and not value <= bound:
+                    return False
+                if op == "$exists" and (key in doc) != bound:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def limit(self, count):
+        return FakeCursor(self.docs[:count])
+
+    def __aiter__(self):
+        async def iterate():
+            for doc in self.docs:
+                yield doc
+        return iterate()
+
+
+class FakeCollection:
+    """Records every delete batch; on_delete runs after each one to simulate live writes"""
+
+    def __init__(self, name, docs, on_delete=None):
+        self.name, self.docs, self.batches, self.on_delete = name, docs, [], on_delete
+
+    def find(self, query, projection=None):
+        return FakeCursor([{"_id": doc["_id"]} for doc in self.docs if matches(doc, query)])
+
+    async def count_documents(self, query):
+        return sum(1 for doc in self.docs if matches(doc, query))
+
+    async def estimated_document_count(self):
+        return len(self.docs)
+
+    async def delete_many(self, query):
+        kept = [doc for doc in self.docs if not matches(doc, query)]
+        deleted, self.docs = len(self.docs) - len(kept), kept
+        self.batches.append(deleted)
+        if self.on_delete:
+            self.on_delete(self)
+        return SimpleNamespace(deleted_count=deleted)
+
+    async def delete_one(self, query):
+        before = len(self.docs)
+        self.docs = [doc for doc in self.docs if not matches(doc, query)]
+        return SimpleNamespace(deleted_count=before - len(self.docs))
+
+    async def update_many(self, query, update):
+        updated = [doc for doc in self.docs if matches(doc, query)]
+        for doc in updated:
+            for field in update["$unset"]:
+                doc.pop(field, None)
+        return SimpleNamespace(modified_count=len(updated))
+
+
+def docs(count, **fields):
+    return [{"_id": ObjectId(), **fields} for _ in range(count)]
+
+
+async def test_purge_in_batches():
+    """A user's documents are deleted MAINTENANCE_BATCH_SIZE at a time with progress on the job"""
+    print("🧪 Testing Batched Purge...")
+    conversations = FakeCollection("conversations", docs(7, user_id="u1") + docs(2, user_id="u2"))
+    sessions = FakeCollection("conversation_sessions", docs(1, user_id="u1"))
+    events = FakeCollection("calendar_events", [])
+    analytics = FakeCollection("conversation_analytics", [{"_id": "user:u1"}, {"_id": "user:u2"}])
+    originals = patch(maintenance, MAINTENANCE_BATCH_SIZE=3, MAINTENANCE_BATCH_PAUSE_MS=0,
+                      USER_DATA_COLLECTIONS=[conversations, sessions, events], analytics_collection=analytics)
+    job = Job("delete_user")
+    try:
+        result = await maintenance.purge_user_data("u1", job)
+    finally:
+        patch(maintenance, **originals)
+    assert result == {"conversations": 7, "conversation_sessions": 1, "calendar_events": 0, "conversation_analytics": 1}
+    assert conversations.batches == [3, 3, 1] and [doc["user_id"] for doc in conversations.docs] == ["u2", "u2"]
+    assert job.total == 8 and job.processed == 8 and analytics.docs == [{"_id": "user:u2"}]
+    print("✅ Purged in batches")
+
+
+async def test_reset_cutoff_and_rollups():
+    """Chats saved while the reset runs survive it, and the rollups are rebuilt afterwards"""
+    print("\n🧪 Testing Reset Cutoff...")
+
+    def live_chat(collection):
+        if len(collection.batches) == 1:
+            collection.docs.append({"_id": ObjectId(), "message": "arrived mid-reset"})
+
+    conversations = FakeCollection("conversations", docs(5), on_delete=live_chat)
+    sessions = FakeCollection("conversation_sessions", docs(2))
+    users = FakeCollection("users", [{"_id": 1, "conversations": []}, {"_id": 2}])
+    rebuilds = []
+
+    async def rebuild():
+        rebuilds.append(len(conversations.docs))
+        return {"conversations": len(conversations.docs), "saved_during_rebuild": 0}
+
+    originals = patch(maintenance, MAINTENANCE_BATCH_SIZE=2, MAINTENANCE_BATCH_PAUSE_MS=0,
+                      conversations_collection=conversations, sessions_collection=sessions,
+                      users_collection=users, backfill_analytics=rebuild, ANALYTICS_ENABLED=True)
+    job = Job("reset_all")
+    try:
+        result = await maintenance.reset_all_conversations(job)
+    finally:
+        patch(maintenance, **originals)
+    assert result == {"conversations": 5, "conversation_sessions": 2, "legacy_arrays_cleared": 1,
+                      "analytics_conversations": 1}
+    assert [doc["message"] for doc in conversations.docs] == ["arrived mid-reset"]
+    assert conversations.batches == [2, 2, 1] and job.total == 7 and job.processed == 7
+    assert users.docs == [{"_id": 1}, {"_id": 2}]
+    # Rebuilt after the deletes, counting only what survived
+    assert rebuilds == [1]
+    print("✅ Reset stopped at the cutoff")
+
+
+async def test_job_status():
+    """Jobs go pending -> running -> completed or failed, and the routes report them"""
+    print("\n🧪 Testing Job Status...")
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def slow(job):
+        job.total = 4
+        job.advance(1)
+        started.set()
+        await release.wait()
+        job.advance(3)
+        return {"done": True}
+
+    async def broken(job):
+        raise RuntimeError("database unavailable")
+
+    job = start_job("slow", slow, {"kind": "test"})
+    assert job.status == "pending" and job.started_at is None
+    await started.wait()
+    status = await get_job_status(job.job_id)
+    assert status["status"] == "running" and status["progress"] == 0.25 and status["params"] == {"kind": "test"}
+    release.set()
+    failed = start_job("broken", broken)
+    await asyncio.gather(*jobs._tasks)
+    status = await get_job_status(job.job_id)
+    assert status["status"] == "completed" and status["result"] == {"done": True} and status["progress"] == 1.0
+    assert status["finished_at"] >= status["started_at"]
+    status = await get_job_status(failed.job_id)
+    assert status["status"] == "failed" and status["error"] == "database unavailable"
+    listed = (await get_jobs())["jobs"]
+    assert [j["job_id"] for j in listed[:2]] == [failed.job_id, job.job_id]  # Newest first
+
+    try:
+        await get_job_status("unknown")
+        assert False, "expected a 404"
+    except HTTPException as e:
+        assert e.status_code == 404
+    print("✅ Job status reported")
+
+
+async def test_cancel_and_pruning():
+    """Shutdown cancels running jobs; only MAX_FINISHED_JOBS finished jobs are kept"""
+    print("\n🧪 Testing Cancel and Pruning...")
+
+    async def forever(job):
+        await asyncio.Event().wait()
+
+    async def quick(job):
+        return None
+
+    originals = patch(jobs, _jobs=jobs.OrderedDict(), MAX_FINISHED_JOBS=2)
+    try:
+        running = start_job("forever", forever)
+        finished = [start_job("quick", quick) for _ in range(3)]
+        while any(job.finished_at is None for job in finished):
+            await asyncio.sleep(0)
+        start_job("quick", quick)  # Prunes the oldest finished job
+        assert finished[0].job_id not in jobs._jobs and finished[1].job_id in jobs._jobs
+        assert running.job_id in jobs._jobs
+        await jobs.cancel_jobs()
+        assert running.status == "cancelled" and running.finished_at is not None
+    finally:
+        patch(jobs, **originals)
+    print("✅ Cancelled and pruned")
+
+
+if __name__ == "__main__":
+    async def main():
+        await test_purge_in_batches()
+        await test_reset_cutoff_and_rollups()
+        await test_job_status()
+        await test_cancel_and_pruning()
+
+    asyncio.run(main())
+    print("\n🎉 All maintenance tests passed!")
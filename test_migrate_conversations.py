@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Test script for moving embedded conversations into the conversations collection
+"""
+
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+from bson.objectid import ObjectId
+import app.database.migrate_conversations as migrate
+from app.database.migrate_conversations import migrate_conversations
+
+
+def patch(**values):
+    originals = {name: getattr(migrate, name) for name in values}
+    for name, value in values.items():
+        setattr(migrate, name, value)
+    return originals
+
+
+class FakeUsers:
+    def __init__(self, users):
+        self.users = users
+
+    def find(self, query, projection=None):
+        users = [{"_id": user["_id"], "conversations": list(user["conversations"])}
+                 for user in self.users if user.get("conversations")]
+
+        class Cursor:
+            def batch_size(self, size):
+                return self
+
+            async def __aiter__(self):
+                for user in users:
+                    yield user
+        return Cursor()
+
+    async def update_many(self, query, update):
+        for user in self.users:
+            if user["_id"] in query["_id"]["$in"]:
+                user.pop("conversations", None)
+        return SimpleNamespace(modified_count=len(query["_id"]["$in"]))
+
+
+class FakeConversations:
+    """Applies $setOnInsert upserts; fail_on makes that bulk write (1-based) raise"""
+
+    def __init__(self, fail_on=None):
+        self.docs, self.writes, self.fail_on = {}, 0, fail_on
+
+    async def bulk_write(self, operations, ordered=False):
+        self.writes += 1
+        if self.writes == self.fail_on:
+            raise RuntimeError("connection reset")
+        for operation in operations:
+            self.docs.setdefault(operation._filter["_id"], operation._doc["$setOnInsert"])
+
+
+async def no_indexes(collections):
+    return {}
+
+
+def users():
+    """Three users, with and without usable conversation ids"""
+    result = []
+    for u in range(3):
+        entries = [{"message": f"Question {u}.{i}", "response": "Answer", "timestamp": datetime(2024, 5, u + 1, 9, i)}
+                   for i in range(3)]
+        entries[0]["conversation_id"] = str(ObjectId())
+        entries[1]["conversation_id"] = "legacy-1"
+        result.append({"_id": ObjectId(), "name": f"User {u}", "conversations": entries})
+    return result
+
+
+async def run(users_collection, conversations_collection, **kwargs):
+    originals = patch(users_collection=users_collection, conversations_collection=conversations_collection,
+                      ensure_indexes=no_indexes)
+    try:
+        return await migrate_conversations(**kwargs)
+    finally:
+        patch(**originals)
+
+
+async def test_rerun_is_idempotent():
+    """Running again over arrays still in place upserts the same documents, even without conversation ids"""
+    print("🧪 Testing Re-runs...")
+    fake_users, conversations = FakeUsers(users()), FakeConversations()
+    first = await run(fake_users, conversations, keep_embedded=True)
+    migrated = dict(conversations.docs)
+    second = await run(fake_users, conversations, keep_embedded=True)
+    assert first == second == {"users": 3, "conversations": 9}
+    assert conversations.docs == migrated and len(migrated) == 9
+    assert all(user["conversations"] for user in fake_users.users)
+    for oid, doc in migrated.items():
+        assert doc["_id"] == oid and doc["conversation_id"] == str(oid) and doc["tags"] == []
+        if not doc["message"].endswith(".0"):
+            # Generated ids still sort by time, which reset and backfill cutoffs rely on
+            assert oid.generation_time.replace(tzinfo=None) == doc["timestamp"]
+
+    third = await run(fake_users, conversations)
+    assert third == first and all("conversations" not in user for user in fake_users.users)
+    assert await run(fake_users, conversations) == {"users": 0, "conversations": 0}
+    assert conversations.docs == migrated
+    print("✅ Re-running duplicated nothing")
+
+
+async def test_arrays_kept_until_written():
+    """A failed bulk write leaves its users' arrays in place; the next run finishes the job"""
+    print("\n🧪 Testing Failed Writes...")
+    fake_users, conversations = FakeUsers(users()), FakeConversations(fail_on=2)
+    try:
+        await run(fake_users, conversations, batch_size=3)
+        assert False, "expected the failed write to stop the run"
+    except RuntimeError:
+        pass
+    # One user per batch: the first was written and unset, the second's write failed
+    assert "conversations" not in fake_users.users[0]
+    assert fake_users.users[1]["conversations"] and fake_users.users[2]["conversations"]
+    assert len(conversations.docs) == 3
+
+    result = await run(fake_users, conversations, batch_size=3)
+    assert result == {"users": 2, "conversations": 6} and len(conversations.docs) == 9
+    assert all("conversations" not in user for user in fake_users.users)
+    print("✅ Arrays only removed after their entries were written")
+
+
+if __name__ == "__main__":
+    async def main():
+        await test_rerun_is_idempotent()
+        await test_arrays_kept_until_written()
+
+    asyncio.run(main())
+    print("\n🎉 All migration tests passed!")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Test script for token-budgeted prompt assembly
+"""
+
+import app.services.prompt_builder as prompt_builder
+from app.services.prompt_builder import build_prompt, count_tokens, strip_overlap
+
+SYSTEM_PROMPT = "You are a helpful assistant."
+QUESTION = "What is the late fee?"
+
+
+def sentence(word: str, count: int) -> str:
+    return " ".join(f"{word}{i}" for i in range(count)) + "."
+
+
+def test_strip_overlap():
+    """Text shared with neighbouring kept chunks is removed"""
+    print("🧪 Testing Chunk Overlap Removal...")
+    shared = "the late fee is five percent of monthly rent"
+    kept = ["Payments are due on the first; " + shared]
+    assert strip_overlap(shared + " and is charged after five days.", kept) == "and is charged after five days."
+    assert strip_overlap("Grace periods apply. " + "Payments are due on the first;", kept) == "Grace periods apply."
+    assert strip_overlap("late fee is five percent", kept) == ""
+    # Overlaps shorter than MIN_OVERLAP_CHARS are coincidence, not chunk overlap
+    assert strip_overlap("monthly rent is due", ["due on rent"]) == "monthly rent is due"
+    print("✅ Overlap removed")
+
+
+def test_budget_split():
+    """Context gets its share of the free budget first, history the rest, most recent turns first"""
+    print("\n🧪 Testing Prompt Budget Split...")
+    original_budget = prompt_builder.PROMPT_TOKEN_BUDGET
+    prompt_builder.PROMPT_TOKEN_BUDGET = 400
+    try:
+        chunks = [
+            {"id": "a", "content": sentence("minor", 20), "similarity": 0.3},
+            {"id": "b", "content": sentence("lease", 400), "similarity": 0.9}
+        ]
+        history = [{"message": f"question {i}", "response": sentence(f"answer{i}x", 10)} for i in range(30)]
+        messages, context_used, stats = build_prompt(SYSTEM_PROMPT, QUESTION, chunks, history, "Asked about fees.")
+
+        fixed = (count_tokens(SYSTEM_PROMPT) + count_tokens(QUESTION)
+                 + 2 * prompt_builder.MESSAGE_OVERHEAD_TOKENS + prompt_builder.REPLY_PRIMING_TOKENS)
+        available = 400 - fixed
+        # The most relevant chunk fills the context share, truncated; the other no longer fits
+        assert len(context_used) == 1 and context_used[0].startswith("lease0 lease1")
+        assert stats["context_tokens"] <= int(available * prompt_builder.PROMPT_CONTEXT_SHARE)
+        assert stats["context_tokens"] + stats["history_tokens"] <= available
+        # History keeps a suffix of the turns, ending with the latest
+        assert 0 < stats["turns_used"] < len(history)
+        assert messages[-1]["content"].rstrip().endswith(f"Current question: {QUESTION}")
+        assert "question 29" in messages[-1]["content"] and "question 0\n" not in messages[-1]["content"]
+        assert "Conversation Summary:\nAsked about fees." in messages[-1]["content"]
+    finally:
+        prompt_builder.PROMPT_TOKEN_BUDGET = original_budget
+    print(f"✅ Budget split: {stats}")
+
+
+def test_small_inputs_untouched():
+    """With room to spare everything is sent, and no context means the bare question"""
+    print("\n🧪 Testing Prompt Without Pressure...")
+    history = [{"message": "hi", "response": "hello"}]
+    messages, context_used, stats = build_prompt(SYSTEM_PROMPT, QUESTION, [{"content": "Late fee: 5%."}], history)
+    assert context_used == ["Late fee: 5%."] and stats["turns_used"] == 1
+    messages, context_used, _ = build_prompt(SYSTEM_PROMPT, QUESTION, [], [])
+    assert messages == [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": QUESTION}]
+    print("✅ Small prompts sent whole")
+
+
+if __name__ == "__main__":
+    test_strip_overlap()
+    test_budget_split()
+    test_small_inputs_untouched()
+    print("\n🎉 All prompt builder tests passed!")
@@ -54,7 +54,7 @@ def test_chunking():
         assert len(chunk) <= 1000  # Max chunk size
         print(f"   Chunk {i+1}: {len(chunk)} characters")
 
-def test_embedding():
+async def test_embedding():
     """Test embedding generation"""
     print("\n🧪 Testing Embedding Generation...")
     
@@ -63,7 +63,7 @@ def test_embedding():
         return
     
     test_text = "This is a test sentence for embedding generation."
-    embedding = get_embedding(test_text)
+    embedding = await get_embedding(test_text)
     
     if embedding:
         assert len(embedding) > 0
@@ -104,18 +104,18 @@ async def test_document_processing():
     print(f"   Failed chunks: {result['failed_chunks']}")
     
     # Verify document was stored
-    doc = documents_collection.find_one({"_id": result['doc_id']})
+    doc = await documents_collection.find_one({"_id": result['doc_id']})
     assert doc is not None
     print("✅ Document stored in database")
     
     # Verify chunks were stored
-    chunks = list(document_chunks_collection.find({"doc_id": result['doc_id']}))
+    chunks = await document_chunks_collection.find({"doc_id": result['doc_id']}).to_list(length=None)
     assert len(chunks) == result['chunks_created']
     print(f"✅ {len(chunks)} chunks stored in database")
     
     return result['doc_id']
 
-def test_context_retrieval():
+async def test_context_retrieval():
     """Test context retrieval functionality"""
     print("\n🧪 Testing Context Retrieval...")
     
@@ -125,7 +125,7 @@ def test_context_retrieval():
     
     # Test query
     query = "test document"
-    context = retrieve_context(query)
+    context = await retrieve_context(query)
     
     if context:
         print(f"✅ Context retrieved: {len(context)} characters")
@@ -141,12 +141,12 @@ def test_rag_endpoints():
     print("ℹ️  RAG endpoints test requires running server")
     print("   Test with: curl http://localhost:8000/rag/stats")
 
-def cleanup_test_data():
+async def cleanup_test_data():
     """Clean up test data"""
     print("\n🧹 Cleaning up test data...")
     
     # Delete test documents
-    result = documents_collection.delete_many({"filename": {"$regex": "^test_"}})
+    result = await documents_collection.delete_many({"filename": {"$regex": "^test_"}})
     print(f"✅ Deleted {result.deleted_count} test documents")
     
     # Delete test chunks (orphaned chunks)
@@ -164,7 +164,7 @@ async def main():
         # Run tests
         test_text_extraction()
         test_chunking()
-        test_embedding()
+        await test_embedding()
         
         # Test document processing
         doc_id = await test_document_processing()
@@ -174,7 +174,7 @@ async def main():
             print("⚠️  Document processing test skipped or failed")
         
         # Test context retrieval
-        test_context_retrieval()
+        await test_context_retrieval()
         
         # Test API endpoints
         test_rag_endpoints()
@@ -183,7 +183,7 @@ async def main():
         print("🎉 All RAG system tests completed!")
         
         # Cleanup
-        cleanup_test_data()
+        await cleanup_test_data()
         
     except Exception as e:
         print(f"\n❌ Test failed: {e}")
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Test script for resuming an interrupted re-tagging run from its checkpoint
+"""
+
+import asyncio
+from collections import Counter
+import app.services.retagging as retagging
+import app.services.tag_classifier as tag_classifier
+from app.utils.tagging import TagMatcher
+
+MATCHER = TagMatcher({"billing": ["invoice"], "maintenance": ["leak"], "general": ["thanks"]})
+RESPONSES = ["Your invoice is attached", "We fixed the leak", "Thanks!", "The invoice covers the leak",
+             "Another invoice", "Leak repaired", "Thanks, invoice paid"]
+
+
+def patch(module, **values):
+    originals = {name: getattr(module, name) for name in values}
+    for name, value in values.items():
+        setattr(module, name, value)
+    return originals
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args):
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        async def iterate():
+            for doc in self.docs:
+                yield dict(doc)
+        return iterate()
+
+
+class FakeConversations:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def _matching(self, query):
+        after = query.get("_id", {}).get("$gt")
+        return [doc for doc in self.docs if after is None or doc["_id"] > after]
+
+    async def count_documents(self, query):
+        return len(self._matching(query))
+
+    def find(self, query, projection=None):
+        return FakeCursor(self._matching(query))
+
+    async def bulk_write(self, operations, ordered=False):
+        docs = {doc["_id"]: doc for doc in self.docs}
+        for operation in operations:
+            docs[operation._filter["_id"]].update(operation._doc["$set"])
+
+
+class FakeAnalytics:
+    def __init__(self, counts):
+        self.counts = Counter(counts)
+
+    async def bulk_write(self, operations, ordered=False):
+        for operation in operations:
+            self.counts[operation._filter["_id"][len("tag:"):]] += operation._doc["$inc"]["count"]
+
+
+class FakeCheckpoints:
+    """One checkpoint document; the fail_on-th update raises, as if the worker died before saving it"""
+
+    def __init__(self, fail_on=None):
+        self.doc, self.updates, self.fail_on = None, 0, fail_on
+
+    async def find_one(self, query):
+        return dict(self.doc) if self.doc else None
+
+    async def update_one(self, query, update, upsert=False):
+        self.updates += 1
+        if self.updates == self.fail_on:
+            raise RuntimeError("worker stopped")
+        self.doc = {"_id": query["_id"], **update["$set"]}
+
+    async def delete_one(self, query):
+        self.doc = None
+
+
+async def tag_inline(pool, items):
+    return [(conversation_id, MATCHER.tag(text)) for conversation_id, text in items]
+
+
+def tag_counts(docs):
+    return Counter(tag for doc in docs for tag in set(doc["tags"]))
+
+
+async def run(conversations, analytics, checkpoints, resume=False):
+    originals = patch(retagging, conversations_collection=conversations, analytics_collection=analytics,
+                      checkpoints_collection=checkpoints, _tag_in_pool=tag_inline, ANALYTICS_ENABLED=True,
+                      RETAG_WORKERS=1, RETAG_BATCH_SIZE=2)
+    classifier_originals = patch(tag_classifier, get_tag_matcher=lambda: MATCHER)
+    try:
+        return await retagging.retag_conversations(resume=resume)
+    finally:
+        patch(retagging, **originals)
+        patch(tag_classifier, **classifier_originals)
+
+
+async def test_resume_without_double_counting():
+    """A run stopped after writing a batch but before checkpointing it resumes without counting it twice"""
+    print("🧪 Testing Re-tag Resume...")
+    docs = [{"_id": i, "response": text, "tags": ["general"]} for i, text in enumerate(RESPONSES)]
+    conversations, analytics = FakeConversations(docs), FakeAnalytics(tag_counts(docs))
+    checkpoints = FakeCheckpoints(fail_on=2)
+    try:
+        await run(conversations, analytics, checkpoints)
+        assert False, "expected the run to stop"
+    except RuntimeError:
+        pass
+    # Batch two's tags and deltas were written, but the checkpoint still points at batch one
+    assert checkpoints.doc["last_id"] == 1 and checkpoints.doc["processed"] == 2
+    assert docs[3]["tags"] == ["billing", "maintenance"] and analytics.counts == tag_counts(docs)
+
+    checkpoints.fail_on = None
+    result = await run(conversations, analytics, checkpoints, resume=True)
+    assert result["processed"] == len(docs) and checkpoints.doc is None
+    assert [doc["tags"] for doc in docs] == [["billing"], ["maintenance"], ["general"], ["billing", "maintenance"],
+                                             ["billing"], ["maintenance"], ["billing", "general"]]
+    # Rollups match a recount of the final tags: re-read batches changed nothing, so added nothing
+    assert +analytics.counts == tag_counts(docs) == Counter({"billing": 4, "maintenance": 3, "general": 2})
+    print("✅ Resumed without double counting")
+
+
+async def test_resume_between_batches():
+    """Stopping between batches resumes after the checkpoint with the saved totals"""
+    print("\n🧪 Testing Resume Between Batches...")
+    docs = [{"_id": i, "response": text, "tags": ["general"]} for i, text in enumerate(RESPONSES)]
+    conversations, analytics = FakeConversations(docs), FakeAnalytics(tag_counts(docs))
+    checkpoints = FakeCheckpoints()
+    checkpoints.doc = {"_id": retagging.CHECKPOINT_ID, "last_id": 3, "processed": 4, "updated": 3}
+    result = await run(conversations, analytics, checkpoints, resume=True)
+    assert result["processed"] == 7 and result["updated"] == 6
+    assert all(doc["tags"] == ["general"] for doc in docs[:4])  # Before the checkpoint: left alone
+    assert +analytics.counts == tag_counts(docs)
+
+    fresh = await run(conversations, analytics, FakeCheckpoints())
+    assert fresh["processed"] == 7 and fresh["updated"] == 3 and +analytics.counts == tag_counts(docs)
+    print("✅ Resumed from the checkpoint")
+
+
+if __name__ == "__main__":
+    async def main():
+        await test_resume_without_double_counting()
+        await test_resume_between_batches()
+
+    asyncio.run(main())
+    print("\n🎉 All re-tagging tests passed!")
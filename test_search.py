@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Test script for full-text conversation search
+"""
+
+import asyncio
+from datetime import datetime
+from bson.objectid import ObjectId
+import app.services.conversation_search as conversation_search
+from app.services.conversation_search import _snippet, search_conversations
+
+
+def matches(doc, query):
+    """Just the query operators search uses; $text is assumed to match"""
+    for key, condition in query.items():
+        if key == "$text":
+            continue
+        if key == "$or":
+            if not any(matches(doc, branch) for branch in condition):
+                return False
+        elif isinstance(condition, dict):
+            checks = {"$lt": lambda a, b: a < b, "$lte": lambda a, b: a <= b, "$gte": lambda a, b: a >= b}
+            if not all(checks[op](doc[key], bound) for op, bound in condition.items()):
+                return False
+        elif key == "tags":
+            if condition not in doc.get("tags", []):
+                return False
+        elif doc.get(key) != condition:
+            return False
+    return True
+
+
+class FakeConversations:
+    """Runs the search pipeline over documents that carry their text score as a score field"""
+
+    def __init__(self, docs):
+        self.docs, self.pipelines = docs, []
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        hits = [dict(doc) for doc in self.docs]
+        for stage in pipeline:
+            if "$match" in stage:
+                hits = [doc for doc in hits if matches(doc, stage["$match"])]
+            elif "$sort" in stage:
+                for key, direction in reversed(list(stage["$sort"].items())):
+                    hits.sort(key=lambda doc: doc[key], reverse=direction < 0)
+            elif "$limit" in stage:
+                hits = hits[:stage["$limit"]]
+
+        class Cursor:
+            async def to_list(self, length):
+                return hits[:length]
+        return Cursor()
+
+
+def hit(message, response="", score=1.0, minute=0, user_id="user-1"):
+    oid = ObjectId()
+    return {"_id": oid, "conversation_id": str(oid), "user_id": user_id, "session_id": "session-1",
+            "timestamp": datetime(2025, 6, 2, 9, minute), "message": message, "response": response, "score": score}
+
+
+async def run_search(docs, *args, **kwargs):
+    conversations = FakeConversations(docs)
+    original = conversation_search.conversations_collection
+    conversation_search.conversations_collection = conversations
+    try:
+        return await search_conversations(*args, **kwargs), conversations.pipelines
+    finally:
+        conversation_search.conversations_collection = original
+
+
+def test_snippet():
+    """The snippet surrounds the first match, case-insensitively, with ellipses where text was cut"""
+    print("🧪 Testing Snippets...")
+    text = "a" * 200 + " Parking included " + "b" * 200
+    snippet = _snippet(text, ["parking"])
+    assert snippet.startswith("…") and snippet.endswith("…") and "Parking included" in snippet
+    assert len(snippet) <= 2 * conversation_search.SNIPPET_RADIUS + len("Parking") + 2
+    assert _snippet("Short text", ["short"]) == "Short text"
+    assert _snippet("No match here", ["parking"]) is None and _snippet("Anything", []) is None
+    assert _snippet("cost is $5 (approx)", ["$5", "(approx)"]) == "cost is $5 (approx)"
+    print("✅ Snippets cut correctly")
+
+
+async def test_query_filters_and_paging():
+    """Filters map to the match stage, user_id is required and one extra hit signals another page"""
+    print("\n🧪 Testing Search Query...")
+    docs = [hit(f"Loft with parking {i}", score=3.0 - i / 10) for i in range(4)]
+    start, end = datetime(2025, 6, 1), datetime(2025, 7, 1)
+    result, pipelines = await run_search(docs, '"loft with" parking -studio', user_id="user-1", tag="lofts",
+                                         start=start, end=end, limit=3)
+    assert pipelines[0][0] == {"$match": {"user_id": "user-1", "$text": {"$search": '"loft with" parking -studio'},
+                                          "tags": "lofts", "timestamp": {"$gte": start, "$lt": end}}}
+    assert pipelines[0][-1] == {"$limit": 4}
+
+    for doc in docs:
+        doc["tags"] = ["lofts"]
+    result, _ = await run_search(docs, "parking", user_id="user-1", tag="lofts", start=start, end=end, limit=3)
+    assert len(result["results"]) == 3 and result["has_more"] is True and result["next_cursor"]
+    assert result["results"][0]["score"] == 3.0 and result["results"][0]["snippet"] == "Loft with parking 0"
+
+    # Out of range limits are clamped
+    result, _ = await run_search(docs[:1], "parking", user_id="user-1", limit=10_000)
+    assert result["limit"] == conversation_search.SEARCH_MAX_LIMIT and result["has_more"] is False
+    assert result["next_cursor"] is None
+
+    for bad in ({"user_id": None}, {"user_id": "user-1", "after": "not-a-cursor"}):
+        try:
+            await run_search(docs, "parking", **bad)
+            assert False, f"expected ValueError for {bad}"
+        except ValueError:
+            pass
+    print("✅ Query built")
+
+
+async def test_cursor_paging():
+    """Pages follow (score, timestamp, _id) with ties, without duplicates, gaps or other users' hits"""
+    print("\n🧪 Testing Search Paging...")
+    docs = [hit(f"Parking note {i}", score=[2.0, 1.5, 1.5, 1.5, 1.0][i % 5], minute=i // 2) for i in range(23)]
+    docs.append(hit("Parking elsewhere", score=5.0, user_id="user-2"))
+    expected = sorted((doc for doc in docs if doc["user_id"] == "user-1"),
+                      key=lambda doc: (doc["score"], doc["timestamp"], doc["_id"]), reverse=True)
+    seen, cursor, pages = [], None, 0
+    while True:
+        result, _ = await run_search(docs, "parking", user_id="user-1", limit=4, after=cursor)
+        seen += [r["conversation_id"] for r in result["results"]]
+        pages += 1
+        cursor = result["next_cursor"]
+        if not cursor:
+            break
+    assert seen == [doc["conversation_id"] for doc in expected] and pages == 6
+    print("✅ Paged through every hit once")
+
+
+async def test_matched_field():
+    """Snippets come from the message first, then the response; excluded and stemmed terms fall back"""
+    print("\n🧪 Testing Matched Field...")
+    hits = [hit("Do you allow pets?", "Yes, cats and dogs are welcome.", score=3.0),
+            hit("Is there a studio?", "We have lofts only.", score=2.0),
+            hit("Any apartments downtown?", "Several.", score=1.0)]
+    result, _ = await run_search(hits, "dogs -studio apartment", user_id="user-1")
+    fields = [(r["matched_field"], r["snippet"]) for r in result["results"]]
+    assert fields[0] == ("response", "Yes, cats and dogs are welcome.")
+    # "-studio" is an exclusion, never a snippet term
+    assert fields[1] == (None, "Is there a studio?")
+    assert fields[2] == ("message", "Any apartments downtown?")
+    print("✅ Matched fields reported")
+
+
+if __name__ == "__main__":
+    test_snippet()
+
+    async def main():
+        await test_query_filters_and_paging()
+        await test_cursor_paging()
+        await test_matched_field()
+
+    asyncio.run(main())
+    print("\n🎉 All search tests passed!")
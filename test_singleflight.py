@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test script for request coalescing (SingleFlight)
+"""
+
+import asyncio
+from app.utils.singleflight import SingleFlight, normalize_key
+
+
+async def test_concurrent_calls_coalesce():
+    """Concurrent calls for one key run the work once and each get their own copy"""
+    print("🧪 Testing Coalescing...")
+    flight = SingleFlight("test_coalesce")
+    runs = []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return {"chunks": ["a", "b"]}
+
+    results = await asyncio.gather(*[flight.do("same", work) for _ in range(5)], flight.do("other", work))
+    assert len(runs) == 2 and all(result == {"chunks": ["a", "b"]} for result in results)
+    results[0]["chunks"].append("mutated")
+    assert results[1]["chunks"] == ["a", "b"]
+    assert flight.stats()["coalesced"] == 4 and flight.stats()["in_flight"] == 0
+    print("✅ Work shared, results isolated")
+
+
+async def test_errors_and_cancellation():
+    """Errors reach every waiter and aren't cached; a cancelled caller doesn't cancel the others"""
+    print("\n🧪 Testing Errors and Cancellation...")
+    flight = SingleFlight("test_errors", ttl_seconds=60)
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream down")
+
+    results = await asyncio.gather(flight.do("k", failing), flight.do("k", failing), return_exceptions=True)
+    assert len(calls) == 1 and all(isinstance(result, ValueError) for result in results)
+
+    async def slow():
+        await asyncio.sleep(0.02)
+        return [1, 2]
+
+    impatient = asyncio.ensure_future(flight.do("k", slow))
+    patient = asyncio.ensure_future(flight.do("k", slow))
+    await asyncio.sleep(0)
+    impatient.cancel()
+    assert await patient == [1, 2]
+    print("✅ Errors shared, cancellation contained")
+
+
+async def test_reuse_window():
+    """With a TTL, results are reused after completion, still as copies"""
+    print("\n🧪 Testing Reuse Window...")
+    flight = SingleFlight("test_window", ttl_seconds=0.05)
+    runs = []
+
+    async def work():
+        runs.append(1)
+        return [len(runs)]
+
+    first = await flight.do("k", work)
+    first.append("mutated")
+    assert await flight.do("k", work) == [1] and len(runs) == 1
+    await asyncio.sleep(0.06)
+    assert await flight.do("k", work) == [2]
+    assert flight.stats()["reused_within_window"] == 1
+
+    shared = SingleFlight("test_shared", copy_result=None)
+
+    async def classifier():
+        return runs
+
+    assert await shared.do("k", classifier) is runs
+    assert normalize_key("  What IS\tthe   rent? ") == "what is the rent?"
+    print("✅ Window reuse works")
+
+
+if __name__ == "__main__":
+    async def main():
+        await test_concurrent_calls_coalesce()
+        await test_errors_and_cancellation()
+        await test_reuse_window()
+
+    asyncio.run(main())
+    print("\n🎉 All coalescing tests passed!")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Test script for rolling per-session conversation summaries
+"""
+
+import asyncio
+from datetime import datetime
+from bson.objectid import ObjectId
+import app.services.summarizer as summarizer
+from app.services.crm_logic import decode_conversation_cursor, encode_conversation_cursor
+
+USER_ID, SESSION_ID = "user-1", "session-1"
+
+
+class FakeSessions:
+    """Just enough of a Motor collection for one session document"""
+
+    def __init__(self, session=None):
+        self.session = session
+
+    def _matches(self, query):
+        return self.session is not None and all(self.session.get(key) == value for key, value in query.items())
+
+    async def find_one(self, query, projection=None):
+        return dict(self.session) if self._matches(query) else None
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None):
+        if not self._matches(query):
+            self.session = {**query, **update.get("$setOnInsert", {})}
+        for key, amount in update.get("$inc", {}).items():
+            self.session[key] = self.session.get(key, 0) + amount
+        self.session.update(update.get("$set", {}))
+        return dict(self.session)
+
+    async def update_one(self, query, update):
+        if self._matches(query):
+            self.session.update(update["$set"])
+
+
+def turns(start, end):
+    return [{"conversation_id": str(ObjectId()), "timestamp": datetime(2025, 6, 2, 9, i),
+             "message": f"question {i}", "response": f"answer {i}"} for i in range(start, end)]
+
+
+def turn_index(cursor):
+    """Index of the turn a cursor points just past (turns() puts it in the minute)"""
+    return decode_conversation_cursor(cursor)[0].minute if cursor else -1
+
+
+def patch(**values):
+    originals = {name: getattr(summarizer, name) for name in values}
+    for name, value in values.items():
+        setattr(summarizer, name, value)
+    return originals
+
+
+async def test_refresh_every_k_turns():
+    """A refresh is scheduled once K turns have left the raw window, and only one runs per session"""
+    print("🧪 Testing Summary Refresh Scheduling...")
+    refreshes = []
+    release = asyncio.Event()
+
+    async def fake_refresh(user_id, session_id):
+        refreshes.append((user_id, session_id))
+        await release.wait()
+
+    originals = patch(sessions_collection=FakeSessions(), refresh_summary=fake_refresh)
+    try:
+        needed = summarizer.SUMMARY_RAW_TURNS + summarizer.SUMMARY_REFRESH_TURNS
+        for _ in range(needed - 1):
+            await summarizer.record_turn(USER_ID, SESSION_ID)
+        await asyncio.sleep(0)
+        assert refreshes == []
+        # Turns recorded while a refresh is running don't start another one
+        for _ in range(3):
+            await summarizer.record_turn(USER_ID, SESSION_ID)
+        await asyncio.sleep(0)
+        assert refreshes == [(USER_ID, SESSION_ID)]
+        release.set()
+        await asyncio.gather(*summarizer._background_tasks)
+        assert not summarizer._refreshing
+    finally:
+        patch(**originals)
+    print("✅ Refresh scheduled once")
+
+
+async def test_refresh_folds_new_turns():
+    """Turns between the summary and the raw window are folded in; a concurrent refresh wins"""
+    print("\n🧪 Testing Summary Refresh...")
+    sessions = FakeSessions({"user_id": USER_ID, "session_id": SESSION_ID, "turn_count": 10, "summarized_turns": 2,
+                             "summary_cursor": encode_conversation_cursor(turns(1, 2)[0]),
+                             "summary": "Earlier: asked about parking."})
+    requested = []
+
+    async def fake_conversations(user_id, session_id, after=None, limit=0):
+        start = turn_index(after) + 1
+        requested.append((start, limit))
+        return turns(start, start + limit)
+
+    async def fake_summarize(previous, new_turns):
+        return f"{previous} Then {len(new_turns)} more turns."
+
+    originals = patch(sessions_collection=sessions, get_session_conversations=fake_conversations,
+                      _summarize=fake_summarize)
+    try:
+        end = 10 - summarizer.SUMMARY_RAW_TURNS
+        summary = await summarizer.refresh_summary(USER_ID, SESSION_ID)
+        assert requested == [(2, end - 2)]
+        assert summary == f"Earlier: asked about parking. Then {end - 2} more turns."
+        assert sessions.session["summarized_turns"] == end and sessions.session["summary"] == summary
+        assert turn_index(sessions.session["summary_cursor"]) == end - 1
+
+        # Nothing new to fold: the stored summary is returned untouched
+        assert await summarizer.refresh_summary(USER_ID, SESSION_ID) == summary and len(requested) == 1
+
+        # Another refresh moved summarized_turns on while this one ran, so this result is dropped
+        sessions.session.update(turn_count=20, summarized_turns=end)
+
+        async def racing_summarize(previous, new_turns):
+            sessions.session["summarized_turns"] = 15
+            return "stale"
+
+        summarizer._summarize = racing_summarize
+        await summarizer.refresh_summary(USER_ID, SESSION_ID)
+        assert sessions.session["summary"] == summary and sessions.session["summarized_turns"] == 15
+    finally:
+        patch(**originals)
+    print("✅ Summary folded and stale refreshes dropped")
+
+
+async def test_history_context_window():
+    """Prompts get the summary plus the turns after it, capped when refreshes lag"""
+    print("\n🧪 Testing History Context...")
+    sessions = FakeSessions({"user_id": USER_ID, "session_id": SESSION_ID, "turn_count": 9, "summarized_turns": 4,
+                             "summary_cursor": encode_conversation_cursor(turns(3, 4)[0]), "summary": "Summary."})
+    reads = []
+
+    async def fake_conversations(user_id, session_id, after=None, limit=0):
+        reads.append(("after", turn_index(after)))
+        return turns(turn_index(after) + 1, 9)
+
+    async def fake_recent(user_id, limit, session_id=None):
+        reads.append(("recent", limit))
+        return turns(30 - limit, 30)
+
+    originals = patch(sessions_collection=sessions, get_session_conversations=fake_conversations,
+                      get_recent_conversations=fake_recent)
+    try:
+        summary, history = await summarizer.get_history_context(USER_ID, SESSION_ID)
+        assert summary == "Summary." and reads == [("after", 3)] and len(history) == 5
+
+        # Refreshes failing: only the last K + raw turns are sent, not the whole session
+        sessions.session.update(turn_count=30)
+        _, history = await summarizer.get_history_context(USER_ID, SESSION_ID)
+        assert reads[-1] == ("recent", summarizer.SUMMARY_REFRESH_TURNS + summarizer.SUMMARY_RAW_TURNS)
+    finally:
+        patch(**originals)
+    print("✅ History window computed")
+
+
+if __name__ == "__main__":
+    async def main():
+        await test_refresh_every_k_turns()
+        await test_refresh_folds_new_turns()
+        await test_history_context_window()
+
+    asyncio.run(main())
+    print("\n🎉 All summarizer tests passed!")
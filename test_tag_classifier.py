@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Test script for the embedding-centroid tag classifier and re-tagging
+"""
+
+import asyncio
+from types import SimpleNamespace
+import app.services.rag as rag
+import app.services.retagging as retagging
+import app.services.tag_classifier as tag_classifier
+from app.services.tag_classifier import CentroidClassifier, merge_tags
+from app.utils.tagging import TagMatcher
+
+MATCHER = TagMatcher({"billing": ["invoice"], "maintenance": ["leak"], "general": ["thanks"]})
+SEEDS = {
+    "billing": [[1.0, 0.0, 0.0], [0.8, 0.2, 0.0]],
+    "maintenance": [[0.0, 2.0, 0.0]],
+    "empty": []
+}
+
+
+def patch(module, **values):
+    originals = {name: getattr(module, name) for name in values}
+    for name, value in values.items():
+        setattr(module, name, value)
+    return originals
+
+
+def test_centroid_scores():
+    """Each embedding gets the tags whose seed centroid is close enough, with numpy or without"""
+    print("🧪 Testing Centroid Classifier...")
+    embeddings = [[3.0, 0.3, 0.0], [0.0, 0.5, 0.0], [0.0, 0.0, 1.0], [0.0, 0.0, 0.0]]
+    results = []
+    for numpy_available in sorted({tag_classifier.NUMPY_AVAILABLE, False}):
+        originals = patch(tag_classifier, NUMPY_AVAILABLE=numpy_available)
+        try:
+            classifier = CentroidClassifier(SEEDS, threshold=0.9)
+            assert classifier.tags == ["billing", "maintenance"]  # Tags without seeds are dropped
+            results.append(classifier.score_batch(embeddings))
+            assert classifier.classify_batch(embeddings) == [["billing"], ["maintenance"], [], []]
+            assert classifier.score_batch([]) == []
+        finally:
+            patch(tag_classifier, **originals)
+    for result in results:
+        assert [list(scores) for scores in result] == [["billing"], ["maintenance"], [], []]
+        assert abs(result[0]["billing"] - 1.0) < 1e-3 and abs(result[1]["maintenance"] - 1.0) < 1e-3
+    print("✅ Centroids scored the same with and without numpy")
+
+
+async def test_embeddings_batched():
+    """Inputs are sent EMBEDDING_BATCH_SIZE at a time and come back in input order"""
+    print("\n🧪 Testing Batched Embeddings...")
+    requests = []
+
+    async def fake_create_embedding(model, input):
+        requests.append(list(input))
+        data = [SimpleNamespace(index=i, embedding=[float(len(text))]) for i, text in enumerate(input)]
+        return SimpleNamespace(data=list(reversed(data)))  # The API doesn't promise order
+
+    originals = patch(rag, EMBEDDING_BATCH_SIZE=2, create_embedding=fake_create_embedding, llm_available=lambda: True)
+    try:
+        texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+        assert await rag.get_embeddings(texts) == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+        assert requests == [["a", "bb"], ["ccc", "dddd"], ["eeeee"]]
+
+        async def failing(model, input):
+            raise RuntimeError("rate limited")
+
+        rag.create_embedding = failing
+        assert await rag.get_embeddings(texts) is None
+    finally:
+        patch(rag, **originals)
+    print("✅ Embeddings requested in batches")
+
+
+def test_merge_tags():
+    """Union in taxonomy order, unknown tags last, and the default tag yields to real ones"""
+    print("\n🧪 Testing Tag Merging...")
+    originals = patch(tag_classifier, get_tag_matcher=lambda: MATCHER)
+    try:
+        assert merge_tags(["maintenance"], []) == ["maintenance"]
+        assert merge_tags(["maintenance"], ["billing", "maintenance"]) == ["billing", "maintenance"]
+        assert merge_tags(["general"], ["billing"]) == ["billing"]
+        assert merge_tags(["general", "maintenance"], ["zoning"]) == ["maintenance", "general", "zoning"]
+    finally:
+        patch(tag_classifier, **originals)
+    print("✅ Tags merged")
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args):
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        async def iterate():
+            for doc in self.docs:
+                yield doc
+        return iterate()
+
+
+class FakeConversations:
+    def __init__(self, docs):
+        self.docs, self.writes = docs, []
+
+    async def count_documents(self, query):
+        return len(self.docs)
+
+    def find(self, query, projection=None):
+        return FakeCursor([{key: doc[key] for key in doc if key == "_id" or key in projection} for doc in self.docs])
+
+    async def bulk_write(self, operations, ordered=False):
+        self.writes.extend(operations)
+
+
+class FakeCheckpoints:
+    async def find_one(self, query):
+        return None
+
+    async def update_one(self, query, update, upsert=False):
+        pass
+
+    async def delete_one(self, query):
+        pass
+
+
+async def test_retag_keeps_centroid_tags():
+    """Re-tagging recomputes keyword tags but keeps the tags the classifier added at save time"""
+    print("\n🧪 Testing Re-tagging...")
+    conversations = FakeConversations([
+        {"_id": 1, "response": "We fixed the leak", "tags": ["billing", "maintenance"], "centroid_tags": ["billing"]},
+        {"_id": 2, "response": "Your invoice is attached", "tags": ["general"]},
+        {"_id": 3, "response": "Thanks!", "tags": ["billing"], "centroid_tags": ["billing"]}
+    ])
+
+    async def tag_inline(pool, items):
+        return [(conversation_id, MATCHER.tag(text)) for conversation_id, text in items]
+
+    originals = patch(retagging, conversations_collection=conversations, checkpoints_collection=FakeCheckpoints(),
+                      _tag_in_pool=tag_inline, ANALYTICS_ENABLED=False, RETAG_WORKERS=1)
+    classifier_originals = patch(tag_classifier, get_tag_matcher=lambda: MATCHER)
+    try:
+        result = await retagging.retag_conversations()
+    finally:
+        patch(retagging, **originals)
+        patch(tag_classifier, **classifier_originals)
+    assert result["processed"] == 3 and result["updated"] == 1
+    assert [(op._filter, op._doc) for op in conversations.writes] == [({"_id": 2}, {"$set": {"tags": ["billing"]}})]
+    print("✅ Centroid tags survive re-tagging")
+
+
+if __name__ == "__main__":
+    test_centroid_scores()
+    asyncio.run(test_embeddings_batched())
+    test_merge_tags()
+    asyncio.run(test_retag_keeps_centroid_tags())
+    print("\n🎉 All tag classifier tests passed!")
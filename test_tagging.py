@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Test script for response tagging and intent routing
+"""
+
+import json
+import os
+import tempfile
+from app.utils.tagging import TagMatcher, extract_tags_from_response, load_taxonomy, classify_intent
+
+def test_word_boundaries():
+    """Keywords only match whole words"""
+    print("🧪 Testing Tag Word Boundaries...")
+    assert extract_tags_from_response("Let's discuss this lease renewal") == ["general"]
+    assert extract_tags_from_response("There is a new listing") == ["feature"]
+    print("✅ Substrings of longer words are not tagged")
+
+def test_phrases_counts_and_positions():
+    """Phrases match across whitespace and matches report counts and positions"""
+    print("\n🧪 Testing Tag Matches...")
+    matcher = TagMatcher({"billing": ["invoice", "late fee"], "general": ["thank you"]})
+    text = "Thank\nyou! The invoice includes a LATE FEE; see invoice #2."
+    matches = matcher.match(text)
+    assert matches["billing"]["count"] == 3
+    assert matches["general"]["positions"] == [(0, 9)]
+    assert matcher.tag(text) == ["billing", "general"]
+    assert TagMatcher({"billing": ["invoice"]}, default_tag=None).tag("hello") == []
+    print("✅ Counts, positions and taxonomy order are correct")
+
+def test_taxonomy_file():
+    """Taxonomies load from JSON config"""
+    print("\n🧪 Testing Taxonomy Loading...")
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump({"default_tag": "other", "tags": {"leasing": ["lease", "sublease"]}}, f)
+    try:
+        matcher = load_taxonomy(f.name)
+        assert matcher.tag("Is a sublease allowed?") == ["leasing"]
+        assert matcher.tag("Where is the parking?") == ["other"]
+    finally:
+        os.unlink(f.name)
+    print("✅ Taxonomy loaded from file")
+
+def test_intent_classification():
+    """Trivial turns are recognised and real questions are not"""
+    print("\n🧪 Testing Intent Classification...")
+    assert classify_intent("Hi there!") == "greeting"
+    assert classify_intent("thanks so much") == "thanks"
+    assert classify_intent("hi, what's the rent on suite 5?") is None
+    print("✅ Intents classified")
+
+if __name__ == "__main__":
+    test_word_boundaries()
+    test_phrases_counts_and_positions()
+    test_taxonomy_file()
+    test_intent_classification()
+    print("\n🎉 All tagging tests passed!")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test script for the per-user profile and recent history cache
+"""
+
+import asyncio
+import time
+import app.services.crm_logic as crm_logic
+from app.services.crm_logic import UserContextCache
+
+
+def patch(**values):
+    originals = {name: getattr(crm_logic, name) for name in values}
+    for name, value in values.items():
+        setattr(crm_logic, name, value)
+    return originals
+
+
+def test_lru_and_ttl():
+    """The least recently used entry is evicted first and entries expire after the TTL"""
+    print("🧪 Testing LRU Eviction and TTL...")
+    cache = UserContextCache(max_entries=2, ttl_seconds=60)
+    cache.put("a", {"name": "A"}, [])
+    cache.put("b", {"name": "B"}, [])
+    assert cache.get("a") is not None  # "b" is now least recently used
+    cache.put("c", {"name": "C"}, [])
+    assert cache.get("b") is None and cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["entries"] == 2 and cache.stats()["hits"] == 3 and cache.stats()["lookups"] == 4
+
+    short = UserContextCache(max_entries=2, ttl_seconds=0.01)
+    short.put("a", {"name": "A"}, [])
+    time.sleep(0.02)
+    assert short.get("a") is None and short.stats()["entries"] == 0
+    disabled = UserContextCache(max_entries=0, ttl_seconds=60)
+    disabled.put("a", None, [])
+    assert disabled.get("a") is None
+    print("✅ Evicted and expired")
+
+
+def test_writes_during_loads():
+    """A load that raced with a write for the user isn't cached; other users' loads are"""
+    print("\n🧪 Testing Load Races...")
+    cache = UserContextCache(max_entries=10, ttl_seconds=60)
+    cache.begin_load("a")
+    cache.begin_load("b")
+    cache.append_conversation("a", {"message": "new"})
+    assert cache.end_load("a") is False and cache.end_load("b") is True
+
+    cache.begin_load("a")
+    cache.invalidate()  # Reset-all invalidates every in-flight load too
+    assert cache.end_load("a") is False
+    assert cache.end_load("unknown") is False
+    print("✅ Raced loads detected")
+
+
+def test_write_through_and_invalidation():
+    """Saved exchanges are appended to the cached window; profile changes drop the entry"""
+    print("\n🧪 Testing Write-Through...")
+    cache = UserContextCache(max_entries=10, ttl_seconds=60)
+    cache.put("a", {"name": "A"}, [{"message": str(i)} for i in range(crm_logic.USER_CACHE_HISTORY)])
+    cache.append_conversation("a", {"message": "latest"})
+    _, recent = cache.get("a")
+    assert len(recent) == crm_logic.USER_CACHE_HISTORY and recent[0]["message"] == "1"
+    assert recent[-1]["message"] == "latest"
+    cache.append_conversation("uncached", {"message": "ignored"})
+    assert cache.get("uncached") is None
+
+    cache.invalidate("a")
+    assert cache.get("a") is None and cache.stats()["invalidations"] == 1
+    print("✅ Written through and invalidated")
+
+
+class FakeConversations:
+    def __init__(self):
+        self.inserted = []
+
+    async def insert_one(self, doc):
+        self.inserted.append(doc)
+
+
+async def test_user_context_copies():
+    """Hits and misses both hand out copies; a saved exchange shows up on the next hit"""
+    print("\n🧪 Testing User Context...")
+    loads = []
+
+    async def fake_load(user_id):
+        loads.append(user_id)
+        return {"name": "Ann", "preferences": []}, [{"message": "hello", "response": "hi"}]
+
+    conversations = FakeConversations()
+    originals = patch(user_cache=UserContextCache(10, 60), _load_user_context=fake_load,
+                      conversations_collection=conversations, CONVERSATION_WRITE_BEHIND=False,
+                      ANALYTICS_ENABLED=False)
+    try:
+        user, recent = await crm_logic.get_user_context("u1")
+        user["name"], recent[0]["message"] = "mutated", "mutated"
+        recent.append({"message": "extra"})
+        user, recent = await crm_logic.get_user_context("u1")
+        assert loads == ["u1"] and user["name"] == "Ann" and recent == [{"message": "hello", "response": "hi"}]
+        user["name"] = "mutated again"
+        assert (await crm_logic.get_user_context("u1"))[0]["name"] == "Ann"
+
+        await crm_logic.save_conversation("u1", "s1", "Is parking included?", "Yes.", ["general"])
+        _, recent = await crm_logic.get_user_context("u1")
+        assert loads == ["u1"] and [conv["message"] for conv in recent] == ["hello", "Is parking included?"]
+        assert "_id" not in recent[-1] and "user_id" not in recent[-1] and len(conversations.inserted) == 1
+    finally:
+        patch(**originals)
+    print("✅ Callers can't mutate the cache")
+
+
+if __name__ == "__main__":
+    test_lru_and_ttl()
+    test_writes_during_loads()
+    test_write_through_and_invalidation()
+    asyncio.run(test_user_context_copies())
+    print("\n🎉 All user cache tests passed!")
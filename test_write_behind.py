@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Test script for write-behind batching, backpressure and its retry rules
+"""
+
+import asyncio
+from pymongo.errors import AutoReconnect, BulkWriteError
+import app.services.write_behind as write_behind
+from app.services.write_behind import WriteBehindQueue
+
+
+class FlakyCollection:
+    """Fails each bulk_write with the next scripted error, then succeeds"""
+
+    def __init__(self, failures):
+        self.failures = list(failures)
+        self.attempts = []
+
+    async def bulk_write(self, operations, ordered=False):
+        self.attempts.append(list(operations))
+        if self.failures:
+            failure = self.failures.pop(0)
+            raise failure(operations) if callable(failure) else failure
+
+
+def failed_at(*indexes, code=1):
+    return lambda operations: BulkWriteError({"writeErrors": [
+        {"index": index, "code": code, "errmsg": "failed"} for index in indexes
+    ]})
+
+
+class RecordingCollection:
+    """Records each bulk_write; while gate is set, writes wait for it to open"""
+
+    def __init__(self):
+        self.batches = []
+        self.gate = None
+
+    async def bulk_write(self, operations, ordered=False):
+        if self.gate:
+            await self.gate.wait()
+        self.batches.append(list(operations))
+
+
+async def write(queue, operations):
+    for operation in operations:
+        await queue.enqueue(operation)
+    await queue.close()
+
+
+async def test_batches_by_size_and_interval():
+    """Full batches go out at once, a partial one after flush_interval_ms, and close drains the rest"""
+    print("🧪 Testing Write-Behind Batching...")
+    collection = RecordingCollection()
+    queue = WriteBehindQueue("test", collection, flush_interval_ms=200, batch_size=3, max_queue_size=100)
+    for operation in range(7):
+        await queue.enqueue(operation)
+    await asyncio.sleep(0.05)
+    assert collection.batches == [[0, 1, 2], [3, 4, 5]]  # Well before the interval
+    await queue.close()
+    assert collection.batches[-1] == [6] and queue._flusher is None
+
+    collection = RecordingCollection()
+    queue = WriteBehindQueue("test", collection, flush_interval_ms=30, batch_size=100, max_queue_size=100)
+    await queue.enqueue("a")
+    await queue.enqueue("b")
+    await asyncio.sleep(0)
+    assert collection.batches == []
+    await asyncio.sleep(0.1)
+    assert collection.batches == [["a", "b"]]
+    await queue.enqueue("c")
+    await queue.flush()  # Waits for the write but keeps the flusher running
+    assert collection.batches[-1] == ["c"] and not queue._flusher.done()
+    await queue.close()
+    await queue.close()  # Nothing left to stop
+    print("✅ Batched by size and interval")
+
+
+async def test_backpressure_and_stats():
+    """A full queue makes enqueue wait for the flusher; stats report depth, batches and blocked callers"""
+    print("\n🧪 Testing Write-Behind Backpressure...")
+    collection = RecordingCollection()
+    collection.gate = asyncio.Event()
+    queue = WriteBehindQueue("test", collection, flush_interval_ms=10, batch_size=1, max_queue_size=2)
+    assert queue.stats()["queue_depth"] == 0
+    await queue.enqueue("a")
+    await asyncio.sleep(0)  # The flusher takes "a" and waits on the database
+    await queue.enqueue("b")
+    await queue.enqueue("c")
+    blocked = asyncio.create_task(queue.enqueue("d"))
+    await asyncio.sleep(0.05)
+    assert not blocked.done() and queue.stats()["queue_depth"] == 2 and queue.stats()["blocked_enqueues"] == 1
+
+    collection.gate.set()
+    await asyncio.wait_for(blocked, 1)
+    await queue.close()
+    assert collection.batches == [["a"], ["b"], ["c"], ["d"]]
+    assert queue.stats() == {"enqueued": 4, "written": 4, "failed": 0, "batches": 4, "avg_batch_size": 1.0,
+                             "queue_depth": 0, "max_queue_size": 2, "blocked_enqueues": 1}
+    print("✅ Callers wait instead of growing the queue")
+
+
+async def test_only_failed_operations_retried():
+    """Operations the server applied are never sent twice; duplicate keys count as written"""
+    print("\n🧪 Testing Write-Behind Retries...")
+    original_delay, write_behind.RETRY_BASE_DELAY = write_behind.RETRY_BASE_DELAY, 0
+    try:
+        collection = FlakyCollection([failed_at(1, 3), failed_at(0, code=write_behind.DUPLICATE_KEY_ERROR)])
+        queue = WriteBehindQueue("test", collection, flush_interval_ms=10, batch_size=10, max_queue_size=100)
+        await write(queue, ["a", "b", "c", "d"])
+    finally:
+        write_behind.RETRY_BASE_DELAY = original_delay
+    # "b" came back as a duplicate key on the retry: it had landed, so it isn't sent again
+    assert collection.attempts == [["a", "b", "c", "d"], ["b", "d"]]
+    assert queue.stats()["written"] == 4 and queue.stats()["failed"] == 0
+    print("✅ Only failed operations retried")
+
+
+async def test_unknown_outcome_not_retried_when_not_idempotent():
+    """Counter updates are dropped rather than retried when a batch may have been applied"""
+    print("\n🧪 Testing Non-Idempotent Writes...")
+    original_delay, write_behind.RETRY_BASE_DELAY = write_behind.RETRY_BASE_DELAY, 0
+    try:
+        counters = FlakyCollection([AutoReconnect("connection reset")])
+        queue = WriteBehindQueue("counters", counters, flush_interval_ms=10, batch_size=10, max_queue_size=100,
+                                 idempotent=False)
+        await write(queue, ["inc 1", "inc 2"])
+        assert len(counters.attempts) == 1 and queue.stats()["failed"] == 2
+
+        inserts = FlakyCollection([AutoReconnect("connection reset")])
+        queue = WriteBehindQueue("inserts", inserts, flush_interval_ms=10, batch_size=10, max_queue_size=100)
+        await write(queue, ["insert 1", "insert 2"])
+        assert len(inserts.attempts) == 2 and queue.stats()["written"] == 2
+    finally:
+        write_behind.RETRY_BASE_DELAY = original_delay
+    print("✅ Ambiguous failures only retried for idempotent writes")
+
+
+if __name__ == "__main__":
+    async def main():
+        await test_batches_by_size_and_interval()
+        await test_backpressure_and_stats()
+        await test_only_failed_operations_retried()
+        await test_unknown_outcome_not_retried_when_not_idempotent()
+
+    asyncio.run(main())
+    print("\n🎉 All write-behind tests passed!")